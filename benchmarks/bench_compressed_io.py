@@ -0,0 +1,61 @@
+"""压缩cub文件读写的耗时、文件大小和吞吐量
+
+在本地磁盘上测得编解码耗时，再按给定的网络文件系统带宽估算
+(编解码耗时 + 文件大小 / 带宽)，用于判断 I/O 受限的批处理能否从压缩中获益。
+
+用法: python benchmarks/bench_compressed_io.py [格点数 n，默认 100] [带宽 MB/s，默认 100]
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    bandwidth = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+
+    # 模拟掩膜后的势能：球壳外全为 0
+    rng = np.random.default_rng(0)
+    x = np.arange(n) - n / 2
+    r = np.sqrt(x[:, None, None] ** 2 + x[None, :, None] ** 2 + x[None, None, :] ** 2)
+    data = np.where(np.abs(r - n / 4) < 3, rng.standard_normal((n, n, n)) * 1e-2, 0.0)
+    template = {
+        'comment1': 'masked potential',
+        'comment2': 'benchmark',
+        'origin': np.zeros(3),
+        'grid_info': [(n, np.eye(3)[i] * 0.2) for i in range(3)],
+        'atoms': [{'atomic_number': 6, 'charge': 6.0, 'coords': np.zeros(3)}],
+    }
+
+    formats = [('.cub', None), ('.cub.gz', 1), ('.cub.gz', 6), ('.cube.xz', 1)]
+    if importlib.util.find_spec('zstandard') is not None:
+        formats += [('.cube.zst', 3), ('.cube.zst', 10)]
+
+    processor = CubeFileInterpolator()
+    print(f"网格: {n}^3, 假定带宽: {bandwidth:.0f} MB/s")
+    print(f"{'格式':>10s} {'级别':>4s} {'大小MB':>8s} {'写s':>7s} {'读s':>7s} {'估算写s':>8s} {'估算读s':>8s}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for suffix, level in formats:
+            filename = os.path.join(tmpdir, 'bench' + suffix)
+            start = time.perf_counter()
+            processor.write_cube_file(data, filename, template, compresslevel=level)
+            write_time = time.perf_counter() - start
+            start = time.perf_counter()
+            processor.read_cube_file(filename)
+            read_time = time.perf_counter() - start
+
+            size = os.path.getsize(filename) / 1e6
+            transfer = size / bandwidth
+            print(f"{suffix:>10s} {str(level):>4s} {size:8.1f} {write_time:7.2f} {read_time:7.2f} "
+                  f"{write_time + transfer:8.2f} {read_time + transfer:8.2f}")
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
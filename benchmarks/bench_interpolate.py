@@ -0,0 +1,47 @@
+"""对比 interpolate_potential_to_density_grid 两种插值引擎的耗时和峰值内存
+
+用法: python benchmarks/bench_interpolate.py [目标格点数 n，生成 n^3 密度网格，默认 128]
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+
+
+def make_grid(n, spacing, data):
+    return {
+        'origin': np.full(3, -n * spacing / 2),
+        'grid_info': [(n, np.eye(3)[i] * spacing) for i in range(3)],
+        'data': data,
+        'shape': (n, n, n),
+    }
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    m = n * 2 // 3
+    rng = np.random.default_rng(0)
+    processor = CubeFileInterpolator()
+    processor.density_data = make_grid(n, 0.2, None)
+    processor.potential_data = make_grid(m, 0.3, rng.standard_normal((m, m, m)))
+
+    print(f"势能网格: {m}^3 -> 密度网格: {n}^3")
+    results = {}
+    for engine in ('scipy', 'trilinear'):
+        tracemalloc.start()
+        start = time.perf_counter()
+        results[engine] = processor.interpolate_potential_to_density_grid(engine=engine)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{engine:>10s}: {elapsed:.3f} s, 峰值内存 {peak / 1e6:.1f} MB")
+
+    diff = np.max(np.abs(results['scipy'] - results['trilinear']))
+    print(f"最大偏差: {diff:.3e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""对比 create_isosurface_mask 两种构建方法在不同搜索半径下的耗时
+
+用法: python benchmarks/bench_mask.py [格点数 n，生成 n^3 网格，默认 128]
+"""
+import sys
+import time
+
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    spacing = 0.56
+    x = (np.arange(n) - n / 2) * spacing
+    r = np.sqrt(x[:, None, None] ** 2 + x[None, :, None] ** 2 + x[None, None, :] ** 2)
+
+    processor = CubeFileInterpolator()
+    processor.density_data = {
+        'data': 0.001 * np.exp(n * spacing / 4 - r),
+        'grid_info': [(n, np.eye(3)[i] * spacing) for i in range(3)],
+    }
+
+    # 预热，排除 scipy.ndimage 首次导入的耗时
+    processor.create_isosurface_mask(0.3, method='edt')
+    processor.create_isosurface_mask(0.3, method='dilation')
+
+    print(f"网格: {n}^3, 步长: {spacing}")
+    print(f"{'半径':>6s} {'dilation':>10s} {'edt':>10s} {'edt shell':>10s}")
+    for radius in (0.3, 1.0, 2.0, 3.0):
+        timings = []
+        for method, mode in (('dilation', 'filled'), ('edt', 'filled'), ('edt', 'shell')):
+            start = time.perf_counter()
+            processor.create_isosurface_mask(radius, mode=mode, method=method)
+            timings.append(time.perf_counter() - start)
+        print(f"{radius:6.1f} " + " ".join(f"{t:9.3f}s" for t in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""对比 read_cube_file 各解析引擎的耗时
+
+用法: python benchmarks/bench_read_cube.py [格点数 n，生成 n^3 网格，默认 100] [并行进程数...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+
+
+def write_synthetic_cube(filename, n):
+    """写出一个 n^3 的高斯团密度cub文件"""
+    processor = CubeFileInterpolator()
+    x = np.linspace(-4.0, 4.0, n)
+    xx, yy, zz = np.meshgrid(x, x, x, indexing='ij')
+    data = np.exp(-(xx ** 2 + yy ** 2 + zz ** 2))
+    step = x[1] - x[0]
+    template = {
+        'comment1': 'synthetic density',
+        'comment2': 'benchmark',
+        'origin': np.array([-4.0, -4.0, -4.0]),
+        'grid_info': [
+            (n, np.array([step, 0.0, 0.0])),
+            (n, np.array([0.0, step, 0.0])),
+            (n, np.array([0.0, 0.0, step])),
+        ],
+        'atoms': [{'atomic_number': 6, 'charge': 6.0, 'coords': np.zeros(3)}],
+    }
+    processor.write_cube_file(data, filename, template)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    processor = CubeFileInterpolator()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'bench.cub')
+        write_synthetic_cube(filename, n)
+        print(f"网格: {n}^3, 文件大小: {os.path.getsize(filename) / 1e6:.1f} MB")
+
+        timings = {}
+        for engine in ('python', 'numpy'):
+            start = time.perf_counter()
+            processor.read_cube_file(filename, engine=engine)
+            timings[engine] = time.perf_counter() - start
+            print(f"{engine:>8s}: {timings[engine]:.3f} s")
+
+        print(f"加速比: {timings['python'] / timings['numpy']:.1f}x")
+
+        for workers in [int(w) for w in sys.argv[2:]] or [2, 4, 8]:
+            start = time.perf_counter()
+            processor.read_cube_file(filename, engine='parallel', workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"parallel x{workers}: {elapsed:.3f} s, "
+                  f"相对 numpy {timings['numpy'] / elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""对比 write_cube_file 两种写出引擎的耗时
+
+用法: python benchmarks/bench_write_cube.py [格点数 n，生成 n^3 网格，默认 100]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    processor = CubeFileInterpolator()
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((n, n, n)) * 1e-2
+    template = {
+        'comment1': 'synthetic potential',
+        'comment2': 'benchmark',
+        'origin': np.zeros(3),
+        'grid_info': [(n, np.eye(3)[i] * 0.2) for i in range(3)],
+        'atoms': [{'atomic_number': 6, 'charge': 6.0, 'coords': np.zeros(3)}],
+    }
+
+    # 模拟掩膜后的势能：只保留中心球壳附近的值
+    x = np.arange(n) - n / 2
+    r = np.sqrt(x[:, None, None] ** 2 + x[None, :, None] ** 2 + x[None, None, :] ** 2)
+    masked = np.where(np.abs(r - n / 4) < 2, data, 0.0)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for label, values in (('稠密数据', data), ('掩膜数据', masked)):
+            timings = {}
+            for engine in ('python', 'numpy'):
+                filename = os.path.join(tmpdir, f'{engine}.cub')
+                start = time.perf_counter()
+                processor.write_cube_file(values, filename, template, engine=engine)
+                timings[engine] = time.perf_counter() - start
+
+            print(f"{label}, 网格: {n}^3")
+            for engine, elapsed in timings.items():
+                print(f"{engine:>8s}: {elapsed:.3f} s")
+            print(f"加速比: {timings['python'] / timings['numpy']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,15 @@ setup(
     packages=find_packages(where="src"),
     package_dir={"": "src"},
     install_requires=[],  # 没有额外依赖
-    python_requires='>=3.6',  # 指定Python版本
+    extras_require={
+        'zstd': ['zstandard'],  # 读写 .zst 压缩的cub文件
+        'thumbnail': ['scikit-image'],  # 缩略图使用 marching cubes 提取等值面
+        'surface': ['scikit-image'],  # 表面模式提取等值面网格
+    },
+    python_requires='>=3.9',  # 指定Python版本
     entry_points={
         'console_scripts': [
-            'multiwfn-vesta=multiwfn_vesta.main:main',
+            'multiwfn-vesta=multiwfn2vesta.main:main',
         ],
     },
 )
\ No newline at end of file
@@ -1,45 +1,75 @@
+import asyncio
+import gzip
 import subprocess
 import os
 import logging
 import glob
+import queue
 import shutil
+import threading
+import time
+
+from multiwfn2vesta.cub import clip_cube_file
+from multiwfn2vesta.instrumentation import Instrumentation, peak_rss_mb
+from multiwfn2vesta.manifest import MANIFEST_FILE, BuildManifest, multiwfn_version
+from multiwfn2vesta.scheduler import MultiwfnJob, MultiwfnScheduler
+
+# 异步运行器每个任务日志的大小上限
+MULTIWFN_LOG_MAX_BYTES = 10 << 20
+# 异步运行器每次从管道读取的字节数
+MULTIWFN_LOG_CHUNK_SIZE = 1 << 16
+# Multiwfn 主菜单标题，常驻会话据此判断波函数载入完成、任务回到主菜单
+MULTIWFN_MAIN_MENU = "Main function menu"
+# 让 Fortran 运行库在输出到管道时不缓冲，否则主菜单要等进程退出才出现
+MULTIWFN_UNBUFFERED_ENV = {"GFORTRAN_UNBUFFERED_PRECONNECTED": "y", "FORT_BUFFERED": "false"}
 
 class MultiwfnRunner:
-    """Multiwfn 运行器"""
+    """Multiwfn 运行器
+    
+    每次运行 Multiwfn 的耗时、输出字节数、返回码和子进程内存峰值
+    作为 multiwfn 阶段记录到 instrumentation，见 Instrumentation。
+    """
     
-    def __init__(self, multiwfn_path="Multiwfn"):
+    def __init__(self, multiwfn_path="Multiwfn", instrumentation=None):
         self.multiwfn_path = multiwfn_path
-        os.environ['MULTIWFNPATH'] = os.path.dirname(shutil.which('Multiwfn'))
+        self.instrumentation = instrumentation or Instrumentation()
+        _set_multiwfn_path(multiwfn_path)
     
-    def run_commands(self, input_file, commands, nproc=1):
+    def run_commands(self, input_file, commands, nproc=1, cwd=None):
         """
         运行 Multiwfn 并输入命令
         
         Args:
             input_file: 输入文件路径
             commands: 命令列表，如 ["5", "1", "10", "0"]
+            cwd: 工作目录，None 表示当前目录；Multiwfn_out.log 也写在该目录下
         
         Returns:
-            bool: 是否成功执行
+            int: Multiwfn 的返回码，0 表示成功
         """
-        # 构建命令行参数
-        cmd_args = [self.multiwfn_path, input_file]
-        if nproc > 1:
-            cmd_args.extend(["-nt", str(nproc)])
+        cmd_args = _build_args(self.multiwfn_path, input_file, nproc)
 
         # 构建完整的输入文本（自动添加退出命令）
         input_text = "\n".join(commands + ["q"])
         
         # 执行 Multiwfn
-        result = subprocess.run(
-            cmd_args,
-            input=input_text,
-            capture_output=True,
-            text=True,
-            timeout=None
-        )
+        with self.instrumentation.stage("multiwfn", file=input_file, cwd=cwd, nproc=nproc,
+                                        commands=len(commands)) as record:
+            result = subprocess.run(
+                cmd_args,
+                input=input_text,
+                capture_output=True,
+                text=True,
+                timeout=None,
+                cwd=cwd
+            )
+            record["returncode"] = result.returncode
+            record["stdout_bytes"] = len(result.stdout.encode())
+            record["stderr_bytes"] = len(result.stderr.encode())
+            # 已结束的子进程中最大的常驻内存；并行运行时不一定是本次的进程
+            record["child_peak_rss_mb"] = peak_rss_mb(children=True)
         
-        with open("Multiwfn_out.log", "a", encoding="utf-8") as f:
+        with open(os.path.join(cwd or ".", "Multiwfn_out.log"), "a", encoding="utf-8") as f:
             f.write(f"\n=== Multiwfn 执行结果 ===\n")
             f.write(f"命令: {' '.join(cmd_args)}\n")
             f.write(f"返回码: {result.returncode}\n")
@@ -48,13 +78,325 @@ class MultiwfnRunner:
             if result.stderr:
                 f.write(f"错误:\n{result.stderr}\n")
         
-        return 0
+        return result.returncode
+    
+    def session(self, input_file, nproc=1, cwd=None, timeout=None):
+        """启动一个常驻的 Multiwfn 会话，见 MultiwfnSession"""
+        return MultiwfnSession(input_file, self.multiwfn_path, nproc=nproc, cwd=cwd,
+                               timeout=timeout, instrumentation=self.instrumentation)
+
+class MultiwfnSession:
+    """常驻的 Multiwfn 进程：波函数只载入一次，依次执行多个菜单脚本
+    
+    每个任务的命令都必须以回到主菜单结束，输出中出现主菜单标题
+    （MULTIWFN_MAIN_MENU）即认为任务完成。同一分子计算 IRI、ESP、密度等
+    多个格点函数时，省去每次重新启动 Multiwfn 和载入波函数的时间。
+    载入和每个任务分别作为 multiwfn_load、multiwfn_task 阶段记录到 instrumentation。
+    
+    用法:
+        with MultiwfnRunner().session("mol.fchk") as session:
+            session.run(["5", "1", "2", "0"])
+            session.run(["20", "4", "2", "0", "0"])
+    """
+    
+    def __init__(self, input_file, multiwfn_path="Multiwfn", nproc=1, cwd=None,
+                 marker=MULTIWFN_MAIN_MENU, timeout=None, instrumentation=None):
+        """
+        Args:
+            input_file: 输入文件路径
+            multiwfn_path: Multiwfn 可执行文件
+            nproc: Multiwfn 的 -nt 线程数
+            cwd: 工作目录，None 表示当前目录
+            marker: 主菜单标记
+            timeout: 等待波函数载入的超时秒数，超时后结束进程并抛出 subprocess.TimeoutExpired
+            instrumentation: 运行记录，见 Instrumentation
+        """
+        self.input_file = input_file
+        self.marker = marker
+        self.instrumentation = instrumentation or Instrumentation()
+        self.args = _build_args(multiwfn_path, input_file, nproc)
+        self._buffer = bytearray()
+        self._chunks = queue.Queue()
+        self._eof = False
+        _set_multiwfn_path(multiwfn_path)
+        
+        with self.instrumentation.stage("multiwfn_load", file=input_file, cwd=cwd,
+                                        nproc=nproc) as record:
+            self._proc = subprocess.Popen(
+                self.args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                cwd=cwd,
+                env=dict(os.environ, **MULTIWFN_UNBUFFERED_ENV),
+                bufsize=0
+            )
+            # 后台线程持续读取输出，主线程按标记切分，不会因管道写满而卡住
+            self._reader = threading.Thread(target=self._read_stdout, daemon=True)
+            self._reader.start()
+            self.load_output = self._wait_for(marker, 1, timeout).decode(errors="replace")
+            record["stdout_bytes"] = len(self.load_output.encode())
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    @property
+    def alive(self):
+        return self._proc.poll() is None
+    
+    def run(self, commands, marker=None, count=1, timeout=None):
+        """
+        执行一个菜单脚本，等到输出中第 count 次出现 marker 后返回
+        
+        Args:
+            commands: 命令列表，最后要回到主菜单，如 ["5", "1", "2", "0"]
+            marker: 任务完成标记，默认为主菜单标记
+            count: 脚本中途经过主菜单时，需要等待的标记次数
+            timeout: 超时秒数，超时后结束进程并抛出 subprocess.TimeoutExpired
+        
+        Returns:
+            str: 本任务的输出
+        
+        Raises:
+            RuntimeError: Multiwfn 在任务完成前退出
+        """
+        if self._eof or not self.alive:
+            raise RuntimeError(f"Multiwfn 会话已结束: {self.input_file}")
+        
+        with self.instrumentation.stage("multiwfn_task", file=self.input_file,
+                                        commands=len(commands)) as record:
+            try:
+                self._proc.stdin.write(("\n".join(commands) + "\n").encode())
+            except (BrokenPipeError, ConnectionResetError):
+                # 进程已退出，下面读到输出结束时报错
+                pass
+            output = self._wait_for(marker or self.marker, count, timeout)
+            record["stdout_bytes"] = len(output)
+        return output.decode(errors="replace")
+    
+    def close(self, timeout=10):
+        """发送 q 退出 Multiwfn，超时后结束进程；返回返回码"""
+        if self.alive:
+            try:
+                self._proc.stdin.write(b"q\n")
+                self._proc.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            try:
+                self._proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+        returncode = self._proc.wait()
+        self._reader.join()
+        self._proc.stdout.close()
+        return returncode
+    
+    def _read_stdout(self):
+        while True:
+            chunk = self._proc.stdout.read(MULTIWFN_LOG_CHUNK_SIZE)
+            self._chunks.put(chunk)
+            if not chunk:
+                break
+    
+    def _wait_for(self, marker, count, timeout):
+        """读取输出直到第 count 次出现 marker，返回到该标记为止的输出"""
+        marker = marker.encode()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        found = 0
+        position = 0
+        while True:
+            index = self._buffer.find(marker, position)
+            if index >= 0:
+                found += 1
+                position = index + len(marker)
+                if found == count:
+                    # 标记之后的菜单内容留给下一个任务
+                    output = bytes(self._buffer[:position])
+                    del self._buffer[:position]
+                    return output
+                continue
+            # 下次只在新内容里查找，保留可能被切开的标记开头
+            position = max(position, len(self._buffer) - len(marker) + 1)
+            
+            if self._eof:
+                raise RuntimeError(f"Multiwfn 已退出（返回码 {self._proc.wait()}），"
+                                   f"未等到 {marker.decode()}")
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                chunk = self._chunks.get(timeout=remaining)
+            except queue.Empty:
+                self._proc.kill()
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            if chunk:
+                self._buffer += chunk
+            else:
+                self._eof = True
+
+class AsyncMultiwfnRunner:
+    """基于 asyncio 的 Multiwfn 运行器
+    
+    stdout/stderr 边读边写入每个任务自己的日志文件，日志超过 max_log_bytes
+    后只继续读取、不再写入；日志文件名以 .gz 结尾时压缩写出。
+    一个事件循环中可以同时 await 多个 Multiwfn 进程，max_concurrent
+    限制同时运行的进程数（None 表示不限制）。
+    """
+    
+    def __init__(self, multiwfn_path="Multiwfn", max_concurrent=None,
+                 max_log_bytes=MULTIWFN_LOG_MAX_BYTES):
+        self.multiwfn_path = multiwfn_path
+        self.max_log_bytes = max_log_bytes
+        self._semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent else None
+        _set_multiwfn_path(multiwfn_path)
+    
+    async def run_commands(self, input_file, commands, nproc=1, cwd=None,
+                           log_file=None, timeout=None):
+        """
+        运行 Multiwfn 并输入命令
+        
+        Args:
+            input_file: 输入文件路径
+            commands: 命令列表，如 ["5", "1", "10", "0"]
+            cwd: 工作目录，None 表示当前目录
+            log_file: 日志文件路径（相对路径相对于 cwd），
+                默认为 {输入文件名}.multiwfn.log
+            timeout: 超时秒数，超时后结束进程并抛出 subprocess.TimeoutExpired
+        
+        Returns:
+            int: Multiwfn 的返回码，0 表示成功
+        """
+        if self._semaphore is None:
+            return await self._run(input_file, commands, nproc, cwd, log_file, timeout)
+        async with self._semaphore:
+            return await self._run(input_file, commands, nproc, cwd, log_file, timeout)
+    
+    async def _run(self, input_file, commands, nproc, cwd, log_file, timeout):
+        cmd_args = _build_args(self.multiwfn_path, input_file, nproc)
+        input_text = "\n".join(commands + ["q"])
+        if log_file is None:
+            log_file = f"{os.path.basename(input_file)}.multiwfn.log"
+        log_path = os.path.join(cwd or ".", log_file)
+        
+        with _BoundedLog(log_path, self.max_log_bytes) as log:
+            log.write(f"=== Multiwfn 执行结果 ===\n命令: {' '.join(cmd_args)}\n".encode())
+            
+            proc = await asyncio.create_subprocess_exec(
+                *cmd_args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd
+            )
+            
+            try:
+                returncode = await asyncio.wait_for(
+                    self._communicate(proc, input_text, log), timeout
+                )
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                log.write(f"\n超时: {timeout} 秒后结束进程\n".encode(), force=True)
+                raise subprocess.TimeoutExpired(cmd_args, timeout)
+            
+            log.write(f"\n返回码: {returncode}\n".encode(), force=True)
+        
+        return returncode
+    
+    async def _communicate(self, proc, input_text, log):
+        """写入命令并同时读取 stdout 和 stderr，直到进程结束"""
+        try:
+            proc.stdin.write(input_text.encode())
+            await proc.stdin.drain()
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # Multiwfn 在读完全部命令前就退出了
+            pass
+        
+        await asyncio.gather(
+            self._pump(proc.stdout, log, b""),
+            self._pump(proc.stderr, log, b"[stderr] ")
+        )
+        return await proc.wait()
+    
+    async def _pump(self, stream, log, prefix):
+        while True:
+            chunk = await stream.read(MULTIWFN_LOG_CHUNK_SIZE)
+            if not chunk:
+                break
+            log.write(prefix + chunk if prefix else chunk)
+
+class _BoundedLog:
+    """只写入前 max_bytes 字节的日志文件，之后的内容被丢弃"""
+    
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.truncated = False
+        self._file = None
+    
+    def __enter__(self):
+        if self.path.endswith(".gz"):
+            self._file = gzip.open(self.path, "wb")
+        else:
+            self._file = open(self.path, "wb")
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._file.close()
+    
+    def write(self, data, force=False):
+        """写入日志；force=True 时无视大小上限（用于返回码等结尾信息）"""
+        if force:
+            self._file.write(data)
+            return
+        if self.truncated:
+            return
+        remaining = self.max_bytes - self.written
+        if len(data) > remaining:
+            self._file.write(data[:remaining])
+            self._file.write(f"\n... 日志超过 {self.max_bytes} 字节，其余输出已省略\n".encode())
+            self.written = self.max_bytes
+            self.truncated = True
+        else:
+            self._file.write(data)
+            self.written += len(data)
+
+def _set_multiwfn_path(multiwfn_path):
+    """设置 MULTIWFNPATH 环境变量为 Multiwfn 可执行文件所在目录"""
+    path = shutil.which(multiwfn_path)
+    if path:
+        os.environ['MULTIWFNPATH'] = os.path.dirname(path)
+
+def _build_args(multiwfn_path, input_file, nproc):
+    """构建命令行参数"""
+    cmd_args = [multiwfn_path, input_file]
+    if nproc > 1:
+        cmd_args.extend(["-nt", str(nproc)])
+    return cmd_args
 
 def get_file_basename(filename):
     """获取文件名（最后一个点之前的部分）"""
     return filename.rsplit('.', 1)[0]
 
-def IRI():
+def IRI(max_jobs=1, total_cores=1, scratch_root=None, incremental=True,
+        manifest_file=MANIFEST_FILE, postprocess="numpy"):
+    """
+    批量计算当前目录下所有波函数文件的 IRI 格点数据
+    
+    每个文件在独立的临时目录中运行，结果原子地移动回当前目录。
+    
+    Args:
+        max_jobs: 同时运行的任务数
+        total_cores: 总核心数，平均分给各任务作为 Multiwfn 的 -nt 线程数
+        scratch_root: 临时目录所在的位置，None 表示系统默认临时目录
+        incremental: 是否跳过输入、命令和 Multiwfn 版本都未变且输出完好的文件
+        manifest_file: 增量计算使用的构建清单文件
+        postprocess: "numpy" 在进程内截断 func1.cub，见 IRIPostProcess；
+            "multiwfn" 使用原先的第二次 Multiwfn 调用
+    """
     Multiwfn = MultiwfnRunner()
     # 设置日志
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -70,77 +412,128 @@ def IRI():
     
     logging.info(f"找到 {len(wavefunction_files)} 个波函数文件")
     
-    for inf in wavefunction_files:
+    jobs = [iri_job(inf, postprocess) for inf in wavefunction_files]
+    
+    on_complete = None
+    if incremental:
+        manifest = BuildManifest(manifest_file)
+        version = multiwfn_version(Multiwfn.multiwfn_path)
+        keys = {job.name: manifest.job_key(job, version) for job in jobs}
+        
+        pending = [job for job in jobs if not manifest.is_up_to_date(job, keys[job.name])]
+        if len(pending) < len(jobs):
+            logging.info(f"跳过 {len(jobs) - len(pending)} 个已是最新的文件")
+        jobs = pending
+        
+        def on_complete(job, ok):
+            if ok:
+                manifest.record(job, keys[job.name])
+            else:
+                manifest.forget(job)
+    
+    scheduler = MultiwfnScheduler(Multiwfn, total_cores=total_cores, max_jobs=max_jobs,
+                                  scratch_root=scratch_root)
+    results = scheduler.run(jobs, on_complete=on_complete)
+    
+    for inf, ok in results.items():
         basename = get_file_basename(inf)
-        logging.info(f"正在处理: {inf}")
-        
-        # 第一步：产生 func1.cub 和 func2.cub
-        commands_step1 = [
-            "20",  
-            "4",   
-            "4",   
-            "0.13",
-            "3",   
-            "2",   
-            "0",   
-            "0",
-            "q"    
-        ]
-        
-        if Multiwfn.run_commands(inf, commands_step1):
-            logging.error(f"第一步处理失败: {inf}")
-            continue
-        
-        # 第二步：处理 func1.cub 来等效满足 midpoint 颜色要求并处理上下限
-        commands_step2 = [
-            "13",
-            "11",
-            "13",
-            "11",
-            "7",
-            "3",
-            "11",
-            "2",
-            "func1.cub",
-            "11",
-            "5",
-            "1.5",
-            "15",
-            "-0.1000000E+99,-0.04",
-            "-0.04",
-            "15",
-            "0.04,0.1000000E+99",
-            "0.04",
-            "0",
-            f"{basename}_IRI1.cub", 
-            "-1",  
-            "q"    
-        ]
-        
-        if Multiwfn.run_commands("func1.cub", commands_step2):
-            logging.error(f"第二步处理失败: {inf}")
-            # 继续处理，但记录错误
-        
-        # 清理和重命名文件
-        try:
-            # 删除 func1.cub
-            if os.path.exists("func1.cub"):
-                os.remove("func1.cub")
-            
-            # 重命名 output.txt（强制覆盖）
-            if os.path.exists("output.txt"):
-                shutil.move("output.txt", f"{basename}_output.txt")
-
-            # 重命名 func2.cub（强制覆盖）
-            if os.path.exists("func2.cub"):
-                shutil.move("func2.cub", f"{basename}_IRI2.cub")
-                
+        if ok:
             logging.info(f"完成处理: {inf} -> {basename}_IRI1.cub, {basename}_IRI2.cub")
-            
-        except OSError as e:
-            logging.error(f"文件操作失败: {e}")
+        else:
+            logging.error(f"处理失败: {inf}")
     
     logging.info("所有文件处理完成")
 
+def iri_job(inf, postprocess="numpy"):
+    """构建单个波函数文件的 IRI 任务"""
+    if postprocess not in ("numpy", "multiwfn"):
+        raise ValueError(f"未知的后处理方式: {postprocess}")
+    basename = get_file_basename(inf)
+    iri1_name = f"{os.path.basename(basename)}_IRI1.cub"
+    outputs = {
+        # 临时目录中的文件名 -> 目标路径（强制覆盖）；func1.cub 随临时目录一起删除
+        iri1_name: f"{basename}_IRI1.cub",
+        "output.txt": f"{basename}_output.txt",
+        "func2.cub": f"{basename}_IRI2.cub",
+    }
+    
+    # 第一步：产生 func1.cub 和 func2.cub
+    commands_step1 = [
+        "20",  
+        "4",   
+        "4",   
+        "0.13",
+        "3",   
+        "2",   
+        "0",   
+        "0",
+        "q"    
+    ]
+    
+    if postprocess == "numpy":
+        return MultiwfnJob(inf, steps=[(None, commands_step1)], outputs=outputs,
+                           postprocess=IRIPostProcess(iri1_name))
+    
+    # 第二步：处理 func1.cub 来等效满足 midpoint 颜色要求并处理上下限
+    commands_step2 = [
+        "13",
+        "11",
+        "13",
+        "11",
+        "7",
+        "3",
+        "11",
+        "2",
+        "func1.cub",
+        "11",
+        "5",
+        "1.5",
+        "15",
+        "-0.1000000E+99,-0.04",
+        "-0.04",
+        "15",
+        "0.04,0.1000000E+99",
+        "0.04",
+        "0",
+        iri1_name, 
+        "-1",  
+        "q"    
+    ]
+    
+    return MultiwfnJob(
+        inf,
+        steps=[(None, commands_step1), ("func1.cub", commands_step2)],
+        outputs=outputs,
+    )
+
+class IRIPostProcess:
+    """在进程内完成 func1.cub 的后处理，代替第二次 Multiwfn 调用
+    
+    把 sign(λ2)ρ 截断到 [-limit, limit]，范围内的格点值不变。
+    """
+    
+    def __init__(self, output_name, limit=0.04, input_name="func1.cub"):
+        self.output_name = output_name
+        self.limit = limit
+        self.input_name = input_name
+    
+    @property
+    def key(self):
+        """参与增量计算的键"""
+        return f"numpy-clip:{self.limit}"
+    
+    def __call__(self, workdir):
+        source = os.path.join(workdir, self.input_name)
+        if not os.path.exists(source):
+            logging.error(f"未找到 {self.input_name}")
+            return False
+        try:
+            clip_cube_file(source, os.path.join(workdir, self.output_name),
+                           -self.limit, self.limit)
+        except (OSError, ValueError, IndexError) as e:
+            logging.error(f"处理 {self.input_name} 失败: {e}")
+            return False
+        return True
+
 if __name__ == "__main__":
     IRI()
\ No newline at end of file
@@ -0,0 +1,3 @@
+from multiwfn2vesta.batch import BatchProcessor
+from multiwfn2vesta.multiwfn_controller import MultiwfnController
+from multiwfn2vesta.vesta_controller import VestaController
@@ -0,0 +1,212 @@
+import contextlib
+import logging
+import os
+import queue
+import threading
+import time
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+from multiwfn2vesta.instrumentation import Instrumentation
+from multiwfn2vesta.vesta_controller import RenderJob, VestaRenderPlanner
+
+# 默认导出的视角：[(图片名后缀, [(轴, 角度), ...]), ...]，旋转是累积的
+DEFAULT_VIEWS = (
+    ('1', []),
+    ('2', [('x', 90)]),
+    ('3', [('y', 90)]),
+)
+# 相邻两个阶段之间的队列长度
+BATCH_QUEUE_SIZE = 2
+# 批处理的各个阶段
+BATCH_STAGES = ('multiwfn', 'postprocess', 'render')
+
+
+class BatchItem:
+    """流水线中的一个输入文件及其各阶段的产物"""
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.basename = os.path.splitext(os.path.basename(input_file))[0]
+        # 格点类型 -> Multiwfn 生成的cub文件
+        self.grids = {}
+        # 送去渲染的cub文件
+        self.render_files = []
+        # 渲染出的图片
+        self.images = []
+        self.error = None
+
+
+class BatchProcessor:
+    """流水线式批处理：Multiwfn 计算格点 -> cub 后处理 -> VESTA 渲染
+
+    三个阶段各有自己的并发数，阶段之间用长度为 queue_size 的有界队列连接，
+    因此 VESTA 渲染第 i 个分子时，Multiwfn 可以在计算第 i+1 个分子，
+    NumPy 后处理在两者之间进行；下游较慢时上游会被队列挡住，不会堆积文件。
+    Multiwfn 阶段的并发数取自 multiwfn.max_jobs（见 MultiwfnController）。
+    渲染阶段由一个线程每次取出队列中积压的所有文件，把它们的渲染任务一起交给
+    VestaRenderPlanner 打包，最多 render_jobs 个 VESTA 进程并行。
+    同时计算了 electron 和 esp 时，后处理把静电势插值到密度网格并应用等密度表面掩膜。
+    每个文件在每个阶段的耗时记录到 instrumentation，整体吞吐量见 stats。
+    """
+
+    def __init__(self, multiwfn, vesta, output_dir="output", grid_types=("electron",),
+                 postprocess_jobs=1, render_jobs=1, queue_size=BATCH_QUEUE_SIZE,
+                 views=DEFAULT_VIEWS, scale=3, instrumentation=None):
+        self.multiwfn = multiwfn
+        self.vesta = vesta
+        self.output_dir = output_dir
+        self.grid_types = tuple(grid_types)
+        self.views = views
+        self.scale = scale
+        self.queue_size = queue_size
+        self.instrumentation = instrumentation or Instrumentation()
+        self.planner = VestaRenderPlanner(vesta.vesta_path, max_parallel=max(1, render_jobs))
+        self.concurrency = {
+            'multiwfn': max(1, multiwfn.max_jobs),
+            'postprocess': max(1, postprocess_jobs),
+            # 渲染的并行由 planner 完成
+            'render': 1,
+        }
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def process_files(self, input_files):
+        """处理所有输入文件，返回 {输入文件: 生成的图片列表}，失败的文件对应 None"""
+        input_files = list(input_files)
+        os.makedirs(self.output_dir, exist_ok=True)
+        busy = dict.fromkeys(BATCH_STAGES, 0.0)
+        results = {}
+        start = time.perf_counter()
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in BATCH_STAGES]
+        threads = []
+        remaining = {}
+        for index, name in enumerate(BATCH_STAGES):
+            remaining[name] = self.concurrency[name]
+            out_queue = queues[index + 1] if index + 1 < len(queues) else None
+            for _ in range(self.concurrency[name]):
+                threads.append(threading.Thread(
+                    target=self._stage_worker,
+                    args=(name, queues[index], out_queue, remaining, busy, results),
+                    daemon=True,
+                ))
+        for thread in threads:
+            thread.start()
+
+        # 第一个队列也是有界的，输入文件按需送入
+        for input_file in input_files:
+            queues[0].put(BatchItem(input_file))
+        for _ in range(self.concurrency[BATCH_STAGES[0]]):
+            queues[0].put(None)
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - start
+        succeeded = sum(1 for images in results.values() if images is not None)
+        self.stats = {
+            'files': len(input_files),
+            'succeeded': succeeded,
+            'elapsed': elapsed,
+            'throughput_per_hour': len(input_files) / elapsed * 3600 if elapsed else 0.0,
+            'busy': busy,
+        }
+        return {input_file: results.get(input_file) for input_file in input_files}
+
+    def _stage_worker(self, name, in_queue, out_queue, remaining, busy, results):
+        stage = getattr(self, f"_{name}")
+        finished = False
+        while not finished:
+            item = in_queue.get()
+            if item is None:
+                break
+            items = [item]
+            if name == 'render':
+                # 一次渲染所有已在排队的文件，VESTA 进程可以跨文件打包
+                items, finished = _drain(in_queue, items)
+            start = time.perf_counter()
+            try:
+                with contextlib.ExitStack() as stack:
+                    for item in items:
+                        stack.enter_context(self.instrumentation.stage(name, file=item.input_file))
+                    stage(items) if name == 'render' else stage(items[0])
+            except Exception as e:
+                for item in items:
+                    item.error = f"{name}: {e}"
+            with self._lock:
+                busy[name] += time.perf_counter() - start
+
+            for item in items:
+                if item.error is not None:
+                    logging.error(f"处理失败 {item.input_file}: {item.error}")
+                    with self._lock:
+                        results[item.input_file] = None
+                elif out_queue is None:
+                    logging.info(f"完成处理: {item.input_file} -> {len(item.images)} 张图片")
+                    with self._lock:
+                        results[item.input_file] = item.images
+                else:
+                    out_queue.put(item)
+
+        # 本阶段最后一个结束的线程通知下一阶段的所有线程
+        with self._lock:
+            remaining[name] -= 1
+            last = remaining[name] == 0
+        if last and out_queue is not None:
+            next_name = BATCH_STAGES[BATCH_STAGES.index(name) + 1]
+            for _ in range(self.concurrency[next_name]):
+                out_queue.put(None)
+
+    def _multiwfn(self, item):
+        grids = self.multiwfn.generate_grids(item.input_file, self.grid_types, self.output_dir)
+        if grids is None:
+            item.error = "Multiwfn 计算格点失败"
+            return
+        item.grids = grids
+
+    def _postprocess(self, item):
+        if 'electron' in item.grids and 'esp' in item.grids:
+            output_file = os.path.join(self.output_dir, f"{item.basename}_esp_masked.cub")
+            processor = CubeFileInterpolator(quiet=True, instrumentation=self.instrumentation)
+            processor.process(item.grids['electron'], item.grids['esp'], output_file)
+            item.render_files = [item.grids['electron'], output_file]
+        else:
+            item.render_files = list(item.grids.values())
+
+    def _render(self, items):
+        """把多个文件的渲染任务交给同一个 planner，再把结果分回各文件"""
+        jobs = {}
+        for item in items:
+            jobs[item] = []
+            for cube_file in item.render_files:
+                base = os.path.splitext(cube_file)[0]
+                views = [(f"{base}_{suffix}.png", rotations) for suffix, rotations in self.views]
+                jobs[item].append(RenderJob(cube_file, views, scale=self.scale))
+
+        rendered = self.planner.run([job for item_jobs in jobs.values() for job in item_jobs])
+        for item, item_jobs in jobs.items():
+            images = [output for job in item_jobs for output in job.outputs]
+            failed = [image for image in images if not rendered[image]]
+            if failed:
+                item.error = f"VESTA 未生成 {', '.join(failed)}"
+            else:
+                item.images = images
+
+
+def _drain(in_queue, items):
+    """取出队列中已有的所有文件，返回 (文件列表, 是否已取到结束标记)"""
+    while True:
+        try:
+            item = in_queue.get_nowait()
+        except queue.Empty:
+            return items, False
+        if item is None:
+            return items, True
+        items.append(item)
+
+
+def format_batch_stats(stats):
+    lines = [f"完成 {stats['succeeded']}/{stats['files']} 个文件，用时 {stats['elapsed']:.1f} s，"
+             f"吞吐量 {stats['throughput_per_hour']:.1f} 个/小时"]
+    for name, seconds in stats['busy'].items():
+        lines.append(f"  {name}: 累计 {seconds:.1f} s")
+    return "\n".join(lines)
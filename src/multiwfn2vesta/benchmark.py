@@ -0,0 +1,254 @@
+"""cub处理流程的基准测试
+
+用合成的高斯团密度和静电势cub文件测量 CubeFileInterpolator 各阶段
+（读取、插值、构建掩膜、应用掩膜、写出）的耗时和内存峰值，把结果保存为
+JSON 基线，之后与基线比较，任一阶段超过阈值即返回非零退出码。
+耗时在不跟踪内存的一遍中测量；内存峰值在另一遍中用 tracemalloc 按阶段测量
+（numpy 数组也在其中），每个阶段开始时清零。
+
+用法:
+    python -m multiwfn2vesta.benchmark --sizes 64 128 --save benchmarks/baseline.json
+    python -m multiwfn2vesta.benchmark --sizes 64 128 --check benchmarks/baseline.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from multiwfn2vesta.cub import CUBE_DTYPES, CubeFileInterpolator
+
+# 各阶段的名称，按执行顺序
+STAGES = ('read', 'interpolate', 'mask', 'apply_mask', 'write')
+# 默认的回归阈值：耗时和内存峰值分别允许超过基线的倍数
+TIME_THRESHOLD = 1.5
+MEMORY_THRESHOLD = 1.25
+# 耗时变化小于该秒数时视为计时噪声，不判为回归
+MIN_TIME_DELTA = 0.05
+
+# 合成密度中每个高斯团的宽度 σ（与cub文件坐标单位相同）
+BLOB_WIDTH = 0.6
+
+# 合成分子中的原子：(坐标, 密度权重, 电荷)
+_ATOMS = (
+    ((0.0, 0.0, 0.0), 1.0, 0.4),
+    ((1.4, 0.0, 0.0), 0.8, -0.3),
+    ((-0.7, 1.2, 0.0), 0.6, -0.1),
+)
+
+
+def synthetic_grid(n, spacing, origin=None):
+    """构造 n^3 规则网格的cub文件头；origin 缺省时网格以原点为中心"""
+    if origin is None:
+        origin = np.full(3, -(n - 1) * spacing / 2)
+    return {
+        'comment1': 'synthetic cube',
+        'comment2': f'{n}^3 grid, spacing {spacing}',
+        'origin': np.asarray(origin, dtype=float),
+        'grid_info': [(n, np.eye(3)[i] * spacing) for i in range(3)],
+        'atoms': [{'atomic_number': 6, 'charge': 6.0, 'coords': np.array(coords)}
+                  for coords, _, _ in _ATOMS],
+        'shape': (n, n, n),
+    }
+
+
+def synthetic_field(grid, kind):
+    """在网格上计算合成的密度（kind='density'）或静电势（kind='esp'）
+
+    密度是以各原子为中心、宽度为 BLOB_WIDTH 的高斯团 w*exp(-r²/2σ²) 的叠加；
+    静电势是高斯电荷团 q*erf(r/σ)/r 的叠加。
+    按 x 切片计算，避免生成完整的坐标数组。
+    """
+    from scipy.special import erf
+
+    n = grid['shape']
+    axes = [grid['origin'][i] + np.arange(n[i]) * grid['grid_info'][i][1][i] for i in range(3)]
+    data = np.zeros(n)
+    for ix, x in enumerate(axes[0]):
+        yy, zz = np.meshgrid(axes[1], axes[2], indexing='ij')
+        for (cx, cy, cz), weight, charge in _ATOMS:
+            r = np.sqrt((x - cx) ** 2 + (yy - cy) ** 2 + (zz - cz) ** 2)
+            if kind == 'density':
+                data[ix] += weight * 0.5 * np.exp(-r ** 2 / (2 * BLOB_WIDTH ** 2))
+            else:
+                safe_r = np.maximum(r, 1e-6)
+                # r -> 0 时 erf(r/σ)/r 的极限为 2/(σ√π)
+                limit = 2 / np.sqrt(np.pi) / 0.5
+                data[ix] += charge * np.where(r > 1e-6, erf(safe_r / 0.5) / safe_r, limit)
+    return data
+
+
+def write_synthetic_case(directory, n, mismatched):
+    """写出一组密度和静电势cub文件，返回 (密度文件, 势能文件)
+
+    mismatched=True 时静电势使用更粗、原点不同的网格，需要插值。
+    """
+    spacing = 12.0 / n
+    density_grid = synthetic_grid(n, spacing)
+    if mismatched:
+        m = max(8, n * 2 // 3)
+        potential_grid = synthetic_grid(m, 13.0 / m)
+    else:
+        potential_grid = density_grid
+
+    processor = CubeFileInterpolator()
+    density_file = os.path.join(directory, 'density.cub')
+    potential_file = os.path.join(directory, 'esp.cub')
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor.write_cube_file(synthetic_field(density_grid, 'density'), density_file, density_grid)
+        processor.write_cube_file(synthetic_field(potential_grid, 'esp'), potential_file, potential_grid)
+    return density_file, potential_file
+
+
+def _run_stages(processor, density_file, potential_file, output_file, mismatched, measure):
+    """依次执行各阶段，每个被测阶段通过 measure(阶段名, 函数, *参数) 调用"""
+    processor.density_data = measure('read', processor.read_cube_file, density_file)
+    processor.potential_data = processor.read_cube_file(potential_file)
+    if mismatched:
+        potential = measure('interpolate', processor.interpolate_potential_to_density_grid)
+    else:
+        potential = processor.potential_data['data']
+    mask = measure('mask', processor.create_isosurface_mask)
+    masked = measure('apply_mask', processor.apply_isosurface_mask, potential, mask)
+    measure('write', processor.write_cube_file, masked, output_file, processor.density_data)
+
+
+def _timer(record):
+    def measure(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        record.setdefault(stage, {})['time'] = time.perf_counter() - start
+        return result
+    return measure
+
+
+def _allocation_tracer(record):
+    def measure(stage, func, *args):
+        tracemalloc.reset_peak()
+        result = func(*args)
+        record.setdefault(stage, {})['peak_alloc_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+        return result
+    return measure
+
+
+def run_case(n, mismatched, dtype='float64'):
+    """测量一组合成cub文件的各阶段耗时和内存，返回 {阶段: 指标}
+
+    tracemalloc 会拖慢内存分配，因此整个流程运行两遍：第一遍不跟踪内存，
+    只计时；第二遍用 tracemalloc 测量各阶段的分配峰值。
+    """
+    # 预先导入，避免把首次导入 scipy 子模块的耗时计入某个阶段
+    import scipy.interpolate  # noqa: F401
+    import scipy.ndimage  # noqa: F401
+
+    record = {}
+    with tempfile.TemporaryDirectory() as directory:
+        density_file, potential_file = write_synthetic_case(directory, n, mismatched)
+        output_file = os.path.join(directory, 'out.cub')
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            _run_stages(CubeFileInterpolator(dtype=dtype), density_file, potential_file,
+                        output_file, mismatched, _timer(record))
+            tracemalloc.start()
+            try:
+                _run_stages(CubeFileInterpolator(dtype=dtype), density_file, potential_file,
+                            output_file, mismatched, _allocation_tracer(record))
+            finally:
+                tracemalloc.stop()
+    return record
+
+
+def _run_case_isolated(args):
+    return run_case(*args)
+
+
+def run_suite(sizes, isolate=True, dtype='float64'):
+    """运行所有规模的匹配/不匹配网格用例，返回 {用例名: {阶段: 指标}}
+
+    isolate=True 时每个用例在独立子进程中运行，使内存峰值互不影响。
+    """
+    cases = [(n, mismatched, dtype) for n in sizes for mismatched in (False, True)]
+    if isolate:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            records = pool.map(_run_case_isolated, cases, chunksize=1)
+    else:
+        records = [run_case(*case) for case in cases]
+    return {case_name(n, mismatched): record
+            for (n, mismatched, _), record in zip(cases, records)}
+
+
+def case_name(n, mismatched):
+    return f"{n}^3-{'mismatched' if mismatched else 'matched'}"
+
+
+def compare(results, baseline, time_threshold=TIME_THRESHOLD,
+            memory_threshold=MEMORY_THRESHOLD):
+    """与基线比较，返回超出阈值的阶段说明列表"""
+    regressions = []
+    for case, record in results.items():
+        for stage, metrics in record.items():
+            reference = baseline.get(case, {}).get(stage)
+            if reference is None:
+                continue
+            if (metrics['time'] > reference['time'] * time_threshold
+                    and metrics['time'] - reference['time'] > MIN_TIME_DELTA):
+                regressions.append(f"{case} {stage}: 耗时 {metrics['time']:.3f}s, "
+                                   f"基线 {reference['time']:.3f}s")
+            if metrics['peak_alloc_mb'] > reference['peak_alloc_mb'] * memory_threshold:
+                regressions.append(f"{case} {stage}: 内存峰值 {metrics['peak_alloc_mb']:.1f}MB, "
+                                   f"基线 {reference['peak_alloc_mb']:.1f}MB")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'用例':<20s} {'阶段':<12s} {'耗时s':>8s} {'内存峰值MB':>10s}")
+    for case, record in results.items():
+        for stage in STAGES:
+            if stage in record:
+                m = record[stage]
+                print(f"{case:<20s} {stage:<12s} {m['time']:8.3f} {m['peak_alloc_mb']:10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='cub处理流程基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 128],
+                        help='密度网格的边长格点数，例如 64 128 256 400')
+    parser.add_argument('--save', help='把结果保存为基线 JSON 文件')
+    parser.add_argument('--check', help='与基线 JSON 文件比较，出现回归时返回 1')
+    parser.add_argument('--time-threshold', type=float, default=TIME_THRESHOLD)
+    parser.add_argument('--memory-threshold', type=float, default=MEMORY_THRESHOLD)
+    parser.add_argument('--no-isolate', action='store_true', help='不为每个用例启动子进程')
+    parser.add_argument('--dtype', default='float64', choices=CUBE_DTYPES, help='格点数据精度')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, isolate=not args.no_isolate, dtype=args.dtype)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"基线已保存: {args.save}")
+
+    if args.check:
+        with open(args.check, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+        if regressions:
+            print("性能回归:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("未发现性能回归")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
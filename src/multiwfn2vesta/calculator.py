@@ -0,0 +1,239 @@
+import contextlib
+import os
+from itertools import islice
+
+import numpy as np
+
+from multiwfn2vesta.cub import (CUBE_READ_CHUNK_SIZE, CUBE_STREAM_SLAB_BYTES,
+                                CubeFileInterpolator, CubeRowWriter, open_cube)
+
+# 判断两个网格相同时原点和步长允许的误差（cub文件头只保留6位小数）
+GRID_TOLERANCE = 1e-5
+
+
+class CubeExpr:
+    """cub 计算器的表达式节点
+
+    对节点做运算只构建表达式图，不读取格点数据，例如
+    where(cube("rho.cub") >= 0.001, cube("esp.cub"), 0).clip(-0.04, 0.04)。
+    构建时根据文件头检查各文件的网格是否一致；evaluate/compute 时
+    沿 x 方向分块读取所有输入文件，每块一次算完整个表达式，
+    中间数组只有一块大小，多步运算也不产生中间cub文件。
+    不支持 == 和 !=，请用 where 或比较运算组合。
+    """
+
+    # 表达式所在网格的文件头（不含数据），只有常数时为 None
+    grid = None
+    # 让 numpy 标量在左侧时也调用本类的反向运算
+    __array_ufunc__ = None
+
+    def __add__(self, other):
+        return _Op(np.add, '({} + {})', self, other)
+
+    def __radd__(self, other):
+        return _Op(np.add, '({} + {})', other, self)
+
+    def __sub__(self, other):
+        return _Op(np.subtract, '({} - {})', self, other)
+
+    def __rsub__(self, other):
+        return _Op(np.subtract, '({} - {})', other, self)
+
+    def __mul__(self, other):
+        return _Op(np.multiply, '({} * {})', self, other)
+
+    def __rmul__(self, other):
+        return _Op(np.multiply, '({} * {})', other, self)
+
+    def __truediv__(self, other):
+        return _Op(np.true_divide, '({} / {})', self, other)
+
+    def __rtruediv__(self, other):
+        return _Op(np.true_divide, '({} / {})', other, self)
+
+    def __pow__(self, other):
+        return _Op(np.power, '({} ** {})', self, other)
+
+    def __neg__(self):
+        return _Op(np.negative, '-{}', self)
+
+    def __abs__(self):
+        return _Op(np.abs, 'abs({})', self)
+
+    def __lt__(self, other):
+        return _Op(np.less, '({} < {})', self, other)
+
+    def __le__(self, other):
+        return _Op(np.less_equal, '({} <= {})', self, other)
+
+    def __gt__(self, other):
+        return _Op(np.greater, '({} > {})', self, other)
+
+    def __ge__(self, other):
+        return _Op(np.greater_equal, '({} >= {})', self, other)
+
+    def __and__(self, other):
+        return _Op(np.logical_and, '({} & {})', self, other)
+
+    def __or__(self, other):
+        return _Op(np.logical_or, '({} | {})', self, other)
+
+    def __invert__(self):
+        return _Op(np.logical_not, '~{}', self)
+
+    def __bool__(self):
+        raise TypeError("cub 表达式没有真值，条件请用 where() 表示")
+
+    def abs(self):
+        return abs(self)
+
+    def clip(self, lower, upper):
+        """把值截断到 [lower, upper]"""
+        return _Op(np.clip, '{}.clip({}, {})', self, lower, upper)
+
+    def compute(self, slab_bytes=CUBE_STREAM_SLAB_BYTES, dtype='float64'):
+        """分块计算表达式，返回整个网格的数组"""
+        processor = CubeFileInterpolator(quiet=True, dtype=dtype)
+        result = np.empty(self._grid()['shape'], dtype=processor.dtype)
+        for start, stop, values in self._iter_blocks(processor, slab_bytes):
+            result[start:stop] = values
+        return result
+
+    def evaluate(self, output_file, compresslevel=None, slab_bytes=CUBE_STREAM_SLAB_BYTES,
+                 dtype='float64', quiet=False):
+        """分块计算表达式并直接写出cub文件，内存占用与网格总点数无关
+
+        文件头取自表达式中的第一个cub文件，第二行注释换成表达式本身。
+        文件名以 .gz/.xz/.zst 结尾时写出压缩文件，compresslevel 见 open_cube。
+        返回 output_file。
+        """
+        processor = CubeFileInterpolator(quiet=quiet, dtype=dtype)
+        template = dict(self._grid(), comment2=str(self))
+        processor._print(f"计算: {self}")
+
+        with open_cube(output_file, 'w', compresslevel) as f:
+            processor.write_cube_header(f, template)
+            writer = CubeRowWriter(processor, f)
+            for _, _, values in self._iter_blocks(processor, slab_bytes):
+                writer.write(values)
+            writer.finish()
+
+        processor._print(f"cub文件写入完成: {output_file}")
+        return output_file
+
+    def _grid(self):
+        if self.grid is None:
+            raise ValueError("表达式中没有cub文件")
+        return self.grid
+
+    def _iter_blocks(self, processor, slab_bytes):
+        """逐块产生 (起始平面, 结束平面, 该块的计算结果)"""
+        sources = {}
+        self._collect(sources)
+        nx, ny, nz = self._grid()['shape']
+
+        # 每个格点同时存在的数组：各输入文件的一块，加上每个运算的结果
+        arrays = len(sources) + self._count_ops()
+        block = max(1, slab_bytes // (ny * nz * processor.dtype.itemsize * arrays))
+        chunk_size = int(np.clip(slab_bytes // (16 * len(sources)), 1 << 16,
+                                 CUBE_READ_CHUNK_SIZE))
+
+        with contextlib.ExitStack() as stack:
+            planes = {}
+            for key, source in sources.items():
+                f = stack.enter_context(open_cube(source.filename, 'r'))
+                processor.read_cube_header(f)
+                planes[key] = processor.iter_cube_planes(f, (nx, ny, nz), chunk_size,
+                                                          processor.dtype)
+
+            for start in range(0, nx, block):
+                stop = min(start + block, nx)
+                blocks = {key: np.stack(list(islice(source_planes, stop - start)))
+                          for key, source_planes in planes.items()}
+                values = np.broadcast_to(self._eval(blocks), (stop - start, ny, nz))
+                yield start, stop, values.astype(processor.dtype, copy=False)
+
+    def _collect(self, sources):
+        pass
+
+    def _count_ops(self):
+        return 0
+
+
+class CubeSource(CubeExpr):
+    """表达式中的一个cub文件；构建时只读取文件头"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.key = os.path.abspath(filename)
+        with open_cube(filename, 'r') as f:
+            self.grid = CubeFileInterpolator(quiet=True).read_cube_header(f)
+
+    def __str__(self):
+        return os.path.basename(self.filename)
+
+    def _collect(self, sources):
+        # 同一个文件在表达式中出现多次时只读取一遍
+        sources.setdefault(self.key, self)
+
+    def _eval(self, blocks):
+        return blocks[self.key]
+
+
+class _Constant(CubeExpr):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return f"{self.value:g}"
+
+    def _eval(self, blocks):
+        return self.value
+
+
+class _Op(CubeExpr):
+    def __init__(self, func, template, *args):
+        self.func = func
+        self.template = template
+        self.args = [arg if isinstance(arg, CubeExpr) else _Constant(arg) for arg in args]
+
+        grids = [(arg, arg.grid) for arg in self.args if arg.grid is not None]
+        for arg, grid in grids[1:]:
+            if not same_grid(grids[0][1], grid):
+                raise ValueError(f"网格不一致: {grids[0][0]} 与 {arg}，"
+                                 f"请先用 interpolate_cube_fields 映射到同一网格")
+        if grids:
+            self.grid = grids[0][1]
+
+    def __str__(self):
+        return self.template.format(*self.args)
+
+    def _collect(self, sources):
+        for arg in self.args:
+            arg._collect(sources)
+
+    def _count_ops(self):
+        return 1 + sum(arg._count_ops() for arg in self.args)
+
+    def _eval(self, blocks):
+        return self.func(*[arg._eval(blocks) for arg in self.args])
+
+
+def cube(filename):
+    """把cub文件作为表达式的输入"""
+    return CubeSource(filename)
+
+
+def where(condition, x, y):
+    """condition 成立处取 x，否则取 y；三者可以是表达式或常数"""
+    return _Op(np.where, 'where({}, {}, {})', condition, x, y)
+
+
+def same_grid(a, b, tolerance=GRID_TOLERANCE):
+    """根据文件头判断两个cub文件的网格是否相同（格点数、原点和步长）"""
+    if tuple(a['shape']) != tuple(b['shape']):
+        return False
+    if not np.allclose(a['origin'], b['origin'], rtol=0, atol=tolerance):
+        return False
+    return all(np.allclose(step_a, step_b, rtol=0, atol=tolerance)
+               for (_, step_a), (_, step_b) in zip(a['grid_info'], b['grid_info']))
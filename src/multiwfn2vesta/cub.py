@@ -1,69 +1,692 @@
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
 import numpy as np
 from scipy.interpolate import RegularGridInterpolator
 
+from multiwfn2vesta.instrumentation import Instrumentation, JSONLinesSink
+
+# 可选的格点数据精度；cub文本只有约6位有效数字，float32 足以表示
+CUBE_DTYPES = ('float64', 'float32')
+# 可选的格点数据解析引擎
+CUBE_READ_ENGINES = ('numpy', 'python', 'parallel')
+# numpy 引擎每次读取的字符数
+CUBE_READ_CHUNK_SIZE = 1 << 24
+# 可选的格点数据写出引擎
+CUBE_WRITE_ENGINES = ('numpy', 'python')
+# numpy 写出引擎每次格式化的行数（每行6个值）
+CUBE_WRITE_CHUNK_ROWS = 10000
+# 全零行的格式化文本
+_CUBE_ZERO_ROW = (" %13.5E" % 0.0) * 6
+# 可选的插值引擎
+INTERPOLATION_ENGINES = ('trilinear', 'scipy')
+# trilinear 引擎每个分块中间数组的点数上限
+INTERPOLATION_SLAB_POINTS = 1 << 20
+# 窄带插值每批处理的点数
+INTERPOLATION_BATCH_POINTS = 1 << 20
+# 内存中保留的插值计划个数
+INTERPOLATION_PLAN_CACHE_SIZE = 16
+# 等密度表面掩膜的模式和构建方法
+MASK_MODES = ('filled', 'shell')
+MASK_METHODS = ('edt', 'dilation')
+# 解析缓存的默认目录和容量上限
+CUBE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "multiwfn2vesta")
+CUBE_CACHE_MAX_BYTES = 4 << 30
+# 分块流式处理时每块的内存预算
+CUBE_STREAM_SLAB_BYTES = 256 << 20
+# 分块处理中每个目标格点大致占用的字节数（密度、势能、距离变换、掩膜等中间数组）
+_CUBE_STREAM_BYTES_PER_POINT = 64
+
+
+def open_cube(filename, mode='r', compresslevel=None):
+    """按扩展名打开cub文件，透明支持 .gz/.xz/.zst 压缩
+
+    mode 为 'r' 或 'w'，返回文本流。compresslevel 为压缩级别，
+    None 表示使用各压缩格式自身的默认值；对未压缩文件无效。
+    .zst 需要安装 zstandard 包。
+    """
+    if mode not in ('r', 'w'):
+        raise ValueError(f"不支持的打开模式: {mode}")
+    text_mode = mode + 't'
+    lower = str(filename).lower()
+    
+    if lower.endswith('.gz'):
+        if mode == 'w' and compresslevel is not None:
+            return gzip.open(filename, text_mode, compresslevel=compresslevel)
+        return gzip.open(filename, text_mode)
+    
+    if lower.endswith('.xz'):
+        if mode == 'w' and compresslevel is not None:
+            return lzma.open(filename, text_mode, preset=compresslevel)
+        return lzma.open(filename, text_mode)
+    
+    if lower.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("读写 .zst 文件需要安装 zstandard: pip install zstandard")
+        if mode == 'w' and compresslevel is not None:
+            cctx = zstandard.ZstdCompressor(level=compresslevel)
+            return zstandard.open(filename, text_mode, cctx=cctx)
+        return zstandard.open(filename, text_mode)
+    
+    return open(filename, mode)
+
+
+def _is_compressed(filename):
+    return str(filename).lower().endswith(('.gz', '.xz', '.zst'))
+
+
+def _read_cube_data_parallel(filename, natoms, expected_points, workers=None,
+                             dtype=np.float64):
+    """多进程并行解析未压缩cub文件的格点数据
+
+    定位格点数据的起始字节，把其余部分切成若干按行对齐的字节范围。
+    每个范围只读取、解析一次：子进程把解析出的数值写进自己的共享内存块并
+    返回块名和个数，主进程按顺序把各块拼接到结果数组中。进程池在多次调用
+    之间复用。返回 (数据数组, 文件中实际的数据点数)；进程池异常退出时
+    返回 None，由调用方改用串行解析。
+    """
+    workers = workers or os.cpu_count() or 1
+    with open(filename, 'rb') as f:
+        # 文件头共 6 + natoms 行
+        for _ in range(6 + natoms):
+            f.readline()
+        start = f.tell()
+        end = f.seek(0, os.SEEK_END)
+        
+        # 切分点移到下一行的开头
+        bounds = [start]
+        for i in range(1, workers):
+            f.seek(start + (end - start) * i // workers)
+            f.readline()
+            bounds.append(max(bounds[-1], min(f.tell(), end)))
+        bounds.append(end)
+    ranges = [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    data = np.zeros(expected_points, dtype=dtype)
+    if not ranges:
+        return data, 0
+    
+    n = len(ranges)
+    dtype = np.dtype(dtype)
+    try:
+        parsed = list(_parse_pool(workers).map(_parse_cube_range, [filename] * n,
+                                               *zip(*ranges), [dtype.str] * n))
+    except BrokenProcessPool:
+        _reset_parse_pool()
+        return None
+    
+    count = 0
+    try:
+        for name, size in parsed:
+            if name is None:
+                continue
+            n_copy = max(0, min(size, expected_points - count))
+            if n_copy:
+                shm = shared_memory.SharedMemory(name=name)
+                try:
+                    data[count:count + n_copy] = np.ndarray(size, dtype=dtype,
+                                                            buffer=shm.buf)[:n_copy]
+                finally:
+                    shm.close()
+            count += size
+    finally:
+        for name, _ in parsed:
+            if name is not None:
+                _unlink_shared_memory(name)
+    return data, count
+
+
+# 并行解析复用的进程池：(进程数, ProcessPoolExecutor)
+_PARSE_POOL = None
+_PARSE_POOL_LOCK = threading.Lock()
+
+
+def _parse_pool(workers):
+    """返回 workers 个进程的解析进程池，进程数变化时重建"""
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None or _PARSE_POOL[0] != workers:
+            if _PARSE_POOL is not None:
+                _PARSE_POOL[1].shutdown()
+            # 子进程与主进程共用同一个资源跟踪进程，共享内存块的登记才能在主进程释放时注销
+            resource_tracker.ensure_running()
+            _PARSE_POOL = (workers, ProcessPoolExecutor(max_workers=workers))
+        return _PARSE_POOL[1]
+
+
+def _reset_parse_pool():
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is not None:
+            _PARSE_POOL[1].shutdown(wait=False)
+        _PARSE_POOL = None
+
+
+def _unlink_shared_memory(name):
+    shm = shared_memory.SharedMemory(name=name)
+    shm.close()
+    shm.unlink()
+
+
+def _parse_cube_range(filename, start, stop, dtype='<f8'):
+    """解析字节范围内的数值，写入新建的共享内存块
+
+    返回 (共享内存块名, 数值个数)，范围内没有数值时块名为 None；
+    共享内存块由主进程读取后释放。
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        text = f.read(stop - start).decode('ascii')
+    if not text or text.isspace():
+        return None, 0
+    values = np.fromstring(text, dtype=np.float64, sep=' ')
+    if len(values) == 0:
+        return None, 0
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=len(values) * dtype.itemsize)
+    try:
+        np.ndarray(len(values), dtype=dtype, buffer=shm.buf)[:] = values
+    finally:
+        shm.close()
+    return shm.name, len(values)
+
+
+class CubeCache:
+    """cub文件解析结果的二进制缓存
+
+    每个缓存条目由一个 .json 文件头和一个 .npy 格点数据组成，
+    以文件的绝对路径、大小和修改时间（可选再加内容哈希）为键。
+    命中时以 mmap_mode='r' 载入格点数据，不做任何解析和复制。
+    缓存总大小超过 max_bytes 时按最近使用时间淘汰最旧的条目。
+    """
+    
+    def __init__(self, cache_dir=CUBE_CACHE_DIR, max_bytes=CUBE_CACHE_MAX_BYTES,
+                 use_hash=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.use_hash = use_hash
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    def key(self, filename):
+        """计算cub文件的缓存键"""
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        digest = hashlib.sha1(f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+        if self.use_hash:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+    
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.json', base + '.npy'
+    
+    def load(self, filename):
+        """读取缓存，未命中时返回 None"""
+        header_path, data_path = self._paths(self.key(filename))
+        try:
+            with open(header_path, 'r') as f:
+                header = json.load(f)
+            data = np.load(data_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        
+        # 更新访问时间，供淘汰策略使用
+        os.utime(header_path)
+        
+        return {
+            'comment1': header['comment1'],
+            'comment2': header['comment2'],
+            'origin': np.array(header['origin']),
+            'grid_info': [(n, np.array(step)) for n, step in header['grid_info']],
+            'atoms': [{
+                'atomic_number': atom['atomic_number'],
+                'charge': atom['charge'],
+                'coords': np.array(atom['coords'])
+            } for atom in header['atoms']],
+            'data': data,
+            'shape': tuple(header['shape'])
+        }
+    
+    def store(self, filename, cube):
+        """写入缓存，写完后按容量上限淘汰旧条目"""
+        header_path, data_path = self._paths(self.key(filename))
+        header = {
+            'source': os.path.abspath(filename),
+            'comment1': cube['comment1'],
+            'comment2': cube['comment2'],
+            'origin': cube['origin'].tolist(),
+            'grid_info': [(int(n), step.tolist()) for n, step in cube['grid_info']],
+            'atoms': [{
+                'atomic_number': atom['atomic_number'],
+                'charge': atom['charge'],
+                'coords': atom['coords'].tolist()
+            } for atom in cube['atoms']],
+            'shape': list(cube['shape'])
+        }
+        
+        # 先写临时文件再改名，避免并发读到写了一半的条目
+        with open(data_path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(cube['data']))
+        os.replace(data_path + '.tmp', data_path)
+        with open(header_path + '.tmp', 'w') as f:
+            json.dump(header, f)
+        os.replace(header_path + '.tmp', header_path)
+        
+        self.evict()
+    
+    def invalidate(self, filename):
+        """删除某个cub文件的缓存条目"""
+        for path in self._paths(self.key(filename)):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def clear(self):
+        """清空缓存目录中的所有条目"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(('.json', '.npy')):
+                os.remove(os.path.join(self.cache_dir, name))
+    
+    def evict(self):
+        """按最近访问时间淘汰条目，直到总大小不超过 max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            header_path, data_path = self._paths(name[:-len('.json')])
+            try:
+                size = os.path.getsize(header_path) + os.path.getsize(data_path)
+                atime = os.path.getmtime(header_path)
+            except OSError:
+                continue
+            entries.append((atime, size, header_path, data_path))
+            total += size
+        
+        for atime, size, header_path, data_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (header_path, data_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+
+class InterpolationPlan:
+    """两套规则网格之间的三线性插值计划
+
+    保存每个坐标轴上的源格点下标、权重和范围内标记，只与两套网格的几何
+    （原点、步长、格点数）有关，与格点数据无关。同一个计划可以反复用于
+    任意多个共享源网格的场，每个场只需做取值和乘加。
+    """
+
+    def __init__(self, weights, source_shape, target_shape):
+        # [(i0, i1, w, inside)] * 3，见 CubeFileInterpolator._axis_weights
+        self.weights = weights
+        self.source_shape = tuple(source_shape)
+        self.target_shape = tuple(target_shape)
+
+    @classmethod
+    def from_axes(cls, source_axes, target_axes):
+        weights = [_axis_weights(s, t) for s, t in zip(source_axes, target_axes)]
+        return cls(weights, [len(a) for a in source_axes], [len(a) for a in target_axes])
+
+    def apply(self, data, slab_points=INTERPOLATION_SLAB_POINTS):
+        """把源网格上的场插值到目标网格
+
+        data 为源网格形状的数组，或沿第 0 维堆叠的多个场 (k, nx, ny, nz)，
+        返回对应形状的结果。沿 x、y、z 依次做一维线性插值，每次只处理一个
+        x 方向的目标切片块，块内中间数组的大小约为 slab_points 个点。
+        网格范围外填充 0。
+        """
+        stacked = data.ndim == 4
+        fields = data if stacked else data[None]
+        if fields.shape[1:] != self.source_shape:
+            raise ValueError(f"数据形状 {fields.shape[1:]} 与插值计划的源网格 "
+                             f"{self.source_shape} 不一致")
+        
+        dtype = np.result_type(fields.dtype, np.float32)
+        # 权重转换为数据的精度，float32 数据的中间数组也保持 float32
+        wx, wy, wz = [(i0, i1, w.astype(dtype, copy=False), inside)
+                      for i0, i1, w, inside in self.weights]
+        k = len(fields)
+        nx, ny, nz = self.target_shape
+        src_ny, src_nz = self.source_shape[1:]
+        result = np.empty((k, nx, ny, nz), dtype=dtype)
+        
+        # 每个目标 x 切片需要的最大中间数组点数
+        per_x = k * max(src_ny * src_nz, ny * src_nz, ny * nz)
+        block = max(1, slab_points // per_x)
+        
+        for start in range(0, nx, block):
+            stop = min(start + block, nx)
+            i0, i1, w, _ = (a[start:stop] for a in wx)
+            w = w[None, :, None, None]
+            # x 方向
+            slab = fields[:, i0] * (1 - w) + fields[:, i1] * w
+            # y 方向
+            slab = (slab[:, :, wy[0], :] * (1 - wy[2])[None, None, :, None]
+                    + slab[:, :, wy[1], :] * wy[2][None, None, :, None])
+            # z 方向
+            slab = slab[..., wz[0]] * (1 - wz[2]) + slab[..., wz[1]] * wz[2]
+            result[:, start:stop] = slab
+        
+        result[:, ~wx[3]] = 0.0
+        result[:, :, ~wy[3]] = 0.0
+        result[:, :, :, ~wz[3]] = 0.0
+        return result if stacked else result[0]
+
+    def save(self, path):
+        """原子地保存为 .npz 文件"""
+        arrays = {f"{axis}_{name}": array
+                  for axis, weights in zip('xyz', self.weights)
+                  for name, array in zip(('i0', 'i1', 'w', 'inside'), weights)}
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, source_shape=self.source_shape, target_shape=self.target_shape,
+                 **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            weights = [tuple(f[f"{axis}_{name}"] for name in ('i0', 'i1', 'w', 'inside'))
+                       for axis in 'xyz']
+            return cls(weights, f['source_shape'].tolist(), f['target_shape'].tolist())
+
+
+class InterpolationPlanCache:
+    """按 (源网格几何, 目标网格几何) 缓存插值计划
+
+    内存中按最近使用顺序保留 max_plans 个计划；cache_dir 不为 None 时
+    另外把计划保存为 {cache_dir}/{键}.npz，下次运行时直接读取。
+    """
+
+    def __init__(self, max_plans=INTERPOLATION_PLAN_CACHE_SIZE, cache_dir=None):
+        self.max_plans = max_plans
+        self.cache_dir = cache_dir
+        self._plans = OrderedDict()
+
+    def get(self, key, build):
+        """返回键对应的计划，不存在时调用 build() 构建"""
+        plan = self._plans.get(key)
+        if plan is not None:
+            self._plans.move_to_end(key)
+            return plan
+        
+        path = os.path.join(self.cache_dir, key + '.npz') if self.cache_dir else None
+        if path and os.path.exists(path):
+            try:
+                plan = InterpolationPlan.load(path)
+            except (OSError, ValueError, KeyError):
+                plan = None
+        if plan is None:
+            plan = build()
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                plan.save(path)
+        
+        self._plans[key] = plan
+        while len(self._plans) > self.max_plans:
+            self._plans.popitem(last=False)
+        return plan
+
+    def clear(self):
+        self._plans.clear()
+
+
+def _check_dtype(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.name not in CUBE_DTYPES:
+        raise ValueError(f"不支持的格点数据精度: {dtype}")
+    return dtype
+
+
+def interpolation_plan_key(source_cube, target_cube):
+    """由两套网格的原点、步长和格点数得到插值计划的键"""
+    digest = hashlib.sha256()
+    for cube in (source_cube, target_cube):
+        digest.update(np.asarray(cube['origin'], dtype=np.float64).tobytes())
+        for n, step in cube['grid_info']:
+            digest.update(np.int64(n).tobytes())
+            digest.update(np.asarray(step, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def _axis_weights(source_coords, target_coords):
+    """计算单个坐标轴上的插值下标和权重
+
+    返回 (i0, i1, w, inside)：目标点位于源格点 i0 与 i1 之间，
+    插值值为 (1-w)*f[i0] + w*f[i1]；inside 标记目标点是否在源网格范围内。
+    """
+    n = len(source_coords)
+    inside = (target_coords >= source_coords[0]) & (target_coords <= source_coords[-1])
+    if n < 2:
+        zeros = np.zeros(len(target_coords), dtype=np.intp)
+        return zeros, zeros, np.zeros(len(target_coords)), inside
+    
+    step = source_coords[1] - source_coords[0]
+    frac = (target_coords - source_coords[0]) / step
+    i0 = np.clip(np.floor(frac).astype(np.intp), 0, n - 2)
+    w = np.clip(frac - i0, 0.0, 1.0)
+    return i0, i0 + 1, w, inside
+
+
 class CubeFileInterpolator:
-    def __init__(self):
+    def __init__(self, cache=None, quiet=False, instrumentation=None, plan_cache=None,
+                 dtype='float64'):
         self.density_data = None
         self.potential_data = None
         self.isodensity_value = 0.001
+        # 可选的 CubeCache，None 表示不使用缓存
+        self.cache = cache
+        # quiet=True 时不打印进度信息
+        self.quiet = quiet
+        # process() 各阶段的耗时和内存记录，见 Instrumentation
+        self.instrumentation = instrumentation or Instrumentation()
+        # 插值计划缓存，见 InterpolationPlanCache
+        self.plan_cache = plan_cache or InterpolationPlanCache()
+        # 读入格点数据的精度，插值、掩膜和写出沿用该精度，见 CUBE_DTYPES
+        self.dtype = _check_dtype(dtype)
     
-    def read_cube_file(self, filename):
-        """读取cub文件"""
-        with open(filename, 'r') as f:
-            # 读取头两行注释
-            comment1 = f.readline().strip()
-            comment2 = f.readline().strip()
-            
-            # 读取原子数和原点坐标
-            line = f.readline().split()
-            natoms = int(line[0])
-            origin = np.array([float(x) for x in line[1:4]])
-            
-            # 读取网格信息
-            grid_info = []
-            for i in range(3):
-                line = f.readline().split()
-                npoints = int(line[0])
-                step = np.array([float(x) for x in line[1:4]])
-                grid_info.append((npoints, step))
-            
-            # 读取原子信息
-            atoms = []
-            for i in range(natoms):
-                line = f.readline().split()
-                atoms.append({
-                    'atomic_number': int(line[0]),
-                    'charge': float(line[1]),
-                    'coords': np.array([float(x) for x in line[2:5]])
-                })
+    def _print(self, *args):
+        if not self.quiet:
+            print(*args)
+    
+    def read_cube_file(self, filename, engine='numpy', workers=None, dtype=None):
+        """读取cub文件
+
+        engine='numpy' 分块批量解析格点数据到预分配数组；
+        engine='python' 为原先的逐行解析实现，保留用于对比和回退；
+        engine='parallel' 用 workers 个进程（默认为 CPU 核数）并行解析，
+        适合很大的未压缩文件；压缩文件或只有一个进程时退回到 numpy 引擎。
+        .gz/.xz/.zst 压缩文件会被透明解压，见 open_cube。
+        dtype 为格点数据的精度，缺省为 self.dtype。
+        """
+        if engine not in CUBE_READ_ENGINES:
+            raise ValueError(f"未知的解析引擎: {engine}")
+        dtype = self.dtype if dtype is None else _check_dtype(dtype)
+        
+        if self.cache is not None:
+            cube = self.cache.load(filename)
+            # 精度不同的缓存条目视为未命中，重新解析后覆盖
+            if cube is not None and cube['data'].dtype == dtype:
+                self._print(f"使用缓存: {filename}")
+                return cube
+        
+        with open_cube(filename, 'r') as f:
+            header = self.read_cube_header(f)
             
             # 读取格点数据
-            data = []
-            for line in f:
-                data.extend([float(x) for x in line.split()])
-            
-            # 重塑数据为3D数组
-            nx, ny, nz = grid_info[0][0], grid_info[1][0], grid_info[2][0]
+            nx, ny, nz = header['shape']
             expected_points = nx * ny * nz
+            result = None
+            if engine == 'parallel' and (workers or os.cpu_count() or 1) > 1 \
+                    and not _is_compressed(filename):
+                result = _read_cube_data_parallel(filename, len(header['atoms']),
+                                                  expected_points, workers, dtype)
+                if result is None:
+                    self._print("警告: 并行解析的进程池异常退出，改用串行解析")
+            if result is not None:
+                data, count = result
+            elif engine in ('numpy', 'parallel'):
+                data, count = self._read_cube_data_numpy(f, expected_points, dtype=dtype)
+            else:
+                data, count = self._read_cube_data_python(f, expected_points, dtype)
             
-            if len(data) < expected_points:
-                print(f"警告: 数据点数({len(data)})少于预期({expected_points})")
-                data.extend([0.0] * (expected_points - len(data)))
-            elif len(data) > expected_points:
-                print(f"警告: 数据点数({len(data)})多于预期({expected_points})，进行截断")
-                data = data[:expected_points]
+            if count < expected_points:
+                self._print(f"警告: 数据点数({count})少于预期({expected_points})")
+            elif count > expected_points:
+                self._print(f"警告: 数据点数({count})多于预期({expected_points})，进行截断")
             
-            data_array = np.array(data).reshape(nx, ny, nz)
+            header['data'] = data.reshape(nx, ny, nz)
+        
+        if self.cache is not None:
+            self.cache.store(filename, header)
+        return header
+    
+    def read_cube_header(self, f):
+        """读取cub文件头，文件指针停在格点数据起始处"""
+        # 读取头两行注释
+        comment1 = f.readline().strip()
+        comment2 = f.readline().strip()
+        
+        # 读取原子数和原点坐标
+        line = f.readline().split()
+        natoms = int(line[0])
+        origin = np.array([float(x) for x in line[1:4]])
+        
+        # 读取网格信息
+        grid_info = []
+        for i in range(3):
+            line = f.readline().split()
+            npoints = int(line[0])
+            step = np.array([float(x) for x in line[1:4]])
+            grid_info.append((npoints, step))
+        
+        # 读取原子信息
+        atoms = []
+        for i in range(natoms):
+            line = f.readline().split()
+            atoms.append({
+                'atomic_number': int(line[0]),
+                'charge': float(line[1]),
+                'coords': np.array([float(x) for x in line[2:5]])
+            })
+        
+        nx, ny, nz = grid_info[0][0], grid_info[1][0], grid_info[2][0]
+        return {
+            'comment1': comment1,
+            'comment2': comment2,
+            'origin': origin,
+            'grid_info': grid_info,
+            'atoms': atoms,
+            'shape': (nx, ny, nz)
+        }
+    
+    def _read_cube_data_python(self, f, expected_points, dtype=np.float64):
+        """逐行解析格点数据（原实现）"""
+        data = []
+        for line in f:
+            data.extend([float(x) for x in line.split()])
+        
+        count = len(data)
+        if count < expected_points:
+            data.extend([0.0] * (expected_points - count))
+        elif count > expected_points:
+            data = data[:expected_points]
+        
+        return np.array(data, dtype=dtype), count
+    
+    def _read_cube_data_numpy(self, f, expected_points, chunk_size=CUBE_READ_CHUNK_SIZE,
+                              dtype=np.float64):
+        """把全部格点数据解析进长度为 expected_points 的预分配数组
+
+        数据来自 _iter_cube_values 的逐块解析结果；文件中的点数不足时
+        其余位置保持为 0，多出的点被丢弃。
+        返回 (数据数组, 文件中实际的数据点数)。
+        """
+        data = np.zeros(expected_points, dtype=dtype)
+        count = 0
+        
+        for values in self._iter_cube_values(f, chunk_size):
+            if count < expected_points:
+                n = min(len(values), expected_points - count)
+                data[count:count + n] = values[:n]
+            count += len(values)
+        
+        return data, count
+    
+    def _iter_cube_values(self, f, chunk_size=CUBE_READ_CHUNK_SIZE):
+        """逐块产生格点数据的一维数组
+
+        每次读取约 chunk_size 个字符，在最后一个换行处截断，
+        剩余部分拼接到下一块，保证不会把一个数切成两半。
+        """
+        tail = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                text = tail
+            else:
+                text = tail + chunk
+                cut = text.rfind('\n')
+                if cut < 0:
+                    tail = text
+                    continue
+                text, tail = text[:cut], text[cut + 1:]
+            
+            # 纯空白文本会被 np.fromstring 解析成 [-1.]，需要跳过
+            if text and not text.isspace():
+                yield np.fromstring(text, dtype=np.float64, sep=' ')
             
-            return {
-                'comment1': comment1,
-                'comment2': comment2,
-                'origin': origin,
-                'grid_info': grid_info,
-                'atoms': atoms,
-                'data': data_array,
-                'shape': (nx, ny, nz)
-            }
+            if not chunk:
+                break
+    
+    def iter_cube_planes(self, f, shape, chunk_size=CUBE_READ_CHUNK_SIZE, dtype=np.float64):
+        """按文件顺序逐个产生 x 方向的格点平面（ny x nz 数组）
+
+        f 是已经用 read_cube_header 读过文件头的文本流，shape 取自该文件头。
+        数据点不足时用 0 补齐，多余的数据被忽略，与 read_cube_file 一致。
+        """
+        nx, ny, nz = shape
+        plane_points = ny * nz
+        pending = np.empty(0, dtype=np.float64)
+        produced = 0
+        count = 0
+        
+        for values in self._iter_cube_values(f, chunk_size):
+            count += len(values)
+            pending = np.concatenate([pending, values]) if len(pending) else values
+            nplanes = min(len(pending) // plane_points, nx - produced)
+            for i in range(nplanes):
+                yield pending[i * plane_points:(i + 1) * plane_points].reshape(ny, nz).astype(dtype)
+            produced += nplanes
+            pending = pending[nplanes * plane_points:].copy()
+            if produced == nx:
+                pending = np.empty(0, dtype=np.float64)
+        
+        expected_points = nx * plane_points
+        if count < expected_points:
+            self._print(f"警告: 数据点数({count})少于预期({expected_points})")
+        elif count > expected_points:
+            self._print(f"警告: 数据点数({count})多于预期({expected_points})，进行截断")
+        
+        while produced < nx:
+            plane = np.zeros(plane_points, dtype=dtype)
+            plane[:len(pending)] = pending[:plane_points]
+            pending = pending[plane_points:]
+            yield plane.reshape(ny, nz)
+            produced += 1
     
     def create_grid_coordinates(self, origin, grid_info):
         """创建格点坐标"""
@@ -82,56 +705,166 @@ class CubeFileInterpolator:
         
         return x_coords, y_coords, z_coords
     
-    def interpolate_potential_to_density_grid(self):
-        """将势能数据插值到密度网格上"""
-        print("开始势能插值...")
+    def interpolate_potential_to_density_grid(self, engine='trilinear'):
+        """将势能数据插值到密度网格上
+
+        engine='trilinear' 利用两套规则网格之间的仿射关系，逐轴计算源格点下标和权重，
+        按 x 方向分块做可分离的三线性插值，不生成完整的坐标数组；下标和权重
+        作为插值计划缓存在 plan_cache 中，见 interpolation_plan；
+        engine='scipy' 为原先基于 RegularGridInterpolator 的实现。
+        两者在网格范围外都填充 0。
+        """
+        if engine not in INTERPOLATION_ENGINES:
+            raise ValueError(f"未知的插值引擎: {engine}")
+        self._print("开始势能插值...")
+        
+        source_axes, target_axes = self._interpolation_axes()
         
+        if engine == 'scipy':
+            interpolated_array = self._interpolate_scipy(
+                source_axes, self.potential_data['data'], target_axes
+            )
+        else:
+            plan = self.interpolation_plan(self.potential_data, self.density_data)
+            interpolated_array = plan.apply(self.potential_data['data'])
+        
+        self._print("插值完成")
+        return interpolated_array
+    
+    def interpolation_plan(self, source_cube, target_cube):
+        """从 source_cube 的网格插值到 target_cube 的网格的计划（带缓存）"""
+        key = interpolation_plan_key(source_cube, target_cube)
+        return self.plan_cache.get(key, lambda: InterpolationPlan.from_axes(
+            self.create_grid_coordinates(source_cube['origin'], source_cube['grid_info']),
+            self.create_grid_coordinates(target_cube['origin'], target_cube['grid_info'])
+        ))
+    
+    def interpolate_fields(self, fields):
+        """把多个性质场一次性插值到密度网格上
+
+        fields 为cub数据字典的列表（如 ESP、ALIE、LEA），按源网格几何分组，
+        每组只构建（或从缓存取出）一个插值计划，堆叠后一次批量插值。
+        与密度网格形状相同的场原样返回，与 process() 的约定一致。
+        返回与 fields 顺序相同的数组列表。
+        """
+        results = [None] * len(fields)
+        groups = {}
+        for i, field in enumerate(fields):
+            if field['shape'] == self.density_data['shape']:
+                results[i] = field['data']
+            else:
+                key = interpolation_plan_key(field, self.density_data)
+                groups.setdefault(key, []).append(i)
+        
+        for indices in groups.values():
+            plan = self.interpolation_plan(fields[indices[0]], self.density_data)
+            self._print(f"批量插值 {len(indices)} 个场")
+            stacked = plan.apply(np.stack([fields[i]['data'] for i in indices]))
+            for i, values in zip(indices, stacked):
+                results[i] = values
+        return results
+    
+    def _interpolation_axes(self):
+        """创建势能网格和密度网格的坐标轴，必要时转置势能数据"""
         # 创建势能网格坐标
         pot_x, pot_y, pot_z = self.create_grid_coordinates(
             self.potential_data['origin'], 
             self.potential_data['grid_info']
         )
         
-        print(f"势能网格: {len(pot_x)} x {len(pot_y)} x {len(pot_z)}")
-        print(f"势能数据形状: {self.potential_data['data'].shape}")
+        self._print(f"势能网格: {len(pot_x)} x {len(pot_y)} x {len(pot_z)}")
+        self._print(f"势能数据形状: {self.potential_data['data'].shape}")
         
         # 验证维度匹配
         if (len(pot_x), len(pot_y), len(pot_z)) != self.potential_data['data'].shape:
-            print("警告: 势能坐标和数据形状不匹配，尝试转置...")
+            self._print("警告: 势能坐标和数据形状不匹配，尝试转置...")
             # 尝试转置数据
             if (len(pot_y), len(pot_x), len(pot_z)) == self.potential_data['data'].shape:
                 self.potential_data['data'] = self.potential_data['data'].T
-                print("数据转置完成")
+                self._print("数据转置完成")
             else:
                 raise ValueError("无法匹配势能坐标和数据形状")
         
+        # 创建密度网格坐标
+        dens_x, dens_y, dens_z = self.create_grid_coordinates(
+            self.density_data['origin'],
+            self.density_data['grid_info']
+        )
+        
+        self._print(f"密度网格: {len(dens_x)} x {len(dens_y)} x {len(dens_z)}")
+        
+        return (pot_x, pot_y, pot_z), (dens_x, dens_y, dens_z)
+    
+    def interpolate_potential_on_mask(self, mask, batch_size=INTERPOLATION_BATCH_POINTS):
+        """只在掩膜内的密度格点上插值势能（窄带模式）
+
+        按批取出掩膜内格点的扁平下标，逐轴查表得到下标和权重后做三线性插值，
+        再写回全零的输出网格；计算量与掩膜内的点数成正比，而不是整个网格。
+        """
+        self._print("开始窄带势能插值...")
+        
+        source_axes, target_axes = self._interpolation_axes()
+        weights = self.interpolation_plan(self.potential_data, self.density_data).weights
+        source_data = self.potential_data['data']
+        shape = tuple(len(t) for t in target_axes)
+        
+        result = np.zeros(shape, dtype=np.result_type(source_data.dtype, np.float32))
+        flat_result = result.reshape(-1)
+        indices = np.flatnonzero(mask)
+        self._print(f"插值点总数: {len(indices)} / {flat_result.size}")
+        
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            flat_result[batch] = self._interpolate_trilinear_points(
+                source_data, weights, np.unravel_index(batch, shape)
+            )
+        
+        self._print("插值完成")
+        return result
+    
+    def _interpolate_trilinear_points(self, source_data, weights, target_index):
+        """在给定的目标格点下标 (ix, iy, iz) 上做三线性插值"""
+        (x0, x1, wx, inx), (y0, y1, wy, iny), (z0, z1, wz, inz) = weights
+        ix, iy, iz = target_index
+        x0, x1, wx = x0[ix], x1[ix], wx[ix]
+        y0, y1, wy = y0[iy], y1[iy], wy[iy]
+        z0, z1, wz = z0[iz], z1[iz], wz[iz]
+        
+        c00 = source_data[x0, y0, z0] * (1.0 - wx) + source_data[x1, y0, z0] * wx
+        c10 = source_data[x0, y1, z0] * (1.0 - wx) + source_data[x1, y1, z0] * wx
+        c01 = source_data[x0, y0, z1] * (1.0 - wx) + source_data[x1, y0, z1] * wx
+        c11 = source_data[x0, y1, z1] * (1.0 - wx) + source_data[x1, y1, z1] * wx
+        c0 = c00 * (1.0 - wy) + c10 * wy
+        c1 = c01 * (1.0 - wy) + c11 * wy
+        values = c0 * (1.0 - wz) + c1 * wz
+        
+        # 网格范围外填充 0
+        values[~(inx[ix] & iny[iy] & inz[iz])] = 0.0
+        return values
+    
+    def _interpolate_scipy(self, source_axes, source_data, target_axes):
+        """基于 RegularGridInterpolator 的插值（原实现）"""
         # 创建插值器
         try:
             pot_interpolator = RegularGridInterpolator(
-                (pot_x, pot_y, pot_z), 
-                self.potential_data['data'],
+                source_axes, 
+                source_data,
                 method='linear',
                 bounds_error=False,
                 fill_value=0.0
             )
-            print("插值器创建成功")
+            self._print("插值器创建成功")
         except Exception as e:
-            print(f"创建插值器失败: {e}")
+            self._print(f"创建插值器失败: {e}")
             raise
         
-        # 创建密度网格坐标
-        dens_x, dens_y, dens_z = self.create_grid_coordinates(
-            self.density_data['origin'],
-            self.density_data['grid_info']
-        )
-        
-        print(f"密度网格: {len(dens_x)} x {len(dens_y)} x {len(dens_z)}")
+        dens_x, dens_y, dens_z = target_axes
         
         # 创建完整的网格点坐标
         xx, yy, zz = np.meshgrid(dens_x, dens_y, dens_z, indexing='ij')
         grid_points = np.stack([xx.ravel(), yy.ravel(), zz.ravel()], axis=1)
         
-        print(f"插值点总数: {len(grid_points)}")
+        self._print(f"插值点总数: {len(grid_points)}")
         
         # 分批插值以避免内存问题
         batch_size = 100000
@@ -146,23 +879,52 @@ class CubeFileInterpolator:
             
             progress = batch_end / len(grid_points) * 100
             if i % (10 * batch_size) == 0:
-                print(f"插值进度: {progress:.1f}%")
+                self._print(f"插值进度: {progress:.1f}%")
         
         # 合并结果
         interpolated_array = np.concatenate(interpolated_values)
-        interpolated_array = interpolated_array.reshape(
-            len(dens_x), len(dens_y), len(dens_z)
-        )
-        
-        print("插值完成")
-        return interpolated_array
+        dtype = np.result_type(source_data.dtype, np.float32)
+        return interpolated_array.reshape(len(dens_x), len(dens_y), len(dens_z)).astype(
+            dtype, copy=False)
+    
+    def _axis_weights(self, source_coords, target_coords):
+        """单个坐标轴上的插值下标和权重，见模块函数 _axis_weights"""
+        return _axis_weights(source_coords, target_coords)
     
-    def create_isosurface_mask(self, search_radius=0.3):
-        """创建等密度表面附近的掩膜"""
-        print("创建等密度表面掩膜...")
+    def _interpolate_trilinear(self, source_axes, source_data, target_axes,
+                               slab_points=INTERPOLATION_SLAB_POINTS):
+        """可分离的规则网格三线性插值，见 InterpolationPlan.apply"""
+        plan = InterpolationPlan.from_axes(source_axes, target_axes)
+        return plan.apply(source_data, slab_points)
+    
+    def create_isosurface_mask(self, search_radius=0.3, mode='filled', method='edt'):
+        """创建等密度表面附近的掩膜
+
+        method='edt' 从 grid_info 读取真实步长，用欧氏距离变换确定膨胀范围，
+        耗时与格点数近似线性；method='dilation' 为原先按固定步长 0.56
+        用立方体结构元膨胀的实现。
+        mode='filled' 返回 ρ >= iso 的区域及其外侧 search_radius 内的格点；
+        mode='shell' 只返回距离等值面 search_radius 以内的壳层（仅 method='edt'）。
+        """
+        if mode not in MASK_MODES:
+            raise ValueError(f"未知的掩膜模式: {mode}")
+        if method not in MASK_METHODS:
+            raise ValueError(f"未知的掩膜构建方法: {method}")
+        if mode == 'shell' and method != 'edt':
+            raise ValueError("壳层掩膜需要 method='edt'")
+        self._print("创建等密度表面掩膜...")
+        
+        if method == 'edt':
+            mask = self._isosurface_mask_edt(search_radius, mode)
+        else:
+            mask = self._isosurface_mask_dilation(search_radius)
         
+        self._print(f"掩膜创建完成，非零点数: {np.sum(mask)}")
+        return mask
+    
+    def _isosurface_mask_dilation(self, search_radius):
+        """按固定步长用立方体结构元膨胀（原实现）"""
         density_data = self.density_data['data']
-        data_shape = density_data.shape
         
         # 创建二进制掩膜
         mask = density_data >= self.isodensity_value
@@ -179,130 +941,399 @@ class CubeFileInterpolator:
             structure = np.ones((2*dilation_radius+1, 2*dilation_radius+1, 2*dilation_radius+1))
             mask = binary_dilation(mask, structure=structure)
         
-        print(f"掩膜创建完成，非零点数: {np.sum(mask)}")
         return mask
     
+    def _isosurface_mask_edt(self, search_radius, mode, density_data=None):
+        """用欧氏距离变换构建掩膜
+
+        与原实现一样把搜索半径向上取整到整数个格点步长（按最粗的轴），
+        保证半径小于步长时也至少扩展一层格点。
+        density_data 缺省时使用 self.density_data['data']，也可以传入
+        沿 x 方向截取的一段（分块处理时使用）。
+        """
+        from scipy.ndimage import distance_transform_edt
+        
+        if density_data is None:
+            density_data = self.density_data['data']
+        spacing = [np.linalg.norm(step) for _, step in self.density_data['grid_info']]
+        max_step = max(spacing)
+        radius = np.ceil(search_radius / max_step - 1e-9) * max_step
+        
+        core = density_data >= self.isodensity_value
+        if not core.any() or core.all():
+            return core if mode == 'filled' else np.zeros_like(core)
+        
+        # 外侧格点到最近的 ρ >= iso 格点的距离
+        outside = distance_transform_edt(~core, sampling=spacing) <= radius
+        if mode == 'filled':
+            return outside
+        
+        # 内侧格点到最近的 ρ < iso 格点的距离；等值面位于相邻格点之间，
+        # 因此内侧至少保留紧贴表面的一层
+        inside = distance_transform_edt(core, sampling=spacing) <= max(radius, max_step)
+        return np.where(core, inside, outside)
+    
     def apply_isosurface_mask(self, potential_data, mask):
         """应用等密度表面掩膜"""
-        print("应用等密度表面掩膜...")
+        self._print("应用等密度表面掩膜...")
         
         # 将掩膜外的势能值设为零
         masked_potential = np.where(mask, potential_data, 0.0)
         
         # 统计信息
         total_points = np.prod(potential_data.shape)
-        non_zero_points = np.sum(mask)
-        efficiency = (1 - non_zero_points / total_points) * 100
+        kept_points = np.sum(mask)
         
-        print(f"总格点数: {total_points}")
-        print(f"非零点数: {non_zero_points}")
-        print(f"计算效率提升: {efficiency:.2f}%")
+        self._print(f"总格点数: {total_points}")
+        self._print(f"掩膜内格点数: {kept_points}")
+        self._print(f"掩膜外置零比例: {(1 - kept_points / total_points) * 100:.2f}%")
         
         return masked_potential
     
-    def write_cube_file(self, data, output_filename, template_data):
-        """写入cub格式文件"""
-        print(f"写入cub文件: {output_filename}")
+    def write_cube_file(self, data, output_filename, template_data, engine='numpy',
+                        compresslevel=None):
+        """写入cub格式文件
+
+        engine='numpy' 按行块批量格式化写出；engine='python' 为原先的逐值写出实现。
+        两者输出逐字节一致。
+        文件名以 .gz/.xz/.zst 结尾时写出压缩文件，compresslevel 见 open_cube。
+        """
+        if engine not in CUBE_WRITE_ENGINES:
+            raise ValueError(f"未知的写出引擎: {engine}")
+        self._print(f"写入cub文件: {output_filename}")
         
-        with open(output_filename, 'w') as f:
-            # 写入注释行
-            f.write(template_data['comment1'] + '\n')
-            f.write(template_data['comment2'] + '\n')
-            
-            # 写入原子数和原点坐标
-            natoms = len(template_data['atoms'])
-            origin = template_data['origin']
-            f.write(f"{natoms:5d} {origin[0]:12.6f} {origin[1]:12.6f} {origin[2]:12.6f}\n")
-            
-            # 写入网格信息
-            grid_info = template_data['grid_info']
-            for i in range(3):
-                npoints = grid_info[i][0]
-                step = grid_info[i][1]
-                f.write(f"{npoints:5d} {step[0]:12.6f} {step[1]:12.6f} {step[2]:12.6f}\n")
-            
-            # 写入原子信息
-            for atom in template_data['atoms']:
-                f.write(f"{atom['atomic_number']:5d} {atom['charge']:12.6f} "
-                       f"{atom['coords'][0]:12.6f} {atom['coords'][1]:12.6f} {atom['coords'][2]:12.6f}\n")
+        with open_cube(output_filename, 'w', compresslevel) as f:
+            self.write_cube_header(f, template_data)
             
             # 写入数据
-            flat_data = data.flatten()
-            count = 0
-            for value in flat_data:
-                f.write(f" {value:13.5E}")
-                count += 1
-                if count % 6 == 0:
-                    f.write('\n')
-            
-            # 如果最后一行不满6个，也需要换行
-            if count % 6 != 0:
+            if engine == 'numpy':
+                self._write_cube_data_numpy(f, data)
+            else:
+                self._write_cube_data_python(f, data)
+        
+        self._print(f"cub文件写入完成: {output_filename}")
+    
+    def write_cube_header(self, f, template_data):
+        """写出cub文件头（注释、原点、网格和原子信息）"""
+        # 写入注释行
+        f.write(template_data['comment1'] + '\n')
+        f.write(template_data['comment2'] + '\n')
+        
+        # 写入原子数和原点坐标
+        natoms = len(template_data['atoms'])
+        origin = template_data['origin']
+        f.write(f"{natoms:5d} {origin[0]:12.6f} {origin[1]:12.6f} {origin[2]:12.6f}\n")
+        
+        # 写入网格信息
+        grid_info = template_data['grid_info']
+        for i in range(3):
+            npoints = grid_info[i][0]
+            step = grid_info[i][1]
+            f.write(f"{npoints:5d} {step[0]:12.6f} {step[1]:12.6f} {step[2]:12.6f}\n")
+        
+        # 写入原子信息
+        for atom in template_data['atoms']:
+            f.write(f"{atom['atomic_number']:5d} {atom['charge']:12.6f} "
+                   f"{atom['coords'][0]:12.6f} {atom['coords'][1]:12.6f} {atom['coords'][2]:12.6f}\n")
+    
+    def _write_cube_data_python(self, f, data):
+        """逐值写出格点数据（原实现）"""
+        flat_data = data.flatten()
+        count = 0
+        for value in flat_data:
+            f.write(f" {value:13.5E}")
+            count += 1
+            if count % 6 == 0:
                 f.write('\n')
         
-        print(f"cub文件写入完成: {output_filename}")
+        # 如果最后一行不满6个，也需要换行
+        if count % 6 != 0:
+            f.write('\n')
+    
+    def _write_cube_data_numpy(self, f, data, chunk_rows=CUBE_WRITE_CHUNK_ROWS):
+        """按行块写出格点数据
+
+        每次把 chunk_rows 行（每行6个值）拼成一个格式串一次性格式化，
+        与逐值 f" {value:13.5E}" 使用同一套浮点格式化，输出逐字节一致。
+        全零行（掩膜后的势能大多如此）直接使用预先格式化好的文本。
+        """
+        flat_data = np.ravel(data)
+        nfull = len(flat_data) // 6 * 6
+        
+        for start in range(0, nfull, chunk_rows * 6):
+            chunk = flat_data[start:min(start + chunk_rows * 6, nfull)]
+            f.write(self._format_cube_rows(chunk.reshape(-1, 6)))
+        
+        # 最后一行不满6个
+        rest = flat_data[nfull:]
+        if len(rest):
+            f.write((" %13.5E" * len(rest) + "\n") % tuple(rest.tolist()))
+    
+    def _format_cube_rows(self, rows):
+        """把 (k, 6) 的数据块格式化为 k 行cub文本"""
+        row_format = " %13.5E" * 6 + "\n"
+        zero_rows = np.all((rows == 0) & ~np.signbit(rows), axis=1)
+        nzero = np.count_nonzero(zero_rows)
+        
+        if nzero * 4 < len(rows):
+            return (row_format * len(rows)) % tuple(rows.ravel().tolist())
+        
+        lines = np.empty(len(rows), dtype=object)
+        lines[zero_rows] = _CUBE_ZERO_ROW
+        nonzero = rows[~zero_rows]
+        if len(nonzero):
+            text = (row_format * len(nonzero)) % tuple(nonzero.ravel().tolist())
+            lines[~zero_rows] = text.split("\n")[:-1]
+        return "\n".join(lines.tolist()) + "\n"
     
     def process(self, density_file, potential_file, output_file, 
-                search_radius=0.3, apply_mask=True):
-        """主处理函数：将势能插值到密度网格并可选地应用等密度表面掩膜"""
-        print("=" * 60)
-        print("电子势能cub文件插值处理")
-        print("=" * 60)
+                search_radius=0.3, apply_mask=True, narrow_band=True, mask_mode='filled',
+                compresslevel=None):
+        """主处理函数：将势能插值到密度网格并可选地应用等密度表面掩膜
+
+        narrow_band=True 且需要插值和掩膜时，先构建掩膜，只对掩膜内的格点插值。
+        mask_mode 见 create_isosurface_mask；output_file 以 .gz/.xz/.zst 结尾时
+        按 compresslevel 压缩写出。
+        各阶段（read_density、read_potential、mask、interpolate、apply_mask、write）
+        的耗时、读写字节数、格点数和内存峰值记录到 self.instrumentation。
+        """
+        stage = self.instrumentation.stage
+        self._print("=" * 60)
+        self._print("电子势能cub文件插值处理")
+        self._print("=" * 60)
         
         # 读取文件
-        print("1. 读取密度文件...")
-        self.density_data = self.read_cube_file(density_file)
-        print(f"   密度网格: {self.density_data['shape']}")
+        self._print("1. 读取密度文件...")
+        with stage('read_density', file=density_file) as record:
+            self.density_data = self.read_cube_file(density_file)
+            record['bytes_read'] = os.path.getsize(density_file)
+            record['grid_points'] = self.density_data['data'].size
+        self._print(f"   密度网格: {self.density_data['shape']}")
         
-        print("2. 读取势能文件...")
-        self.potential_data = self.read_cube_file(potential_file)
-        print(f"   势能网格: {self.potential_data['shape']}")
+        self._print("2. 读取势能文件...")
+        with stage('read_potential', file=potential_file) as record:
+            self.potential_data = self.read_cube_file(potential_file)
+            record['bytes_read'] = os.path.getsize(potential_file)
+            record['grid_points'] = self.potential_data['data'].size
+        self._print(f"   势能网格: {self.potential_data['shape']}")
         
         # 检查网格是否匹配
         density_shape = self.density_data['shape']
         potential_shape = self.potential_data['shape']
+        total_points = self.density_data['data'].size
+        
+        narrow = apply_mask and narrow_band and density_shape != potential_shape
+        mask = None
+        if apply_mask:
+            with stage('mask', grid_points=total_points, mode=mask_mode) as record:
+                mask = self.create_isosurface_mask(search_radius, mode=mask_mode)
+                record['mask_points'] = int(np.count_nonzero(mask))
         
         if density_shape == potential_shape:
-            print("3. 网格匹配，无需插值")
+            self._print("3. 网格匹配，无需插值")
             interpolated_potential = self.potential_data['data']
+        elif narrow:
+            self._print("3. 网格不匹配，进行窄带插值...")
+            with stage('interpolate', grid_points=int(np.count_nonzero(mask)),
+                       narrow_band=True):
+                interpolated_potential = self.interpolate_potential_on_mask(mask)
         else:
-            print("3. 网格不匹配，进行插值...")
-            interpolated_potential = self.interpolate_potential_to_density_grid()
+            self._print("3. 网格不匹配，进行插值...")
+            with stage('interpolate', grid_points=total_points, narrow_band=False):
+                interpolated_potential = self.interpolate_potential_to_density_grid()
         
         # 可选：应用等密度表面掩膜
-        if apply_mask:
-            print("4. 应用等密度表面掩膜...")
-            mask = self.create_isosurface_mask(search_radius)
-            final_potential = self.apply_isosurface_mask(interpolated_potential, mask)
+        if narrow:
+            self._print("4. 窄带插值已只计算掩膜内格点")
+            final_potential = interpolated_potential
+        elif apply_mask:
+            self._print("4. 应用等密度表面掩膜...")
+            with stage('apply_mask', grid_points=total_points):
+                final_potential = self.apply_isosurface_mask(interpolated_potential, mask)
         else:
-            print("4. 跳过掩膜应用...")
+            self._print("4. 跳过掩膜应用...")
             final_potential = interpolated_potential
         
         # 写入结果
-        print("5. 写入结果文件...")
-        self.write_cube_file(final_potential, output_file, self.density_data)
+        self._print("5. 写入结果文件...")
+        with stage('write', file=output_file, grid_points=total_points) as record:
+            self.write_cube_file(final_potential, output_file, self.density_data,
+                                 compresslevel=compresslevel)
+            record['bytes_written'] = os.path.getsize(output_file)
         
         # 统计信息
-        print("\n" + "=" * 60)
-        print("处理完成 - 结果统计")
-        print("=" * 60)
-        print(f"输出文件: {output_file}")
-        print(f"势能值范围: [{np.min(final_potential):.6E}, {np.max(final_potential):.6E}]")
-        print(f"非零势能点数: {np.sum(final_potential != 0)}")
-        
-        if apply_mask:
-            total_points = np.prod(final_potential.shape)
-            non_zero_points = np.sum(final_potential != 0)
-            efficiency = (1 - non_zero_points / total_points) * 100
-            print(f"计算效率提升: {efficiency:.2f}%")
+        self._print("\n" + "=" * 60)
+        self._print("处理完成 - 结果统计")
+        self._print("=" * 60)
+        self._print(f"输出文件: {output_file}")
+        self._print(f"势能值范围: [{np.min(final_potential):.6E}, {np.max(final_potential):.6E}]")
+        self._print(f"非零势能点数: {np.sum(final_potential != 0)}")
         
         return final_potential
 
+    def process_slabs(self, density_file, potential_file, output_file,
+                      search_radius=0.3, apply_mask=True, mask_mode='filled',
+                      slab_bytes=CUBE_STREAM_SLAB_BYTES, compresslevel=None):
+        """分块流式处理：结果与 process() 相同，但内存占用不随网格大小增长
+
+        沿cub文件中最慢变化的 x 方向把密度网格分成若干块，每块的点数由
+        slab_bytes 估算。每块只从两个输入文件中读取需要的平面：
+        密度额外读取掩膜半径范围内的相邻平面，势能只读取插值用到的平面；
+        算完的结果立即写出。两个文件都只顺序读取一遍，不使用缓存。
+        slab_bytes 是估算值，实际内存峰值约为它的 2~3 倍，但与网格总点数无关。
+        掩膜总是用 method='edt' 构建。返回 output_file。
+        """
+        stage = self.instrumentation.stage
+        self._print(f"分块处理: {density_file} + {potential_file} -> {output_file}")
+        
+        with open_cube(density_file, 'r') as density_f, \
+                open_cube(potential_file, 'r') as potential_f, \
+                open_cube(output_file, 'w', compresslevel) as out_f:
+            self.density_data = self.read_cube_header(density_f)
+            self.potential_data = self.read_cube_header(potential_f)
+            density_shape = self.density_data['shape']
+            potential_shape = self.potential_data['shape']
+            nx, ny, nz = density_shape
+            
+            # 读取文本块也计入预算，两个输入文件各占一份
+            chunk_size = int(np.clip(slab_bytes // 16, 1 << 16, CUBE_READ_CHUNK_SIZE))
+            density = _PlaneWindow(self.iter_cube_planes(density_f, density_shape,
+                                                          chunk_size, self.dtype))
+            potential = _PlaneWindow(self.iter_cube_planes(potential_f, potential_shape,
+                                                            chunk_size, self.dtype))
+            
+            # 掩膜需要的相邻平面数：距离阈值以内的格点都在块内
+            spacing = [np.linalg.norm(step) for _, step in self.density_data['grid_info']]
+            max_step = max(spacing)
+            radius = np.ceil(search_radius / max_step - 1e-9) * max_step
+            reach = max(radius, max_step) if mask_mode == 'shell' else radius
+            margin = int(np.ceil(reach / spacing[0] - 1e-9)) if apply_mask else 0
+            
+            interpolate = density_shape != potential_shape
+            if interpolate:
+                pot_axes = self.create_grid_coordinates(self.potential_data['origin'],
+                                                        self.potential_data['grid_info'])
+                dens_axes = self.create_grid_coordinates(self.density_data['origin'],
+                                                         self.density_data['grid_info'])
+                wx = self._axis_weights(pot_axes[0], dens_axes[0])
+            
+            block = max(1, slab_bytes // (ny * nz * _CUBE_STREAM_BYTES_PER_POINT) - 2 * margin)
+            self._print(f"每块 {block} 个平面，掩膜额外读取 {margin} 个相邻平面")
+            
+            self.write_cube_header(out_f, self.density_data)
+            writer = CubeRowWriter(self, out_f)
+            for start in range(0, nx, block):
+                stop = min(start + block, nx)
+                with stage('slab', start=start, stop=stop,
+                           grid_points=(stop - start) * ny * nz) as record:
+                    if interpolate:
+                        lo = int(wx[0][start:stop].min())
+                        hi = int(wx[1][start:stop].max()) + 1
+                        values = self._interpolate_trilinear(
+                            (pot_axes[0][lo:hi], pot_axes[1], pot_axes[2]),
+                            potential.get(lo, hi),
+                            (dens_axes[0][start:stop], dens_axes[1], dens_axes[2])
+                        )
+                    else:
+                        values = potential.get(start, stop)
+                    
+                    if apply_mask:
+                        lo = max(0, start - margin)
+                        hi = min(nx, stop + margin)
+                        mask = self._isosurface_mask_edt(search_radius, mask_mode,
+                                                         density.get(lo, hi))
+                        values = np.where(mask[start - lo:stop - lo], values, 0.0)
+                        record['mask_points'] = int(np.count_nonzero(mask[start - lo:stop - lo]))
+                    writer.write(values)
+            
+            writer.finish()
+        
+        self._print(f"cub文件写入完成: {output_file}")
+        return output_file
+
+
+class CubeRowWriter:
+    """把按顺序产生的数据块接续写成cub格点数据
+
+    每行6个值，块的大小不必是6的倍数：不满一行的部分留到下一块，
+    finish() 写出最后剩下的不满一行的部分。与 read_cube_header、
+    iter_cube_planes 和 write_cube_header 一起用于分块读写cub文件：
+
+        processor.write_cube_header(f, header)
+        writer = CubeRowWriter(processor, f)
+        for block in blocks:
+            writer.write(block)
+        writer.finish()
+    """
+    
+    def __init__(self, processor, f):
+        self.processor = processor
+        self.f = f
+        self.pending = np.empty(0, dtype=processor.dtype)
+    
+    def write(self, values):
+        flat = np.concatenate([self.pending, np.ravel(values)])
+        nfull = len(flat) // 6 * 6
+        self.processor._write_cube_data_numpy(self.f, flat[:nfull])
+        self.pending = flat[nfull:]
+    
+    def finish(self):
+        self.processor._write_cube_data_numpy(self.f, self.pending)
+        self.pending = self.pending[:0]
+
+
+class _PlaneWindow:
+    """在按顺序产生的平面序列上维护一个滑动窗口
+
+    get(start, stop) 返回第 start 到 stop-1 个平面组成的数组；
+    start 之前的平面随即被丢弃，因此 start 必须单调不减。
+    """
+
+    def __init__(self, planes):
+        self._planes = iter(planes)
+        self._buffer = []
+        self._offset = 0
+
+    def get(self, start, stop):
+        if start < self._offset:
+            raise ValueError("平面必须按顺序读取")
+        skip = start - self._offset
+        for _ in range(skip - len(self._buffer)):
+            next(self._planes)
+        del self._buffer[:skip]
+        self._offset = start
+        while self._offset + len(self._buffer) < stop:
+            self._buffer.append(next(self._planes))
+        return np.stack(self._buffer[:stop - start])
+
 
 # 简化使用函数
 def interpolate_cube_potential(density_file, potential_file, output_file, 
-                              search_radius=0.3, apply_mask=True):
-    """简化接口：将势能cub文件插值到密度网格"""
-    processor = CubeFileInterpolator()
+                              search_radius=0.3, apply_mask=True, narrow_band=True,
+                              mask_mode='filled', compresslevel=None,
+                              use_cache=False, cache_dir=CUBE_CACHE_DIR,
+                              cache_max_bytes=CUBE_CACHE_MAX_BYTES,
+                              invalidate_cache=False, quiet=False, metrics_file=None,
+                              dtype='float64'):
+    """简化接口：将势能cub文件插值到密度网格
+
+    use_cache=True 时启用 CubeCache；invalidate_cache=True 会先丢弃
+    两个输入文件已有的缓存条目，强制重新解析。
+    quiet=True 时不打印进度；metrics_file 不为 None 时把各阶段的记录
+    以 JSON Lines 格式追加到该文件。
+    dtype='float32' 时整个流程使用单精度，内存减半，写出的结果在cub文件的
+    精度（6位有效数字）内不变。
+    网格太大、结果数组放不进内存时改用 interpolate_cube_potential_slabs。
+    """
+    cache = None
+    if use_cache:
+        cache = CubeCache(cache_dir, max_bytes=cache_max_bytes)
+        if invalidate_cache:
+            cache.invalidate(density_file)
+            cache.invalidate(potential_file)
+    hooks = [JSONLinesSink(metrics_file)] if metrics_file else None
+    processor = CubeFileInterpolator(cache=cache, quiet=quiet,
+                                     instrumentation=Instrumentation(hooks), dtype=dtype)
     
     try:
         result = processor.process(
@@ -310,7 +1341,10 @@ def interpolate_cube_potential(density_file, potential_file, output_file,
             potential_file, 
             output_file,
             search_radius=search_radius,
-            apply_mask=apply_mask
+            apply_mask=apply_mask,
+            narrow_band=narrow_band,
+            mask_mode=mask_mode,
+            compresslevel=compresslevel
         )
         return result
     except Exception as e:
@@ -320,6 +1354,71 @@ def interpolate_cube_potential(density_file, potential_file, output_file,
         return None
 
 
+def interpolate_cube_potential_slabs(density_file, potential_file, output_file,
+                                    search_radius=0.3, apply_mask=True, mask_mode='filled',
+                                    compresslevel=None, slab_bytes=CUBE_STREAM_SLAB_BYTES,
+                                    quiet=False, metrics_file=None, dtype='float64'):
+    """简化接口：按 slab_bytes 的内存预算分块流式处理，见 process_slabs
+
+    不使用缓存，不做窄带插值，结果直接写到 output_file 而不返回数组。
+    成功时返回 output_file，出错时返回 None。
+    """
+    hooks = [JSONLinesSink(metrics_file)] if metrics_file else None
+    processor = CubeFileInterpolator(quiet=quiet, instrumentation=Instrumentation(hooks),
+                                     dtype=dtype)
+    try:
+        return processor.process_slabs(
+            density_file, potential_file, output_file,
+            search_radius=search_radius, apply_mask=apply_mask, mask_mode=mask_mode,
+            slab_bytes=slab_bytes, compresslevel=compresslevel
+        )
+    except Exception as e:
+        print(f"处理过程中出现错误: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+def interpolate_cube_fields(density_file, field_files, output_files, search_radius=0.3,
+                            apply_mask=True, mask_mode='filled', compresslevel=None,
+                            plan_cache_dir=None, quiet=False, dtype='float64'):
+    """把多个性质cub文件（ESP、ALIE、LEA 等）映射到同一个密度网格上
+
+    共享源网格的文件只构建一次插值计划并批量插值，见 interpolate_fields；
+    plan_cache_dir 不为 None 时插值计划保存到该目录，供以后的运行复用。
+    apply_mask=True 时所有结果使用同一个等密度表面掩膜。dtype 见 CUBE_DTYPES。
+    返回结果数组的列表。
+    """
+    if len(field_files) != len(output_files):
+        raise ValueError("性质文件与输出文件的个数不一致")
+    processor = CubeFileInterpolator(quiet=quiet, dtype=dtype,
+                                     plan_cache=InterpolationPlanCache(cache_dir=plan_cache_dir))
+    processor.density_data = processor.read_cube_file(density_file)
+    fields = [processor.read_cube_file(filename) for filename in field_files]
+    
+    results = processor.interpolate_fields(fields)
+    if apply_mask:
+        mask = processor.create_isosurface_mask(search_radius, mode=mask_mode)
+        results = [processor.apply_isosurface_mask(values, mask) for values in results]
+    
+    for values, output_file in zip(results, output_files):
+        processor.write_cube_file(values, output_file, processor.density_data,
+                                  compresslevel=compresslevel)
+    return results
+
+
+def clip_cube_file(input_file, output_file, lower, upper, compresslevel=None):
+    """把cub文件的格点值截断到 [lower, upper] 后写出
+
+    超出范围的值被设为对应的上下限，其余格点和文件头原样保留。
+    """
+    processor = CubeFileInterpolator(quiet=True)
+    cube = processor.read_cube_file(input_file)
+    data = np.clip(cube['data'], lower, upper, out=cube['data'])
+    processor.write_cube_file(data, output_file, cube, compresslevel=compresslevel)
+    return data
+
+
 # 使用示例
 if __name__ == "__main__":
     # 替换为你的实际文件路径
@@ -0,0 +1,133 @@
+import re
+
+# 元素符号，下标为原子序数
+ELEMENTS = (
+    'Bq', 'H', 'He',
+    'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne',
+    'Na', 'Mg', 'Al', 'Si', 'P', 'S', 'Cl', 'Ar',
+    'K', 'Ca', 'Sc', 'Ti', 'V', 'Cr', 'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn',
+    'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr',
+    'Rb', 'Sr', 'Y', 'Zr', 'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd',
+    'In', 'Sn', 'Sb', 'Te', 'I', 'Xe',
+    'Cs', 'Ba', 'La', 'Ce', 'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er',
+    'Tm', 'Yb', 'Lu', 'Hf', 'Ta', 'W', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg',
+    'Tl', 'Pb', 'Bi', 'Po', 'At', 'Rn',
+    'Fr', 'Ra', 'Ac', 'Th', 'Pa', 'U', 'Np', 'Pu', 'Am', 'Cm', 'Bk', 'Cf', 'Es', 'Fm',
+    'Md', 'No', 'Lr', 'Rf', 'Db', 'Sg', 'Bh', 'Hs', 'Mt', 'Ds', 'Rg', 'Cn',
+    'Nh', 'Fl', 'Mc', 'Lv', 'Ts', 'Og',
+)
+
+# 向后扫描 Gaussian 输出文件时每次读取的字节数
+LOG_SCAN_BLOCK_SIZE = 1 << 20
+
+# 与 Multiwfn 的 oi 功能写出、再把关键词改为 xtb2 opt 后的 ORCA 输入文件格式一致
+ORCA_INPUT_TEMPLATE = """! {keywords}
+%maxcore{maxcore:9d}
+%pal nprocs{nprocs:4d} end
+* xyz{charge:4d}{multiplicity:4d}
+{atoms}*
+"""
+
+_ORIENTATION_MARKERS = (b'Standard orientation:', b'Input orientation:')
+_CHARGE_PATTERN = re.compile(r'Charge\s*=\s*(-?\d+)\s+Multiplicity\s*=\s*(\d+)')
+
+
+class Geometry:
+    """分子结构：元素符号、笛卡尔坐标（埃）、电荷和自旋多重度"""
+
+    def __init__(self, symbols, coords, charge=0, multiplicity=1):
+        self.symbols = symbols
+        self.coords = coords
+        self.charge = charge
+        self.multiplicity = multiplicity
+
+
+def read_gaussian_geometry(filename, block_size=LOG_SCAN_BLOCK_SIZE):
+    """从 Gaussian 输出文件中读取最后一个结构，不启动 Multiwfn
+
+    从文件末尾向前按块扫描最后一个 "Standard orientation" 表
+    （文件中没有时使用最后一个 "Input orientation"），内存占用只有一个块；
+    电荷和自旋多重度从文件开头的 "Charge = ... Multiplicity = ..." 行读取。
+    找不到结构时返回 None。
+    """
+    offset = _find_last_orientation(filename, block_size)
+    if offset is None:
+        return None
+
+    symbols, coords = [], []
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        # 标题行之后：分隔线、两行表头、分隔线，然后是原子行，直到下一条分隔线
+        f.readline()
+        dashes = 0
+        for line in f:
+            if line.strip().startswith(b'---'):
+                dashes += 1
+                if dashes == 3:
+                    break
+                continue
+            if dashes == 2:
+                fields = line.split()
+                try:
+                    atomic_number = int(fields[1])
+                    coords.append(tuple(float(x) for x in fields[-3:]))
+                except (IndexError, ValueError):
+                    # 表格不完整（例如计算中途被终止）
+                    return None
+                symbols.append(ELEMENTS[atomic_number] if atomic_number < len(ELEMENTS)
+                               else 'X')
+    if dashes < 3 or not symbols:
+        return None
+
+    charge, multiplicity = _read_charge_multiplicity(filename)
+    return Geometry(symbols, coords, charge, multiplicity)
+
+
+def _find_last_orientation(filename, block_size):
+    """返回最后一个结构表标题在文件中的字节偏移，优先 Standard orientation"""
+    overlap = max(len(marker) for marker in _ORIENTATION_MARKERS) - 1
+    input_offset = None
+    with open(filename, 'rb') as f:
+        end = f.seek(0, 2)
+        tail = b''
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            # 拼上后一块开头的几个字节，避免标题被块边界切开
+            block = f.read(end - start) + tail
+            position = block.rfind(_ORIENTATION_MARKERS[0])
+            if position >= 0:
+                return start + position
+            if input_offset is None:
+                position = block.rfind(_ORIENTATION_MARKERS[1])
+                if position >= 0:
+                    input_offset = start + position
+            tail = block[:overlap]
+            end = start
+    return input_offset
+
+
+def _read_charge_multiplicity(filename):
+    """读取电荷和自旋多重度，只扫描到第一个结构表为止；找不到时返回 (0, 1)"""
+    with open(filename, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = _CHARGE_PATTERN.search(line)
+            if match:
+                return int(match.group(1)), int(match.group(2))
+            if 'orientation:' in line:
+                break
+    return 0, 1
+
+
+def format_orca_input(geometry, keywords='xtb2 opt', nprocs=4, maxcore=1000):
+    """按 ORCA_INPUT_TEMPLATE 生成 ORCA 输入文件的内容"""
+    atoms = ''.join(f"{symbol:<2s}{x:15.8f}{y:14.8f}{z:14.8f}\n"
+                    for symbol, (x, y, z) in zip(geometry.symbols, geometry.coords))
+    return ORCA_INPUT_TEMPLATE.format(keywords=keywords, maxcore=maxcore, nprocs=nprocs,
+                                      charge=geometry.charge,
+                                      multiplicity=geometry.multiplicity, atoms=atoms)
+
+
+def write_orca_input(filename, geometry, keywords='xtb2 opt', nprocs=4, maxcore=1000):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(format_orca_input(geometry, keywords, nprocs, maxcore))
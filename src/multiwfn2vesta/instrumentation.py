@@ -0,0 +1,120 @@
+import contextlib
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class Instrumentation:
+    """分阶段的耗时与内存记录
+
+    每个阶段结束时生成一条记录（dict），依次传给所有 hook。记录至少包含
+    stage、start（Unix 时间戳）、elapsed（秒）和 rss_delta_mb（本阶段使进程最大
+    常驻内存增长了多少）；trace_memory=True 且注册了 hook 时另外用 tracemalloc
+    记录本阶段的分配峰值 peak_alloc_mb（numpy 数组也计入），峰值在阶段开始时清零，
+    并发执行的阶段共用同一个峰值。阶段内可以往记录里补充字节数、格点数等字段。
+    构造时传入的其余关键字参数会附加到每条记录上，便于区分不同批次。
+
+    Args:
+        hooks: hook(record) 的列表，例如 JSONLinesSink
+        trace_memory: 是否用 tracemalloc 记录分配峰值；跟踪期间整个进程的内存分配
+            都会变慢数倍，默认关闭
+    """
+
+    def __init__(self, hooks=None, trace_memory=False, **context):
+        self.hooks = list(hooks or [])
+        self.trace_memory = trace_memory
+        self.context = context
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        """记录一个阶段，yield 出的记录可以在阶段内补充字段
+
+        阶段抛出异常时记录 error 字段后照常发出，再把异常继续抛出。
+        """
+        record = dict(self.context, stage=name, **fields)
+        # 没有 hook 时记录会被丢弃，不必付出跟踪的开销
+        trace = self.trace_memory and bool(self.hooks)
+        if trace:
+            _start_tracing()
+        rss_start = peak_rss_mb()
+
+        record['start'] = time.time()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record['elapsed'] = time.perf_counter() - start
+            record['rss_delta_mb'] = peak_rss_mb() - rss_start
+            if trace:
+                record['peak_alloc_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+                _stop_tracing()
+            self.emit(record)
+
+    def emit(self, record):
+        for hook in self.hooks:
+            hook(record)
+
+
+# 正在使用 tracemalloc 的阶段数，以及跟踪是否由这里开启（外部开启的不由这里停止）
+_tracing = {'users': 0, 'owned': False}
+_tracing_lock = threading.Lock()
+
+
+def _start_tracing():
+    with _tracing_lock:
+        if _tracing['users'] == 0:
+            _tracing['owned'] = not tracemalloc.is_tracing()
+            if _tracing['owned']:
+                tracemalloc.start()
+        _tracing['users'] += 1
+        tracemalloc.reset_peak()
+
+
+def _stop_tracing():
+    with _tracing_lock:
+        _tracing['users'] -= 1
+        if _tracing['users'] == 0 and _tracing['owned']:
+            tracemalloc.stop()
+
+
+class JSONLinesSink:
+    """把记录逐行追加为 JSON 的 hook，可在多个线程间共享"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=_to_json)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def peak_rss_mb(children=False):
+    """进程（children=True 时为已结束子进程中最大者）至今的最大常驻内存（MB）"""
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _to_json(value):
+    """numpy 标量、元组形状等 json 不能直接序列化的值"""
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
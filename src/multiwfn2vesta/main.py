@@ -1,23 +1,56 @@
 # main.py - 主入口点
 import argparse
+import json
+import logging
 from pathlib import Path
 from multiwfn2vesta import MultiwfnController, VestaController, BatchProcessor
+from multiwfn2vesta.batch import BATCH_QUEUE_SIZE, format_batch_stats
+from multiwfn2vesta.instrumentation import Instrumentation, JSONLinesSink
+from multiwfn2vesta.multiwfn_controller import GRID_TYPES
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Multiwfn-VESTA Interface')
     parser.add_argument('input_files', nargs='+', help='Input files for Multiwfn')
     parser.add_argument('--multiwfn-path', default='Multiwfn', help='Path to Multiwfn executable')
     parser.add_argument('--vesta-path', default='vesta', help='Path to VESTA executable')
     parser.add_argument('--config', help='Configuration file')
-    args = parser.parse_args()
-    
+    parser.add_argument('--grid-type', nargs='+', default=['electron'], choices=sorted(GRID_TYPES),
+                        help='格点类型；同时给出 electron 和 esp 时输出掩膜后的静电势')
+    parser.add_argument('--output-dir', default='output', help='输出目录')
+    parser.add_argument('--nprocs', type=int, default=None, help='Multiwfn 总线程数')
+    parser.add_argument('--multiwfn-jobs', type=int, default=1, help='同时运行的 Multiwfn 数')
+    parser.add_argument('--postprocess-jobs', type=int, default=1, help='同时进行的cub后处理数')
+    parser.add_argument('--render-jobs', type=int, default=1, help='同时运行的 VESTA 数')
+    parser.add_argument('--queue-size', type=int, default=BATCH_QUEUE_SIZE,
+                        help='相邻阶段之间的队列长度')
+    parser.add_argument('--metrics-file', help='把每个阶段的记录追加到该 JSON Lines 文件')
+    args = parser.parse_args(argv)
+
+    # 配置文件（JSON）中的键与命令行选项同名，命令行给出的值优先
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        parser.set_defaults(**{key.replace('-', '_'): value for key, value in config.items()})
+        args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    hooks = [JSONLinesSink(args.metrics_file)] if args.metrics_file else None
+    instrumentation = Instrumentation(hooks)
+
     # 初始化控制器
-    multiwfn = MultiwfnController(args.multiwfn_path)
+    multiwfn = MultiwfnController(args.multiwfn_path, total_cores=args.nprocs,
+                                  max_jobs=args.multiwfn_jobs, instrumentation=instrumentation)
     vesta = VestaController(args.vesta_path)
-    processor = BatchProcessor(multiwfn, vesta)
-    
+    processor = BatchProcessor(multiwfn, vesta, output_dir=args.output_dir,
+                               grid_types=args.grid_type,
+                               postprocess_jobs=args.postprocess_jobs,
+                               render_jobs=args.render_jobs, queue_size=args.queue_size,
+                               instrumentation=instrumentation)
+
     # 处理文件
-    processor.process_files(args.input_files)
+    results = processor.process_files([str(Path(f)) for f in args.input_files])
+    print(format_batch_stats(processor.stats))
+    return 0 if all(images is not None for images in results.values()) else 1
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    raise SystemExit(main())
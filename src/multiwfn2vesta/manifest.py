@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+# 构建清单的默认文件名
+MANIFEST_FILE = ".multiwfn2vesta_manifest.json"
+# 清单格式版本，格式变化时旧清单整体失效
+MANIFEST_VERSION = 1
+
+
+class BuildManifest:
+    """增量计算的构建清单
+
+    为每个任务记录一个键（输入文件内容哈希 + 全部命令序列 + 后处理方式 + Multiwfn 版本）
+    以及输出文件的大小和修改时间。再次运行时键相同且输出文件未被改动的任务
+    视为最新，可以跳过。每完成一个任务就原子地写回清单，中途中断的运行
+    只会重算尚未记录的任务。
+    """
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        # {绝对路径: [大小, 修改时间, 哈希]}，文件未变时避免重复计算哈希
+        self.hashes = {}
+        self.load()
+
+    def load(self):
+        """读取清单文件，文件不存在或损坏时从空清单开始"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != MANIFEST_VERSION:
+            return
+        self.entries = data.get("entries", {})
+        self.hashes = data.get("hashes", {})
+
+    def save(self):
+        """原子地写回清单文件"""
+        with self._lock:
+            data = {"version": MANIFEST_VERSION, "entries": self.entries, "hashes": self.hashes}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def file_hash(self, filename):
+        """计算文件内容的 SHA-256，大小和修改时间未变时直接使用记录的值"""
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        with self._lock:
+            cached = self.hashes.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        with self._lock:
+            self.hashes[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def job_key(self, job, version):
+        """任务的键：输入内容、全部步骤的命令序列、后处理方式和 Multiwfn 版本"""
+        digest = hashlib.sha256()
+        digest.update(self.file_hash(job.input_file).encode())
+        digest.update(json.dumps(job.steps, ensure_ascii=False).encode())
+        digest.update(str(getattr(job.postprocess, "key", None)).encode())
+        digest.update(str(version).encode())
+        return digest.hexdigest()
+
+    def is_up_to_date(self, job, key):
+        """任务的键与记录一致，且所有输出文件仍是当时写出的那些"""
+        with self._lock:
+            entry = self.entries.get(job.name)
+        if entry is None or entry["key"] != key:
+            return False
+        for destination in job.outputs.values():
+            recorded = entry["outputs"].get(destination)
+            if recorded is None or _file_stat(destination) != recorded:
+                return False
+        return True
+
+    def record(self, job, key):
+        """记录一个成功完成的任务并写回清单"""
+        outputs = {destination: _file_stat(destination) for destination in job.outputs.values()}
+        with self._lock:
+            self.entries[job.name] = {"key": key, "outputs": outputs}
+        self.save()
+
+    def forget(self, job):
+        """删除任务的记录，使其下次必定重算"""
+        with self._lock:
+            removed = self.entries.pop(job.name, None)
+        if removed is not None:
+            self.save()
+
+
+def multiwfn_version(multiwfn_path="Multiwfn"):
+    """读取 Multiwfn 启动信息中的版本号和更新日期
+
+    无法运行或解析时退回到可执行文件的路径、大小和修改时间。
+    """
+    executable = shutil.which(multiwfn_path) or multiwfn_path
+    try:
+        result = subprocess.run([executable], input="q\n", capture_output=True,
+                                text=True, timeout=30)
+        match = re.search(r"Version\s+(\S+),\s*update date:\s*(\S+)", result.stdout)
+        if match:
+            return f"{match.group(1)} {match.group(2)}"
+    except (OSError, subprocess.SubprocessError):
+        pass
+
+    logging.warning("无法读取 Multiwfn 版本号，使用可执行文件信息代替")
+    try:
+        stat = os.stat(executable)
+        return f"{os.path.abspath(executable)}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        return "unknown"
+
+
+def _file_stat(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
@@ -3,31 +3,42 @@ import re
 import subprocess
 from pathlib import Path
 
+from multiwfn2vesta.geometry import read_gaussian_geometry, write_orca_input
+
+# 主功能 5 中各格点类型的函数编号，以及 Multiwfn 在当前目录导出的cub文件名
+GRID_TYPES = {
+    'electron': ('1', 'density.cub'),
+    'spin': ('5', 'spindensity.cub'),
+    'esp': ('12', 'totesp.cub'),
+    'elf': ('9', 'ELF.cub'),
+    'lol': ('10', 'LOL.cub'),
+}
+# 格点质量：1 低，2 中，3 高
+GRID_QUALITY = "2"
+# MultiwfnController 默认把 Multiwfn 的输出追加到输出目录中的该文件
+MULTIWFN_LOG = "Multiwfn_out.log"
+
 # 更面向对象的实现方式
 class QuantumFileProcessor:
-    def __init__(self, nprocs: int = 4, maxcore: int = 1000):
+    def __init__(self, nprocs: int = 4, maxcore: int = 1000, native: bool = True):
         self.nprocs = nprocs
         self.maxcore = maxcore
+        # 直接解析 Gaussian 输出文件，失败时才调用 Multiwfn
+        self.native = native
     
     def process_file(self, inf: str, file_extension: str = "log") -> bool:
         """处理单个文件"""
         print(f"Getting the structure from {inf}")
         
         # 生成输出文件名
-        output_file = inf.replace(f'.{file_extension}', '_preopt.inp')
-        
-        # Multiwfn 输入命令序列
-        commands = [
-            "oi",                           # 选择 Orbital Information
-            output_file,                    # 输出文件名
-            "-10",                          # 退出 Orbital Information
-            str(self.nprocs),               # 进程数
-            str(self.maxcore),              # 内存大小
-            "1",                            # 确认并执行
-            "q"                             # 退出 Multiwfn
-        ]
-        
-        input_content = "\n".join(commands) + "\n"
+        output_file = self._output_filename(inf, file_extension)
+        if self.native and self._process_native(inf, output_file):
+            return True
+        return self._process_multiwfn(inf, output_file)
+    
+    def _process_multiwfn(self, inf: str, output_file: str) -> bool:
+        """用 Multiwfn 的 oi 功能生成 ORCA 输入文件"""
+        input_content = "\n".join(self._build_commands(output_file)) + "\n"
         
         # 执行 Multiwfn
         try:
@@ -55,6 +66,37 @@ class QuantumFileProcessor:
         # 修改生成的文件
         return self._modify_output_file(output_file)
     
+    def _process_native(self, inf: str, output_file: str) -> bool:
+        """不启动 Multiwfn，直接从 Gaussian 输出文件生成 ORCA 输入文件"""
+        try:
+            geometry = read_gaussian_geometry(inf)
+        except OSError as e:
+            print(f"读取文件时出错: {e}")
+            return False
+        if geometry is None:
+            print(f"未找到结构，改用 Multiwfn: {inf}")
+            return False
+        
+        write_orca_input(output_file, geometry, nprocs=self.nprocs, maxcore=self.maxcore)
+        print(f"已生成文件: {output_file}")
+        return True
+    
+    def _output_filename(self, inf: str, file_extension: str = "log") -> str:
+        """生成 ORCA 输入文件名"""
+        return inf.replace(f'.{file_extension}', '_preopt.inp')
+    
+    def _build_commands(self, output_file: str) -> list:
+        """Multiwfn 输入命令序列"""
+        return [
+            "oi",                           # 选择 Orbital Information
+            output_file,                    # 输出文件名
+            "-10",                          # 退出 Orbital Information
+            str(self.nprocs),               # 进程数
+            str(self.maxcore),              # 内存大小
+            "1",                            # 确认并执行
+            "q"                             # 退出 Multiwfn
+        ]
+    
     def _modify_output_file(self, filename: str) -> bool:
         """修改输出文件内容"""
         try:
@@ -84,8 +126,13 @@ class QuantumFileProcessor:
             print(f"修改文件时出错: {e}")
             return False
     
-    def process_multiple_files(self, file_pattern: str = "*.log"):
-        """批量处理多个文件"""
+    def process_multiple_files(self, file_pattern: str = "*.log", max_jobs: int = 1,
+                               total_cores: int = 1, scratch_root: str = None):
+        """批量处理多个文件
+        
+        max_jobs > 1 时通过 MultiwfnScheduler 在各自的临时目录中并行运行，
+        total_cores 平均分给各任务作为 Multiwfn 的 -nt 线程数。
+        """
         import glob
         
         files = glob.glob(file_pattern)
@@ -93,13 +140,130 @@ class QuantumFileProcessor:
             print(f"找不到匹配的文件: {file_pattern}")
             return
         
+        total = len(files)
         success_count = 0
+        if self.native:
+            # 解析失败的文件再交给 Multiwfn
+            remaining = []
+            for file in files:
+                if self._process_native(file, self._output_filename(file)):
+                    success_count += 1
+                else:
+                    remaining.append(file)
+            files = remaining
+        
+        if max_jobs > 1 and files:
+            success_count += self._process_parallel(files, max_jobs, total_cores, scratch_root)
+        else:
+            for file in files:
+                print(f"\n处理文件: {file}")
+                if self._process_multiwfn(file, self._output_filename(file)):
+                    success_count += 1
+        
+        print(f"\n处理完成: {success_count}/{total} 个文件成功")
+    
+    def _process_parallel(self, files: list, max_jobs: int, total_cores: int,
+                          scratch_root: str = None) -> int:
+        """并行处理多个文件，返回成功的文件数"""
+        from multiwfn2vesta.MultiwfnRunner import MultiwfnRunner
+        from multiwfn2vesta.scheduler import MultiwfnJob, MultiwfnScheduler
+        
+        jobs = []
         for file in files:
-            print(f"\n处理文件: {file}")
-            if self.process_file(file):
+            output_file = self._output_filename(file)
+            scratch_output = os.path.basename(output_file)
+            jobs.append(MultiwfnJob(
+                file,
+                steps=[(None, self._build_commands(scratch_output))],
+                outputs={scratch_output: output_file},
+            ))
+        
+        scheduler = MultiwfnScheduler(MultiwfnRunner(), total_cores=total_cores,
+                                      max_jobs=max_jobs, scratch_root=scratch_root)
+        results = scheduler.run(jobs)
+        
+        success_count = 0
+        for job in jobs:
+            if not results[job.name]:
+                print(f"处理失败: {job.name}")
+                continue
+            if self._modify_output_file(self._output_filename(job.name)):
                 success_count += 1
+        return success_count
+
+
+class MultiwfnController:
+    """用 Multiwfn 主功能 5 计算格点数据
+    
+    一个输入文件的所有格点类型在同一次 Multiwfn 运行中依次计算（波函数只载入一次），
+    任务在自己的临时目录中运行，导出的cub文件原子地移动到目标路径，见 MultiwfnScheduler。
+    max_jobs 是允许同时运行的 Multiwfn 进程数，total_cores 平均分给它们。
+    Multiwfn 的输出追加到 log_file；log_file 为 None 时追加到每次 generate_grids
+    输出目录中的 MULTIWFN_LOG，不会写到当前目录。
+    """
+    
+    def __init__(self, multiwfn_path: str = "Multiwfn", total_cores: int = None,
+                 max_jobs: int = 1, grid_quality: str = GRID_QUALITY,
+                 scratch_root: str = None, instrumentation=None, log_file: str = None):
+        from multiwfn2vesta.MultiwfnRunner import MultiwfnRunner
+        from multiwfn2vesta.scheduler import MultiwfnScheduler
+        
+        self.grid_quality = grid_quality
+        self.log_file = log_file
+        self.runner = MultiwfnRunner(multiwfn_path, instrumentation)
+        self.scheduler = MultiwfnScheduler(self.runner, total_cores=total_cores,
+                                           max_jobs=max_jobs, scratch_root=scratch_root,
+                                           log_file=log_file)
+    
+    @property
+    def max_jobs(self) -> int:
+        return self.scheduler.max_jobs
+    
+    def _build_commands(self, grid_type: str) -> list:
+        """计算一种格点并导出cub文件，最后回到主菜单"""
+        if grid_type not in GRID_TYPES:
+            raise ValueError(f"未知的格点类型: {grid_type}")
+        function, _ = GRID_TYPES[grid_type]
+        return [
+            "5",                            # 计算格点数据
+            function,                       # 实空间函数
+            self.grid_quality,              # 格点质量
+            "2",                            # 导出cub文件到当前目录
+            "0",                            # 回到主菜单
+        ]
+    
+    def grid_job(self, input_file: str, outputs: dict, log_file: str = None):
+        """构建格点任务，outputs 为 {格点类型: 输出cub文件路径}"""
+        from multiwfn2vesta.scheduler import MultiwfnJob
+        
+        commands = []
+        for grid_type in outputs:
+            commands.extend(self._build_commands(grid_type))
+        return MultiwfnJob(
+            input_file,
+            steps=[(None, commands)],
+            outputs={GRID_TYPES[grid_type][1]: output
+                     for grid_type, output in outputs.items()},
+            log_file=log_file,
+        )
+    
+    def generate_grids(self, input_file: str, grid_types=("electron",),
+                       output_dir: str = None):
+        """计算格点数据，返回 {格点类型: cub文件路径}；失败时返回 None
+        
+        输出文件为 {output_dir}/{输入文件名}_{格点类型}.cub，
+        output_dir 为 None 时与输入文件在同一目录。
+        """
+        base = os.path.splitext(os.path.basename(input_file))[0]
+        directory = output_dir if output_dir is not None else os.path.dirname(input_file)
+        outputs = {grid_type: os.path.join(directory, f"{base}_{grid_type}.cub")
+                   for grid_type in grid_types}
         
-        print(f"\n处理完成: {success_count}/{len(files)} 个文件成功")
+        log_file = self.log_file or os.path.join(directory, MULTIWFN_LOG)
+        job = self.grid_job(input_file, outputs, log_file)
+        if not self.scheduler.run([job])[job.name]:
+            return None
+        return outputs
 
 
 # 使用示例
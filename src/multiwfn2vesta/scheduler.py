@@ -0,0 +1,155 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MultiwfnJob:
+    """一个在独立临时目录中运行的 Multiwfn 任务
+
+    Args:
+        input_file: 波函数等输入文件路径，会以同名链接（或复制）到临时目录中
+        steps: [(输入文件名, 命令列表), ...]，输入文件名为 None 时使用 input_file；
+            后续步骤可以使用前面步骤在临时目录中生成的文件
+        outputs: {临时目录中的文件名: 目标路径}，任务结束后原子地移动回来
+        name: 任务名，默认为 input_file
+        postprocess: 可选，所有步骤成功后以临时目录为参数调用，返回真值表示成功；
+            其 key 属性参与增量计算的键
+        log_file: 本任务的 Multiwfn 日志追加到的文件，默认使用调度器的 log_file
+    """
+
+    def __init__(self, input_file, steps, outputs, name=None, postprocess=None,
+                 log_file=None):
+        self.input_file = input_file
+        self.steps = steps
+        self.outputs = outputs
+        self.name = name or input_file
+        self.postprocess = postprocess
+        self.log_file = log_file
+
+
+class MultiwfnScheduler:
+    """并行 Multiwfn 任务调度器
+
+    每个任务在 scratch_root 下自己的临时目录中运行，因此 func1.cub、
+    output.txt 等固定文件名不会互相覆盖。同时运行 max_jobs 个任务，
+    total_cores 个核心平均分给各个任务作为 Multiwfn 的 -nt 线程数。
+    """
+
+    def __init__(self, runner, total_cores=None, max_jobs=1, scratch_root=None,
+                 log_file="Multiwfn_out.log", keep_scratch=False):
+        self.runner = runner
+        self.total_cores = total_cores or os.cpu_count() or 1
+        self.max_jobs = max(1, max_jobs)
+        self.scratch_root = scratch_root
+        self.log_file = log_file
+        self.keep_scratch = keep_scratch
+        self._log_lock = threading.Lock()
+
+    @property
+    def threads_per_job(self):
+        """每个任务分到的 Multiwfn 线程数"""
+        return max(1, self.total_cores // self.max_jobs)
+
+    def run(self, jobs, on_complete=None):
+        """运行所有任务，返回 {任务名: 是否成功}
+
+        on_complete(job, ok) 在每个任务结束、输出文件移动完成后立即调用
+        （在工作线程中），可用于逐个记录进度。
+        """
+        jobs = list(jobs)
+        logging.info(f"并行运行 {len(jobs)} 个任务: {self.max_jobs} 个并发, "
+                     f"每个任务 {self.threads_per_job} 线程")
+
+        def run_one(job):
+            ok = self._run_job(job)
+            if on_complete is not None:
+                on_complete(job, ok)
+            return ok
+
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as executor:
+            results = list(executor.map(run_one, jobs))
+
+        return {job.name: ok for job, ok in zip(jobs, results)}
+
+    def _run_job(self, job):
+        workdir = tempfile.mkdtemp(prefix="multiwfn_", dir=self.scratch_root)
+        try:
+            input_name = os.path.basename(job.input_file)
+            _link_or_copy(job.input_file, os.path.join(workdir, input_name))
+
+            ok = True
+            for step_input, commands in job.steps:
+                # 与 IRI() 一致：run_commands 返回真值表示失败
+                if self.runner.run_commands(step_input or input_name, commands,
+                                            nproc=self.threads_per_job, cwd=workdir):
+                    logging.error(f"任务步骤失败: {job.name}")
+                    ok = False
+                    break
+
+            if ok and job.postprocess is not None and not job.postprocess(workdir):
+                logging.error(f"任务后处理失败: {job.name}")
+                ok = False
+
+            for scratch_name, destination in job.outputs.items():
+                source = os.path.join(workdir, scratch_name)
+                if os.path.exists(source):
+                    _atomic_move(source, destination)
+                else:
+                    logging.error(f"任务未生成输出文件 {scratch_name}: {job.name}")
+                    ok = False
+
+            self._collect_log(workdir, job.log_file or self.log_file)
+            return ok
+
+        except OSError as e:
+            logging.error(f"任务 {job.name} 文件操作失败: {e}")
+            return False
+
+        finally:
+            if not self.keep_scratch:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    def _collect_log(self, workdir, log_file):
+        """把临时目录中的 Multiwfn 日志追加到共享日志文件"""
+        scratch_log = os.path.join(workdir, "Multiwfn_out.log")
+        if not log_file or not os.path.exists(scratch_log):
+            return
+        with self._log_lock:
+            with open(scratch_log, "rb") as src, open(log_file, "ab") as dst:
+                shutil.copyfileobj(src, dst)
+
+
+def _link_or_copy(source, destination):
+    """把输入文件放进临时目录：优先使用符号链接，不支持时复制"""
+    try:
+        os.symlink(os.path.abspath(source), destination)
+    except (OSError, NotImplementedError):
+        shutil.copy2(source, destination)
+
+
+def _atomic_move(source, destination):
+    """原子地把文件移动到目标路径（强制覆盖）
+
+    同一文件系统上直接 os.replace；跨文件系统时先复制到目标目录中的
+    临时文件，再 os.replace，保证目标路径上不会出现写了一半的文件。
+    """
+    try:
+        os.replace(source, destination)
+        return
+    except OSError:
+        pass
+
+    directory = os.path.dirname(os.path.abspath(destination))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=directory)
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.remove(source)
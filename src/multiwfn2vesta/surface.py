@@ -0,0 +1,139 @@
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+from multiwfn2vesta.thumbnail import sample_grid
+
+
+def extract_surface_mesh(cube, level):
+    """用 marching cubes 提取等值面网格，返回 (顶点坐标, 三角面片下标)
+
+    坐标单位与cub文件相同；等值面不存在时返回空数组。需要 scikit-image。
+    """
+    try:
+        from skimage.measure import marching_cubes
+    except ImportError:
+        raise ImportError("表面模式需要安装 scikit-image: pip install scikit-image")
+
+    data = np.asarray(cube['data'])
+    if not data.min() < level < data.max():
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64)
+    verts, faces, _, _ = marching_cubes(data, level)
+    steps = np.array([step for _, step in cube['grid_info']])
+    return np.asarray(cube['origin']) + verts @ steps, faces.astype(np.int64)
+
+
+def surface_statistics(vertices, faces, values):
+    """按面积加权的表面性质统计
+
+    每个三角形取三个顶点值的平均，按面积加权。返回的字典包含总面积、
+    正/负值区域面积、顶点上的最小/最大值、总体和正/负区域的平均值与方差、
+    平衡参数 ν = σ+²σ-²/(σtot²)² 以及平均偏差 Π（与 Multiwfn 定量分子表面分析的
+    定义相同，σtot² = σ+² + σ-²）。
+    """
+    stats = {'vertices': len(vertices), 'faces': len(faces)}
+    if len(faces) == 0:
+        return stats
+
+    corners = vertices[faces]
+    areas = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0],
+                                          corners[:, 2] - corners[:, 0]), axis=1)
+    face_values = values[faces].mean(axis=1)
+    total_area = areas.sum()
+    mean = np.dot(areas, face_values) / total_area
+
+    stats.update({
+        'area': total_area,
+        'min': values.min(),
+        'max': values.max(),
+        'mean': mean,
+        'average_deviation': np.dot(areas, np.abs(face_values - mean)) / total_area,
+    })
+    for name, part in (('positive', face_values > 0), ('negative', face_values < 0)):
+        area = areas[part].sum()
+        stats[f'{name}_area'] = area
+        if area > 0:
+            part_mean = np.dot(areas[part], face_values[part]) / area
+            stats[f'{name}_mean'] = part_mean
+            stats[f'{name}_variance'] = np.dot(areas[part],
+                                                (face_values[part] - part_mean) ** 2) / area
+        else:
+            stats[f'{name}_mean'] = 0.0
+            stats[f'{name}_variance'] = 0.0
+
+    variance = stats['positive_variance'] + stats['negative_variance']
+    stats['variance'] = variance
+    stats['balance'] = (stats['positive_variance'] * stats['negative_variance'] / variance ** 2
+                        if variance > 0 else 0.0)
+    for key in stats:
+        if key not in ('vertices', 'faces'):
+            stats[key] = float(stats[key])
+    return stats
+
+
+def write_surface_npz(filename, vertices, faces, values, stats=None):
+    """把表面网格、顶点值和统计量写成压缩的 .npz 文件"""
+    stats = stats or {}
+    np.savez_compressed(filename, vertices=vertices.astype(np.float32),
+                        faces=faces.astype(np.int32), values=values.astype(np.float32),
+                        **{f'stat_{key}': value for key, value in stats.items()})
+
+
+def write_surface_ply(filename, vertices, faces, values):
+    """把表面网格写成二进制 PLY，顶点值存为 quality 属性（MeshLab、ParaView 等可读）"""
+    vertex = np.empty(len(vertices), dtype=[('xyz', '<f4', 3), ('quality', '<f4')])
+    vertex['xyz'] = vertices
+    vertex['quality'] = values
+    face = np.empty(len(faces), dtype=[('n', 'u1'), ('index', '<i4', 3)])
+    face['n'] = 3
+    face['index'] = faces
+
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {len(vertices)}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        "property float quality\n"
+        f"element face {len(faces)}\n"
+        "property list uchar int vertex_indices\n"
+        "end_header\n"
+    )
+    with open(filename, 'wb') as f:
+        f.write(header.encode('ascii'))
+        f.write(vertex.tobytes())
+        f.write(face.tobytes())
+
+
+def process_surface(density_file, potential_file, output_file, isovalue=None,
+                    processor=None, quiet=False):
+    """只在等密度面上计算静电势（表面模式）
+
+    从密度网格提取 ρ = isovalue 的等值面（缺省为 processor.isodensity_value），
+    只在表面顶点上对势能做三线性插值，写出网格和顶点值，而不是整个三维格点。
+    output_file 以 .ply 结尾时写二进制 PLY，否则写 .npz（同时保存统计量）。
+    返回 surface_statistics 的结果。
+    """
+    processor = processor or CubeFileInterpolator(quiet=quiet)
+    if isovalue is None:
+        isovalue = processor.isodensity_value
+
+    processor.density_data = processor.read_cube_file(density_file)
+    processor.potential_data = processor.read_cube_file(potential_file)
+    vertices, faces = extract_surface_mesh(processor.density_data, isovalue)
+    values = sample_grid(processor.potential_data, vertices) if len(vertices) else np.empty(0)
+    stats = surface_statistics(vertices, faces, values)
+
+    if str(output_file).lower().endswith('.ply'):
+        write_surface_ply(output_file, vertices, faces, values)
+    else:
+        write_surface_npz(output_file, vertices, faces, values, stats)
+
+    processor._print(f"等值面 ρ = {isovalue}: {len(vertices)} 个顶点, {len(faces)} 个三角形")
+    if len(faces):
+        processor._print(f"表面积: {stats['area']:.4f}，正/负区域: "
+                         f"{stats['positive_area']:.4f} / {stats['negative_area']:.4f}")
+        processor._print(f"势能范围: [{stats['min']:.6E}, {stats['max']:.6E}]，"
+                         f"面积加权平均: {stats['mean']:.6E}")
+    processor._print(f"表面文件写入完成: {output_file}")
+    return stats
@@ -0,0 +1,181 @@
+import logging
+import struct
+import zlib
+
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+
+# 缩略图默认边长（像素）
+THUMBNAIL_SIZE = 256
+# 背景色
+THUMBNAIL_BACKGROUND = (255, 255, 255)
+
+
+def extract_isosurface(cube, level):
+    """提取等值面，返回 (顶点坐标, 法向量)
+
+    安装了 scikit-image 时用 marching cubes 得到表面网格的顶点；
+    否则退回到体素表面：ρ >= level 且至少有一个相邻格点 ρ < level 的格点，
+    法向量取梯度方向。坐标单位与cub文件相同；等值面不存在时返回空数组。
+    """
+    data = np.asarray(cube['data'])
+    origin = np.asarray(cube['origin'])
+    steps = np.array([step for _, step in cube['grid_info']])
+    if not data.min() < level < data.max():
+        return np.empty((0, 3)), np.empty((0, 3))
+
+    try:
+        from skimage.measure import marching_cubes
+    except ImportError:
+        marching_cubes = None
+
+    if marching_cubes is not None:
+        verts, _, normals, _ = marching_cubes(data, level)
+        # 法向量是格点下标空间中的梯度方向，换算到实际坐标需乘以步长矩阵的逆转置
+        return origin + verts @ steps, normals @ np.linalg.inv(steps).T
+
+    inside = data >= level
+    boundary = np.zeros_like(inside)
+    for axis in range(3):
+        for shift in (1, -1):
+            boundary |= inside & ~np.roll(inside, shift, axis=axis)
+    index = np.argwhere(boundary)
+
+    gradient = np.stack([g[boundary] for g in np.gradient(data)], axis=1)
+    return origin + index @ steps, -gradient @ np.linalg.inv(steps).T
+
+
+def sample_grid(cube, points):
+    """在任意坐标点上对cub数据做三线性插值，网格范围外取 0"""
+    from scipy.ndimage import map_coordinates
+
+    steps = np.array([step for _, step in cube['grid_info']])
+    index = np.linalg.solve(steps.T, (points - cube['origin']).T)
+    return map_coordinates(np.asarray(cube['data']), index, order=1, mode='constant', cval=0.0)
+
+
+def colormap(values, vmin=None, vmax=None):
+    """蓝-白-红色标，vmin/vmax 缺省时取关于 0 对称的范围"""
+    if vmin is None or vmax is None:
+        limit = np.max(np.abs(values)) if len(values) else 1.0
+        limit = limit or 1.0
+        vmin, vmax = -limit, limit
+    t = np.clip((values - vmin) / (vmax - vmin), 0.0, 1.0)[:, None]
+
+    blue = np.array([0.0, 0.0, 1.0])
+    white = np.array([1.0, 1.0, 1.0])
+    red = np.array([1.0, 0.0, 0.0])
+    lower = blue + (white - blue) * (t * 2)
+    upper = white + (red - white) * (t * 2 - 1)
+    return np.where(t < 0.5, lower, upper)
+
+
+def rotation_matrix(rotations):
+    """按顺序累积 [(轴, 角度), ...] 的旋转，与 VestaController 的 rotate_x/y/z 对应"""
+    matrix = np.eye(3)
+    for axis, degrees in rotations:
+        theta = np.radians(degrees)
+        c, s = np.cos(theta), np.sin(theta)
+        if axis == 'x':
+            r = np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+        elif axis == 'y':
+            r = np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+        elif axis == 'z':
+            r = np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+        else:
+            raise ValueError(f"未知的旋转轴: {axis}")
+        matrix = r @ matrix
+    return matrix
+
+
+def rasterize(points, normals, colors, rotation, size=THUMBNAIL_SIZE):
+    """正交投影并用 z-buffer 光栅化着色后的表面点，返回 (size, size, 3) 的 uint8 图像"""
+    image = np.empty((size, size, 3), dtype=np.uint8)
+    image[:] = THUMBNAIL_BACKGROUND
+    if len(points) == 0:
+        return image
+
+    view = points @ rotation.T
+    view_normals = normals @ rotation.T
+    lengths = np.linalg.norm(view_normals, axis=1)
+    lengths[lengths == 0] = 1.0
+    # 朝向观察者（+z）的面更亮
+    shade = 0.35 + 0.65 * np.abs(view_normals[:, 2] / lengths)
+    rgb = np.clip(colors * shade[:, None] * 255, 0, 255).astype(np.uint8)
+
+    # 保持长宽比，留出边距
+    lo = view[:, :2].min(axis=0)
+    span = (view[:, :2].max(axis=0) - lo).max() or 1.0
+    scale = (size - 8) / span
+    center = (size - (view[:, :2].max(axis=0) - lo) * scale) / 2
+    px = ((view[:, :2] - lo) * scale + center).astype(np.intp)
+
+    # 每个点按平均点距覆盖若干像素，避免表面出现空洞
+    splat = max(1, int(np.ceil(scale * span / np.sqrt(len(points)) * 0.5)))
+    offsets = [(dx, dy) for dx in range(-splat // 2, splat - splat // 2)
+               for dy in range(-splat // 2, splat - splat // 2)]
+    cols = np.concatenate([px[:, 0] + dx for dx, _ in offsets])
+    rows = np.concatenate([size - 1 - (px[:, 1] + dy) for _, dy in offsets])
+    depth = np.tile(view[:, 2], len(offsets))
+    color = np.tile(rgb, (len(offsets), 1))
+
+    valid = (cols >= 0) & (cols < size) & (rows >= 0) & (rows < size)
+    pixel = rows[valid] * size + cols[valid]
+    # 每个像素取离观察者最近（z 最大）的点
+    order = np.lexsort((-depth[valid], pixel))
+    first = np.unique(pixel[order], return_index=True)[1]
+    nearest = order[first]
+    image.reshape(-1, 3)[pixel[nearest]] = color[valid][nearest]
+    return image
+
+
+def write_png(filename, image):
+    """把 (h, w, 3) 的 uint8 图像写成 PNG（只依赖标准库）"""
+    height, width, _ = image.shape
+    raw = b''.join(b'\x00' + image[row].tobytes() for row in range(height))
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw, 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+def render_thumbnails(cube_file, views, property_file=None, isovalue=0.001,
+                      size=THUMBNAIL_SIZE, vmin=None, vmax=None):
+    """不启动 VESTA，直接在进程内渲染等值面缩略图
+
+    Args:
+        cube_file: 提取等值面用的cub文件（如密度、IRI）
+        views: [(输出PNG路径, [(轴, 角度), ...]), ...]，与 RenderJob 一样旋转是累积的
+        property_file: 可选，用于给表面上色的性质cub文件（如静电势）；
+            缺省时按 cube_file 自身的值上色
+        isovalue: 等值面数值
+        size: 图片边长（像素）
+        vmin, vmax: 色标范围，缺省时取关于 0 对称的范围
+
+    Returns:
+        list: 写出的图片路径；isovalue 不在数据范围内时不写出图片，返回空列表
+    """
+    processor = CubeFileInterpolator(quiet=True)
+    cube = processor.read_cube_file(cube_file)
+    points, normals = extract_isosurface(cube, isovalue)
+    if len(points) == 0:
+        logging.warning(f"{cube_file} 中没有 {isovalue} 的等值面，跳过缩略图")
+        return []
+
+    color_cube = processor.read_cube_file(property_file) if property_file else cube
+    colors = colormap(sample_grid(color_cube, points), vmin, vmax)
+
+    written = []
+    rotation = np.eye(3)
+    for output, rotations in views:
+        rotation = rotation_matrix(rotations) @ rotation
+        write_png(output, rasterize(points, normals, colors, rotation, size))
+        written.append(output)
+    return written
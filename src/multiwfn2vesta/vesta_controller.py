@@ -1,6 +1,11 @@
+import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# 单条 VESTA 命令行的默认长度上限（Windows cmd.exe 的限制为 8191 个字符）
+VESTA_MAX_COMMAND_LENGTH = 8000
+
 class VestaController:
     def __init__(self, vesta_path="vesta.exe"):
         self.vesta_path = Path(vesta_path)
@@ -43,6 +48,117 @@ class VestaController:
         self.commands = []
         return result.returncode == 0
 
+class RenderJob:
+    """一个结构文件的渲染任务
+
+    Args:
+        file_path: 结构或体数据文件
+        views: [(输出图片路径, [(轴, 角度), ...]), ...]，按顺序先旋转再导出；
+            与 VestaController 一样，旋转是累积的
+        scale: 导出图片的缩放倍数
+    """
+
+    def __init__(self, file_path, views, scale=3):
+        self.file_path = file_path
+        self.views = views
+        self.scale = scale
+
+    @property
+    def outputs(self):
+        return [str(output) for output, _ in self.views]
+
+    def commands(self):
+        """该任务对应的 VESTA 命令行参数"""
+        controller = VestaController()
+        controller.open(self.file_path)
+        for output, rotations in self.views:
+            for axis, degrees in rotations:
+                getattr(controller, f"rotate_{axis}")(degrees)
+            controller.export_image(output, scale=self.scale)
+        controller.close()
+        return controller.commands
+
+class VestaRenderPlanner:
+    """把多个渲染任务打包进少量 VESTA 进程
+
+    每个进程依次执行多组 -open/-export_img/-close。任务先按顺序均分成
+    min(max_parallel, 任务数) 组，使 max_parallel 个进程都有事可做，
+    每组再按命令行长度上限 max_command_length 拆分；最多 max_parallel 个进程并行运行。
+    一个进程失败时，未生成的图片对应的任务会再单独运行一次，
+    以便把失败定位到具体的图片。
+    """
+
+    def __init__(self, vesta_path="vesta.exe", max_command_length=VESTA_MAX_COMMAND_LENGTH,
+                 max_parallel=1, retry_failed=True):
+        self.vesta_path = Path(vesta_path)
+        self.max_command_length = max_command_length
+        self.max_parallel = max(1, max_parallel)
+        self.retry_failed = retry_failed
+
+    def plan(self, jobs):
+        """按并行进程数和命令行长度上限把任务分组，返回 [[任务, ...], ...]"""
+        jobs = list(jobs)
+        groups = min(self.max_parallel, len(jobs))
+        base_length = len(str(self.vesta_path))
+        batches = []
+        for index in range(groups):
+            batch, length = [], base_length
+            for job in jobs[len(jobs) * index // groups:len(jobs) * (index + 1) // groups]:
+                job_length = sum(len(arg) + 1 for arg in job.commands())
+                if batch and length + job_length > self.max_command_length:
+                    batches.append(batch)
+                    batch, length = [], base_length
+                batch.append(job)
+                length += job_length
+            if batch:
+                batches.append(batch)
+        return batches
+
+    def run(self, jobs):
+        """执行所有渲染任务，返回 {输出图片路径: 是否成功}"""
+        jobs = list(jobs)
+        batches = self.plan(jobs)
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            batch_results = list(executor.map(self._run_batch, batches))
+
+        results = {}
+        retry = []
+        for batch, batch_result in zip(batches, batch_results):
+            results.update(batch_result)
+            if len(batch) > 1:
+                retry.extend(job for job in batch
+                             if not all(batch_result[output] for output in job.outputs))
+
+        if self.retry_failed and retry:
+            with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+                for batch_result in executor.map(self._run_batch, [[job] for job in retry]):
+                    results.update(batch_result)
+
+        return results
+
+    def _run_batch(self, batch):
+        """运行一个打包的 VESTA 进程，按图片是否新生成判断每张图片的结果"""
+        full_command = [str(self.vesta_path)]
+        for job in batch:
+            full_command.extend(job.commands())
+
+        outputs = [output for job in batch for output in job.outputs]
+        before = {output: _mtime(output) for output in outputs}
+        try:
+            subprocess.run(full_command, capture_output=True, text=True)
+        except OSError:
+            return {output: False for output in outputs}
+
+        # 图片存在且不是运行前就有的那个文件，才算成功
+        return {output: _mtime(output) not in (None, before[output]) for output in outputs}
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
 if __name__ == "__main__":
     vesta = VestaController("vesta.exe")
     success = (vesta
@@ -0,0 +1,393 @@
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+from multiwfn2vesta.instrumentation import Instrumentation, JSONLinesSink
+from multiwfn2vesta.multiwfn_controller import QuantumFileProcessor
+from multiwfn2vesta.MultiwfnRunner import MultiwfnRunner, iri_job
+from multiwfn2vesta.scheduler import MultiwfnScheduler
+
+# 监视的文件类型
+WATCH_PATTERNS = ('*.fchk', '*.fch', '*.molden', '*.molden.input', '*.log')
+# pipeline_handler 在被监视的目录中写出的 Multiwfn 日志
+WATCH_MULTIWFN_LOG = 'Multiwfn_out.log'
+# 即使匹配 WATCH_PATTERNS 也不处理的文件名
+WATCH_IGNORE = (WATCH_MULTIWFN_LOG,)
+# 文件大小和修改时间保持不变多少秒后才认为已写完
+WATCH_SETTLE_SECONDS = 5.0
+# 轮询目录（以及检查去抖中的文件）的间隔秒数
+WATCH_POLL_INTERVAL = 1.0
+# 待处理队列的长度上限，队列满时新文件留在去抖表中，稍后再放入
+WATCH_QUEUE_SIZE = 64
+# .log 文件不再变化但一直没有正常结束时，等待多少秒后放弃（内容改变后会重新等待）
+WATCH_INCOMPLETE_TIMEOUT = 3600.0
+# 检查 Gaussian 输出文件是否正常结束时读取的文件末尾字节数
+_LOG_TAIL_BYTES = 4096
+
+# inotify 事件（见 inotify(7)）
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class FolderWatcher:
+    """监视目录中新算完的波函数和 Gaussian 输出文件，逐个送入处理流程
+
+    Linux 上用 inotify 获知文件变化，其他平台或 inotify 不可用时轮询目录。
+    文件的大小和修改时间保持 settle 秒不变（.log 文件还要求已正常结束）
+    才放入长度为 queue_size 的队列，由 workers 个工作线程调用 handler(path)，
+    返回真值表示成功。以 Error termination 结束、或保持 incomplete_timeout 秒
+    不变仍未正常结束的 .log 文件被丢弃，计入 stats() 的 dropped。
+    每个文件的处理作为 watch_job 阶段记录到 instrumentation，
+    队列深度和吞吐量见 stats()。处理过或丢弃的文件只有内容改变后才会再次处理。
+    """
+
+    def __init__(self, directories, handler, patterns=WATCH_PATTERNS, workers=1,
+                 queue_size=WATCH_QUEUE_SIZE, settle=WATCH_SETTLE_SECONDS,
+                 poll_interval=WATCH_POLL_INTERVAL, backend='auto', existing=False,
+                 instrumentation=None, ignore=WATCH_IGNORE,
+                 incomplete_timeout=WATCH_INCOMPLETE_TIMEOUT):
+        """
+        Args:
+            directories: 监视的目录列表（不递归）
+            handler: 处理单个文件的函数，见 pipeline_handler
+            backend: 'auto' 优先使用 inotify，'poll' 强制轮询
+            existing: 是否也处理启动时目录中已有的文件
+            ignore: 不处理的文件名，默认排除 pipeline_handler 自己写出的日志
+        """
+        if backend not in ('auto', 'poll'):
+            raise ValueError(f"未知的监视方式: {backend}")
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.handler = handler
+        self.patterns = patterns
+        self.ignore = set(ignore)
+        self.workers = max(1, workers)
+        self.settle = settle
+        self.incomplete_timeout = incomplete_timeout
+        self.poll_interval = poll_interval
+        self.backend = backend
+        self.existing = existing
+        self.instrumentation = instrumentation or Instrumentation()
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # 去抖中的文件 -> (上次看到的大小和修改时间, 开始保持不变的时刻)
+        self._pending = {}
+        # 已放入队列的文件 -> 当时的大小和修改时间
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._inotify = None
+        # 实际使用的监视方式：'inotify' 或 'poll'
+        self.backend_name = 'poll'
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._started = None
+
+    def start(self):
+        """启动监视线程和工作线程"""
+        self._stop.clear()
+        self._started = time.monotonic()
+        if self.backend == 'auto':
+            self._inotify = _inotify_open(self.directories)
+        if self._inotify is not None:
+            self.backend_name = 'inotify'
+        if self.existing:
+            self._scan()
+        else:
+            for path in self._list_files():
+                signature = _signature(path)
+                if signature is not None:
+                    self._seen[path] = signature
+
+        self._threads = [threading.Thread(target=self._watch_loop, daemon=True)]
+        self._threads += [threading.Thread(target=self._work, daemon=True)
+                          for _ in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"开始监视 {', '.join(self.directories)}（{self.backend_name}），"
+                     f"{self.workers} 个工作线程")
+
+    def stop(self):
+        """停止监视；已在队列中的文件处理完后返回"""
+        self._stop.set()
+        if self._threads:
+            # 先停止监视线程，不再有新文件放入队列
+            self._threads[0].join()
+            for _ in range(self.workers):
+                self.queue.put(None)
+            for thread in self._threads[1:]:
+                thread.join()
+            self._threads = []
+        if self._inotify is not None:
+            os.close(self._inotify[0])
+            self._inotify = None
+
+    def run_forever(self, report_interval=60):
+        """前台运行，每 report_interval 秒输出一次 stats()，Ctrl+C 结束"""
+        self.start()
+        try:
+            while True:
+                time.sleep(report_interval)
+                logging.info(format_stats(self.stats()))
+        except KeyboardInterrupt:
+            logging.info("正在停止，等待队列中的文件处理完成")
+        finally:
+            self.stop()
+            logging.info(format_stats(self.stats()))
+
+    def stats(self):
+        """返回队列深度、处理中/已完成/失败/丢弃的文件数和每小时吞吐量"""
+        with self._lock:
+            running, completed, failed = self._running, self._completed, self._failed
+            dropped = self._dropped
+        uptime = time.monotonic() - self._started if self._started else 0.0
+        return {
+            'backend': self.backend_name,
+            'settling': len(self._pending),
+            'queued': self.queue.qsize(),
+            'running': running,
+            'completed': completed,
+            'failed': failed,
+            'dropped': dropped,
+            'uptime': uptime,
+            'throughput_per_hour': (completed + failed) / uptime * 3600 if uptime else 0.0,
+        }
+
+    def _watch_loop(self):
+        while not self._stop.is_set():
+            if self._inotify is None:
+                self._scan()
+                self._stop.wait(self.poll_interval)
+            else:
+                fd = self._inotify[0]
+                ready, _, _ = select.select([fd], [], [], self.poll_interval)
+                if ready:
+                    self._read_events()
+            self._promote()
+
+    def _read_events(self):
+        fd, directories = self._inotify
+        try:
+            buffer = os.read(fd, 1 << 16)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += _INOTIFY_EVENT.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                # 事件丢失，重新扫描一遍目录
+                self._scan()
+            elif wd in directories and self._matches(name):
+                self._pending.setdefault(os.path.join(directories[wd], name), None)
+
+    def _scan(self):
+        for path in self._list_files():
+            if path not in self._pending and self._seen.get(path) != _signature(path):
+                self._pending[path] = None
+
+    def _list_files(self):
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_file() and self._matches(entry.name):
+                    yield entry.path
+
+    def _matches(self, name):
+        return name not in self.ignore and \
+            any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def _promote(self):
+        """把已经写完的文件放入队列"""
+        now = time.monotonic()
+        for path in list(self._pending):
+            signature = _signature(path)
+            if signature is None or self._seen.get(path) == signature:
+                del self._pending[path]
+                continue
+            state = self._pending[path]
+            if state is None or state[0] != signature:
+                self._pending[path] = (signature, now)
+                continue
+            if now - state[1] < self.settle:
+                continue
+            complete = _is_complete(path)
+            if complete is None and now - state[1] >= self.incomplete_timeout:
+                logging.warning(f"{path} {self.incomplete_timeout:.0f} 秒内没有正常结束，不再等待")
+                complete = False
+            elif complete is False:
+                logging.warning(f"{path} 以 Error termination 结束，跳过")
+            if complete is None:
+                continue
+            if not complete:
+                self._seen[path] = signature
+                with self._lock:
+                    self._dropped += 1
+                del self._pending[path]
+                continue
+            try:
+                self.queue.put_nowait((path, now))
+            except queue.Full:
+                # 队列满时留在去抖表中，下次再试
+                break
+            self._seen[path] = signature
+            del self._pending[path]
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, queued_at = item
+            with self._lock:
+                self._running += 1
+            ok = False
+            try:
+                with self.instrumentation.stage('watch_job', file=path,
+                                                wait=time.monotonic() - queued_at) as record:
+                    ok = bool(self.handler(path))
+                    record['ok'] = ok
+            except Exception as e:
+                logging.error(f"处理失败: {path}: {e}")
+            with self._lock:
+                self._running -= 1
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+
+
+def pipeline_handler(multiwfn_path="Multiwfn", nprocs=1, maxcore=1000):
+    """默认的处理流程
+
+    Gaussian .log 文件生成 ORCA 输入文件（见 QuantumFileProcessor），
+    波函数文件在独立的临时目录中计算 IRI 格点（见 iri_job），Multiwfn 的输出
+    追加到文件所在目录的 WATCH_MULTIWFN_LOG 中，FolderWatcher 默认忽略该文件。
+    """
+    runner = MultiwfnRunner(multiwfn_path)
+
+    def handle(path):
+        if path.endswith('.log'):
+            return QuantumFileProcessor(nprocs, maxcore).process_file(path)
+        scheduler = MultiwfnScheduler(runner, total_cores=nprocs, max_jobs=1,
+                                      log_file=os.path.join(os.path.dirname(path),
+                                                            WATCH_MULTIWFN_LOG))
+        return all(scheduler.run([iri_job(path)]).values())
+
+    return handle
+
+
+def format_stats(stats):
+    return (f"[{stats['backend']}] 去抖中 {stats['settling']}，队列 {stats['queued']}，"
+            f"处理中 {stats['running']}，完成 {stats['completed']}，失败 {stats['failed']}，"
+            f"丢弃 {stats['dropped']}，"
+            f"吞吐量 {stats['throughput_per_hour']:.1f} 个/小时")
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _is_complete(path):
+    """Gaussian 输出文件要正常结束才处理；其他文件写完即可
+
+    返回 True（可以处理）、False（以 Error termination 结束）或 None（尚未结束）。
+    """
+    if not path.endswith('.log'):
+        return True
+    try:
+        with open(path, 'rb') as f:
+            f.seek(max(0, f.seek(0, 2) - _LOG_TAIL_BYTES))
+            tail = f.read()
+    except OSError:
+        return None
+    if b'Normal termination' in tail:
+        return True
+    if b'Error termination' in tail:
+        return False
+    return None
+
+
+def _inotify_open(directories):
+    """返回 (inotify 文件描述符, {监视号: 目录})；平台不支持时返回 None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    watches = {}
+    for directory in directories:
+        wd = libc.inotify_add_watch(fd, os.fsencode(directory), _IN_MASK)
+        if wd < 0:
+            logging.warning(f"inotify 无法监视 {directory}，改为轮询")
+            os.close(fd)
+            return None
+        watches[wd] = directory
+    return fd, watches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='监视目录，自动处理新算完的文件')
+    parser.add_argument('directories', nargs='+', help='监视的目录')
+    parser.add_argument('--workers', type=int, default=1, help='同时处理的文件数')
+    parser.add_argument('--nprocs', type=int, default=1, help='每个文件的 Multiwfn 线程数')
+    parser.add_argument('--multiwfn-path', default='Multiwfn')
+    parser.add_argument('--queue-size', type=int, default=WATCH_QUEUE_SIZE)
+    parser.add_argument('--settle', type=float, default=WATCH_SETTLE_SECONDS,
+                        help='文件保持不变多少秒后开始处理')
+    parser.add_argument('--poll-interval', type=float, default=WATCH_POLL_INTERVAL)
+    parser.add_argument('--poll', action='store_true', help='不使用 inotify，轮询目录')
+    parser.add_argument('--existing', action='store_true', help='也处理目录中已有的文件')
+    parser.add_argument('--report-interval', type=float, default=60,
+                        help='输出队列深度和吞吐量的间隔秒数')
+    parser.add_argument('--metrics-file', help='把每个文件的处理记录追加到该 JSON Lines 文件')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    hooks = [JSONLinesSink(args.metrics_file)] if args.metrics_file else None
+    watcher = FolderWatcher(
+        args.directories,
+        pipeline_handler(args.multiwfn_path, args.nprocs),
+        workers=args.workers,
+        queue_size=args.queue_size,
+        settle=args.settle,
+        poll_interval=args.poll_interval,
+        backend='poll' if args.poll else 'auto',
+        existing=args.existing,
+        instrumentation=Instrumentation(hooks),
+    )
+    watcher.run_forever(args.report_interval)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
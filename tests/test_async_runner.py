@@ -0,0 +1,83 @@
+import asyncio
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from multiwfn2vesta.MultiwfnRunner import AsyncMultiwfnRunner
+
+# 假 Multiwfn：回显 stdin，按输入文件内容决定输出量、耗时和返回码
+FAKE_MULTIWFN = '''#!{python}
+import sys, time
+lines = sys.stdin.read().splitlines()
+size, delay, code = open(sys.argv[1]).read().split()
+sys.stdout.write("x" * int(size))
+sys.stderr.write("commands: " + ",".join(lines))
+time.sleep(float(delay))
+sys.exit(int(code))
+'''
+
+
+class TestAsyncMultiwfnRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fake = os.path.join(self.tmpdir, 'Multiwfn')
+        with open(self.fake, 'w') as f:
+            f.write(FAKE_MULTIWFN.format(python=sys.executable))
+        os.chmod(self.fake, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _input(self, name, size, delay, code):
+        with open(os.path.join(self.tmpdir, name), 'w') as f:
+            f.write(f"{size} {delay} {code}")
+        return name
+
+    def test_return_code_and_log(self):
+        runner = AsyncMultiwfnRunner(self.fake, max_log_bytes=1000)
+        name = self._input('a.fchk', 5000, 0, 3)
+        code = asyncio.run(runner.run_commands(name, ["20", "4"], cwd=self.tmpdir))
+        self.assertEqual(code, 3)
+
+        with open(os.path.join(self.tmpdir, 'a.fchk.multiwfn.log'), 'rb') as f:
+            log = f.read().decode()
+        self.assertIn('返回码: 3', log)
+        self.assertIn('其余输出已省略', log)
+        self.assertLess(len(log.encode()), 1300)
+
+    def test_compressed_log(self):
+        runner = AsyncMultiwfnRunner(self.fake)
+        name = self._input('b.fchk', 10, 0, 0)
+        code = asyncio.run(runner.run_commands(name, ["20"], cwd=self.tmpdir,
+                                               log_file='b.log.gz'))
+        self.assertEqual(code, 0)
+        with gzip.open(os.path.join(self.tmpdir, 'b.log.gz'), 'rt') as f:
+            self.assertIn('commands: 20,q', f.read())
+
+    def test_timeout(self):
+        runner = AsyncMultiwfnRunner(self.fake)
+        name = self._input('c.fchk', 0, 5, 0)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            asyncio.run(runner.run_commands(name, [], cwd=self.tmpdir, timeout=0.5))
+
+    def test_concurrent_processes(self):
+        runner = AsyncMultiwfnRunner(self.fake, max_concurrent=4)
+        names = [self._input(f'm{i}.fchk', 10, 0.5, 0) for i in range(4)]
+
+        async def run_all():
+            return await asyncio.gather(*(runner.run_commands(name, [], cwd=self.tmpdir)
+                                          for name in names))
+
+        start = time.perf_counter()
+        codes = asyncio.run(run_all())
+        self.assertEqual(codes, [0, 0, 0, 0])
+        self.assertLess(time.perf_counter() - start, 1.8)
+
+
+if __name__ == '__main__':
+    unittest.main()
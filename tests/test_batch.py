@@ -0,0 +1,139 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from multiwfn2vesta import BatchProcessor, MultiwfnController, VestaController
+from multiwfn2vesta.batch import BATCH_STAGES, BatchItem
+from multiwfn2vesta.cub import CubeFileInterpolator
+from multiwfn2vesta.instrumentation import Instrumentation
+from multiwfn2vesta.main import main
+
+from .test_cub import make_cube
+
+# 假 Multiwfn：按主功能 5 的函数编号把预先准备好的cub文件复制到当前目录
+FAKE_MULTIWFN = '''#!{python}
+import os, shutil, sys, time
+names = {{"1": "density.cub", "12": "totesp.cub"}}
+if "fail" in sys.argv[1]:
+    sys.exit(1)
+lines = sys.stdin.read().splitlines()
+for command, function in zip(lines, lines[1:]):
+    if command == "5":
+        time.sleep({delay})
+        shutil.copy(os.path.join({source!r}, names[function]), names[function])
+'''
+
+# 假 VESTA：为每个 -export_img 写出图片，并在 vesta_calls 中记录一次调用
+FAKE_VESTA = '''#!{python}
+import os, sys, time
+args = sys.argv[1:]
+with open(os.path.join(os.path.dirname(sys.argv[0]), "vesta_calls"), "a") as f:
+    f.write("call\\n")
+for i, arg in enumerate(args):
+    if arg == "-export_img":
+        time.sleep({delay})
+        open(args[i + 2], "w").write("png")
+'''
+
+
+class TestBatchProcessor(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        source = os.path.join(self.tmpdir, 'source')
+        os.makedirs(source)
+        writer = CubeFileInterpolator(quiet=True)
+        density = make_cube((10, 9, 8), seed=1)
+        density['data'] = np.abs(density['data']) * 0.1
+        writer.write_cube_file(density['data'], os.path.join(source, 'density.cub'), density)
+        esp = make_cube((7, 6, 5), spacing=0.35, seed=2)
+        writer.write_cube_file(esp['data'], os.path.join(source, 'totesp.cub'), esp)
+
+        self.multiwfn_path = self._script('Multiwfn', FAKE_MULTIWFN, source=source, delay=0.3)
+        self.vesta_path = self._script('vesta', FAKE_VESTA, delay=0.1)
+        self.inputs = []
+        for name in ('a', 'b', 'c', 'fail'):
+            path = os.path.join(self.tmpdir, f'{name}.fchk')
+            with open(path, 'w') as f:
+                f.write('fchk')
+            self.inputs.append(path)
+        self.output_dir = os.path.join(self.tmpdir, 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _script(self, name, template, **kwargs):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(template.format(python=sys.executable, **kwargs))
+        os.chmod(path, 0o755)
+        return path
+
+    def test_pipeline(self):
+        records = []
+        multiwfn = MultiwfnController(self.multiwfn_path, total_cores=1)
+        processor = BatchProcessor(multiwfn, VestaController(self.vesta_path),
+                                   output_dir=self.output_dir, grid_types=('electron', 'esp'),
+                                   queue_size=1, instrumentation=Instrumentation([records.append]))
+        results = processor.process_files(self.inputs)
+
+        self.assertIsNone(results[self.inputs[3]])
+        for name, path in zip('abc', self.inputs):
+            # 密度和掩膜后的静电势各三个视角
+            self.assertEqual(len(results[path]), 6)
+            for image in results[path]:
+                self.assertTrue(os.path.exists(image))
+            masked = os.path.join(self.output_dir, f'{name}_esp_masked.cub')
+            self.assertEqual(CubeFileInterpolator(quiet=True).read_cube_file(masked)['shape'],
+                             (10, 9, 8))
+
+        # Multiwfn 的输出追加到输出目录中，而不是当前目录
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'Multiwfn_out.log')))
+
+        # 后处理使用批处理自己的 instrumentation
+        self.assertIn('mask', {r['stage'] for r in records})
+
+        stats = processor.stats
+        self.assertEqual((stats['files'], stats['succeeded']), (4, 3))
+        self.assertGreater(stats['throughput_per_hour'], 0)
+
+        # 各阶段重叠执行：某个文件在渲染时，另一个文件的 Multiwfn 计算正在进行
+        intervals = {(r['stage'], r['file']): (r['start'], r['start'] + r['elapsed'])
+                     for r in records if r['stage'] in BATCH_STAGES}
+        overlaps = [(a, b) for a in self.inputs for b in self.inputs
+                    if a != b and ('render', a) in intervals and ('multiwfn', b) in intervals
+                    and _intersects(intervals['render', a], intervals['multiwfn', b])]
+        self.assertTrue(overlaps)
+
+    def test_render_packs_files_together(self):
+        processor = BatchProcessor(MultiwfnController(self.multiwfn_path),
+                                   VestaController(self.vesta_path), output_dir=self.output_dir)
+        items = [BatchItem(path) for path in self.inputs[:2]]
+        for item in items:
+            item.render_files = [os.path.join(self.tmpdir, f'{item.basename}.cub')]
+        processor._render(items)
+
+        with open(os.path.join(self.tmpdir, 'vesta_calls')) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        for item in items:
+            self.assertIsNone(item.error)
+            self.assertEqual(len(item.images), 3)
+            self.assertTrue(all(item.basename in image for image in item.images))
+
+    def test_cli(self):
+        code = main(self.inputs[:2] + ['--multiwfn-path', self.multiwfn_path,
+                                       '--vesta-path', self.vesta_path,
+                                       '--output-dir', self.output_dir])
+        self.assertEqual(code, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'b_electron_3.png')))
+
+
+def _intersects(first, second):
+    return first[0] < second[1] and second[0] < first[1]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from multiwfn2vesta.benchmark import STAGES, compare, run_case, synthetic_field, synthetic_grid
+from multiwfn2vesta.benchmark import write_synthetic_case
+from multiwfn2vesta.cub import CubeFileInterpolator
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_synthetic_fields(self):
+        grid = synthetic_grid(16, 0.75)
+        density = synthetic_field(grid, 'density')
+        esp = synthetic_field(grid, 'esp')
+        self.assertEqual(density.shape, (16, 16, 16))
+        self.assertTrue(np.all(density > 0))
+        self.assertGreater(density.max(), 0.001)
+        self.assertGreater(esp.max(), 0)
+        self.assertLess(esp.min(), 0)
+
+    def test_mismatched_case(self):
+        with tempfile.TemporaryDirectory() as directory:
+            density_file, potential_file = write_synthetic_case(directory, 24, mismatched=True)
+            processor = CubeFileInterpolator()
+            self.assertEqual(processor.read_cube_file(density_file)['shape'], (24, 24, 24))
+            self.assertEqual(processor.read_cube_file(potential_file)['shape'], (16, 16, 16))
+            self.assertTrue(os.path.exists(potential_file))
+
+    def test_run_case_records_all_stages(self):
+        record = run_case(16, mismatched=True)
+        self.assertEqual(set(record), set(STAGES))
+        for metrics in record.values():
+            self.assertGreaterEqual(metrics['time'], 0)
+            self.assertGreater(metrics['peak_alloc_mb'], 0)
+
+    def test_compare(self):
+        baseline = {'64^3-matched': {'read': {'time': 1.0, 'peak_alloc_mb': 100.0}}}
+        same = {'64^3-matched': {'read': {'time': 1.2, 'peak_alloc_mb': 110.0}}}
+        slower = {'64^3-matched': {'read': {'time': 2.0, 'peak_alloc_mb': 100.0}}}
+        bigger = {'64^3-matched': {'read': {'time': 1.0, 'peak_alloc_mb': 200.0}}}
+        self.assertEqual(compare(same, baseline), [])
+        self.assertEqual(len(compare(slower, baseline)), 1)
+        self.assertEqual(len(compare(bigger, baseline)), 1)
+        # 新增的用例没有基线，不算回归
+        self.assertEqual(compare({'32^3-matched': same['64^3-matched']}, baseline), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
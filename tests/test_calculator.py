@@ -0,0 +1,85 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from multiwfn2vesta.calculator import cube, where
+from multiwfn2vesta.cub import CubeFileInterpolator
+
+from .test_cub import make_cube
+
+
+class TestCubeCalculator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.processor = CubeFileInterpolator(quiet=True)
+        self.files = {}
+        for name, seed in (('rho', 1), ('esp', 2), ('rho2', 3)):
+            data = make_cube((9, 5, 7), seed=seed)
+            if name.startswith('rho'):
+                data['data'] = np.abs(data['data']) * 0.1
+            self._write(name, data)
+        self._write('other', make_cube((9, 5, 7), spacing=0.4, seed=4))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, data):
+        filename = os.path.join(self.tmpdir, f'{name}.cub')
+        self.processor.write_cube_file(data['data'], filename, data)
+        self.files[name] = filename
+
+    def _read(self, name):
+        return self.processor.read_cube_file(self.files[name])['data']
+
+    def test_masked_clip_matches_numpy(self):
+        rho, esp = cube(self.files['rho']), cube(self.files['esp'])
+        expr = where(rho >= 0.001, esp, 0).clip(-0.01, 0.01)
+        expected = np.clip(np.where(self._read('rho') >= 0.001, self._read('esp'), 0),
+                           -0.01, 0.01)
+
+        # 每块一个平面，跨块的不满一行的数据也要正确衔接
+        output_file = os.path.join(self.tmpdir, 'out.cub.gz')
+        self.assertEqual(expr.evaluate(output_file, slab_bytes=1, quiet=True), output_file)
+        np.testing.assert_array_equal(expr.compute(slab_bytes=1), expected)
+
+        reference = os.path.join(self.tmpdir, 'ref.cub')
+        template = dict(self.processor.read_cube_file(self.files['rho']), comment2=str(expr))
+        self.processor.write_cube_file(expected, reference, template)
+        with gzip.open(output_file, 'rt') as f, open(reference) as g:
+            self.assertEqual(f.read(), g.read())
+        self.assertEqual(str(expr), 'where((rho.cub >= 0.001), esp.cub, 0).clip(-0.01, 0.01)')
+
+    def test_arithmetic(self):
+        rho, rho2 = cube(self.files['rho']), cube(self.files['rho2'])
+        expr = 2 * abs(rho - rho2) / (np.float64(1) + rho) - rho ** 2
+        a, b = self._read('rho'), self._read('rho2')
+        np.testing.assert_allclose(expr.compute(slab_bytes=1000),
+                                   2 * np.abs(a - b) / (1 + a) - a ** 2)
+
+        result = (rho > 0.001).compute(dtype='float32')
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_array_equal(result, (a > 0.001).astype(np.float32))
+
+    def test_grid_mismatch(self):
+        with self.assertRaises(ValueError):
+            cube(self.files['rho']) - cube(self.files['other'])
+        with self.assertRaises(TypeError):
+            if cube(self.files['rho']) > 0:
+                pass
+
+    def test_same_file_read_once(self):
+        rho = cube(self.files['rho'])
+        expr = where(rho > 0.001, cube(self.files['rho']), -rho)
+        sources = {}
+        expr._collect(sources)
+        self.assertEqual(len(sources), 1)
+        a = self._read('rho')
+        np.testing.assert_array_equal(expr.compute(), np.where(a > 0.001, a, -a))
+
+
+if __name__ == '__main__':
+    unittest.main()
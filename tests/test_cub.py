@@ -0,0 +1,519 @@
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from multiwfn2vesta.cub import (CubeCache, CubeFileInterpolator, InterpolationPlanCache,
+                                 interpolate_cube_potential_slabs)
+
+
+def make_cube(shape, origin=(0.0, 0.0, 0.0), spacing=0.5, data=None, seed=0):
+    """构造一个用于测试的cub数据字典"""
+    nx, ny, nz = shape
+    if data is None:
+        rng = np.random.default_rng(seed)
+        data = rng.standard_normal(shape) * 1e-2
+    return {
+        'comment1': 'test cube',
+        'comment2': 'generated by tests',
+        'origin': np.array(origin, dtype=float),
+        'grid_info': [
+            (nx, np.array([spacing, 0.0, 0.0])),
+            (ny, np.array([0.0, spacing, 0.0])),
+            (nz, np.array([0.0, 0.0, spacing])),
+        ],
+        'atoms': [
+            {'atomic_number': 6, 'charge': 6.0, 'coords': np.array([1.0, 1.0, 1.0])},
+            {'atomic_number': 1, 'charge': 1.0, 'coords': np.array([1.0, 1.0, 3.0])},
+        ],
+        'data': data,
+        'shape': (nx, ny, nz),
+    }
+
+
+class TestCubeRead(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.processor = CubeFileInterpolator()
+        self.cube = make_cube((5, 4, 7))
+        self.filename = os.path.join(self.tmpdir, 'test.cub')
+        self.processor.write_cube_file(self.cube['data'], self.filename, self.cube)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_engines_agree(self):
+        fast = self.processor.read_cube_file(self.filename, engine='numpy')
+        slow = self.processor.read_cube_file(self.filename, engine='python')
+        self.assertEqual(fast['shape'], slow['shape'])
+        np.testing.assert_array_equal(fast['data'], slow['data'])
+        np.testing.assert_array_equal(fast['origin'], slow['origin'])
+        self.assertEqual(len(fast['atoms']), 2)
+        np.testing.assert_allclose(fast['data'], self.cube['data'], rtol=1e-5)
+
+    def test_small_chunks(self):
+        with open(self.filename, 'r') as f:
+            self.processor.read_cube_header(f)
+            data, count = self.processor._read_cube_data_numpy(f, 140, chunk_size=17)
+        self.assertEqual(count, 140)
+        np.testing.assert_allclose(data.reshape(5, 4, 7), self.cube['data'], rtol=1e-5)
+
+    def test_short_and_long_data(self):
+        with open(self.filename, 'r') as f:
+            lines = f.readlines()
+        header_lines = 6 + len(self.cube['atoms'])
+
+        short_file = os.path.join(self.tmpdir, 'short.cub')
+        with open(short_file, 'w') as f:
+            f.writelines(lines[:-2])
+        for engine in ('numpy', 'python'):
+            result = self.processor.read_cube_file(short_file, engine=engine)
+            self.assertEqual(result['data'].shape, (5, 4, 7))
+            self.assertEqual(result['data'].ravel()[-1], 0.0)
+
+        long_file = os.path.join(self.tmpdir, 'long.cub')
+        with open(long_file, 'w') as f:
+            f.writelines(lines + lines[header_lines:header_lines + 1])
+        fast = self.processor.read_cube_file(long_file, engine='numpy')
+        slow = self.processor.read_cube_file(long_file, engine='python')
+        np.testing.assert_array_equal(fast['data'], slow['data'])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            self.processor.read_cube_file(self.filename, engine='fortran')
+
+    def test_parallel_engine(self):
+        fast = self.processor.read_cube_file(self.filename, engine='numpy')
+        # 进程数多于数据行数时部分范围为空
+        for workers in (2, 3, 64):
+            result = self.processor.read_cube_file(self.filename, engine='parallel',
+                                                   workers=workers)
+            np.testing.assert_array_equal(result['data'], fast['data'])
+
+    def test_parallel_irregular_whitespace(self):
+        with open(self.filename, 'r') as f:
+            lines = f.readlines()
+        header_lines = 6 + len(self.cube['atoms'])
+        values = self.cube['data'].ravel()
+
+        # 数值宽度不固定
+        ragged_file = os.path.join(self.tmpdir, 'ragged.cub')
+        with open(ragged_file, 'w') as f:
+            f.writelines(lines[:header_lines])
+            for i in range(0, len(values), 5):
+                f.write("  ".join(repr(float(v)) for v in values[i:i + 5]) + " \n")
+        result = self.processor.read_cube_file(ragged_file, engine='parallel', workers=4)
+        np.testing.assert_array_equal(result['data'].ravel(), values)
+
+        # 首行与后面的数值宽度不同
+        mixed_file = os.path.join(self.tmpdir, 'mixed.cub')
+        with open(mixed_file, 'w') as f:
+            f.writelines(lines[:header_lines])
+            f.write(" 1.000 2.000\n")
+            for i in range(0, len(values) - 2, 3):
+                f.write(" " + " ".join(f"{v:.3f}" for v in values[i:i + 3]) + "\n")
+        fast = self.processor.read_cube_file(mixed_file, engine='numpy')
+        result = self.processor.read_cube_file(mixed_file, engine='parallel', workers=4)
+        np.testing.assert_array_equal(result['data'], fast['data'])
+
+
+class TestCubeWrite(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.processor = CubeFileInterpolator()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write_both(self, cube, data):
+        outputs = []
+        for engine in ('numpy', 'python'):
+            filename = os.path.join(self.tmpdir, f'{engine}.cub')
+            self.processor.write_cube_file(data, filename, cube, engine=engine)
+            with open(filename, 'rb') as f:
+                outputs.append(f.read())
+        return outputs
+
+    def test_byte_identical(self):
+        # 5*4*7=140 个点，最后一行不满6个
+        cube = make_cube((5, 4, 7))
+        data = cube['data'].copy()
+        data[0, 0, :4] = [0.0, -0.0, 1e120, -3.3e-200]
+        fast, slow = self._write_both(cube, data)
+        self.assertEqual(fast, slow)
+
+    def test_byte_identical_full_rows_and_chunks(self):
+        cube = make_cube((6, 6, 6))
+        fast, slow = self._write_both(cube, cube['data'])
+        self.assertEqual(fast, slow)
+
+        with open(os.path.join(self.tmpdir, 'chunked.cub'), 'w') as f:
+            self.processor._write_cube_data_numpy(f, cube['data'], chunk_rows=7)
+        with open(os.path.join(self.tmpdir, 'chunked.cub'), 'rb') as f:
+            self.assertTrue(slow.endswith(f.read()))
+
+    def test_byte_identical_mostly_zero(self):
+        cube = make_cube((6, 6, 7))
+        data = cube['data'].copy()
+        data[1:] = 0.0
+        data[5, 5, 0] = -0.0
+        fast, slow = self._write_both(cube, data)
+        self.assertEqual(fast, slow)
+
+    def test_float32_input(self):
+        cube = make_cube((3, 3, 5))
+        data = cube['data'].astype(np.float32)
+        fast, slow = self._write_both(cube, data)
+        self.assertEqual(fast, slow)
+
+
+class TestCompressedCube(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.processor = CubeFileInterpolator()
+        self.cube = make_cube((6, 5, 7))
+        self.cube['data'][2:] = 0.0
+        plain = os.path.join(self.tmpdir, 'plain.cub')
+        self.processor.write_cube_file(self.cube['data'], plain, self.cube)
+        with open(plain, 'rb') as f:
+            self.plain_bytes = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        for name, module in (('test.cub.gz', gzip), ('test.cube.xz', lzma)):
+            filename = os.path.join(self.tmpdir, name)
+            self.processor.write_cube_file(self.cube['data'], filename, self.cube,
+                                           compresslevel=1)
+            with module.open(filename, 'rb') as f:
+                self.assertEqual(f.read(), self.plain_bytes)
+            self.assertLess(os.path.getsize(filename), len(self.plain_bytes))
+
+            result = self.processor.read_cube_file(filename)
+            np.testing.assert_allclose(result['data'], self.cube['data'], rtol=1e-5)
+
+    def test_zstd_round_trip(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest('未安装 zstandard')
+        filename = os.path.join(self.tmpdir, 'test.cube.zst')
+        self.processor.write_cube_file(self.cube['data'], filename, self.cube, compresslevel=3)
+        result = self.processor.read_cube_file(filename)
+        np.testing.assert_allclose(result['data'], self.cube['data'], rtol=1e-5)
+
+
+class TestCubeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.cube = make_cube((4, 5, 6))
+        self.filename = os.path.join(self.tmpdir, 'test.cub')
+        CubeFileInterpolator().write_cube_file(self.cube['data'], self.filename, self.cube)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_hit_is_memory_mapped(self):
+        cache = CubeCache(self.cache_dir)
+        processor = CubeFileInterpolator(cache=cache)
+        parsed = processor.read_cube_file(self.filename)
+        self.assertIsNotNone(cache.load(self.filename))
+
+        cached = processor.read_cube_file(self.filename)
+        self.assertIsInstance(cached['data'], np.memmap)
+        np.testing.assert_array_equal(cached['data'], parsed['data'])
+        np.testing.assert_array_equal(cached['origin'], parsed['origin'])
+        self.assertEqual(cached['shape'], parsed['shape'])
+        self.assertEqual(cached['comment1'], parsed['comment1'])
+        np.testing.assert_array_equal(cached['grid_info'][2][1], parsed['grid_info'][2][1])
+        np.testing.assert_array_equal(cached['atoms'][1]['coords'], parsed['atoms'][1]['coords'])
+
+    def test_modified_file_misses(self):
+        cache = CubeCache(self.cache_dir)
+        CubeFileInterpolator(cache=cache).read_cube_file(self.filename)
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNone(cache.load(self.filename))
+
+    def test_invalidate(self):
+        cache = CubeCache(self.cache_dir)
+        CubeFileInterpolator(cache=cache).read_cube_file(self.filename)
+        cache.invalidate(self.filename)
+        self.assertIsNone(cache.load(self.filename))
+
+    def test_eviction(self):
+        other = os.path.join(self.tmpdir, 'other.cub')
+        shutil.copy(self.filename, other)
+        cache = CubeCache(self.cache_dir)
+        processor = CubeFileInterpolator(cache=cache)
+        processor.read_cube_file(self.filename)
+        entry_size = sum(os.path.getsize(os.path.join(self.cache_dir, name))
+                         for name in os.listdir(self.cache_dir))
+
+        # 让第一个条目显得更旧，再把上限压到只能容纳一个条目
+        header_path = cache._paths(cache.key(self.filename))[0]
+        os.utime(header_path, (0, 0))
+        cache.max_bytes = entry_size + entry_size // 2
+        processor.read_cube_file(other)
+        self.assertIsNone(cache.load(self.filename))
+        self.assertIsNotNone(cache.load(other))
+
+
+class TestInterpolation(unittest.TestCase):
+    def _processor(self, density, potential):
+        processor = CubeFileInterpolator()
+        processor.density_data = density
+        processor.potential_data = potential
+        return processor
+
+    def test_trilinear_matches_scipy(self):
+        # 势能网格比密度网格粗，且只覆盖其中一部分，检验范围外填0
+        density = make_cube((23, 17, 19), origin=(-0.3, 0.1, -0.2), spacing=0.25)
+        potential = make_cube((9, 8, 12), origin=(0.0, 0.0, 0.0), spacing=0.5, seed=1)
+        processor = self._processor(density, potential)
+        fast = processor.interpolate_potential_to_density_grid(engine='trilinear')
+        slow = processor.interpolate_potential_to_density_grid(engine='scipy')
+        self.assertEqual(fast.shape, (23, 17, 19))
+        np.testing.assert_allclose(fast, slow, rtol=1e-10, atol=1e-14)
+        self.assertTrue(np.any(fast == 0.0))
+
+    def test_small_slabs(self):
+        density = make_cube((11, 7, 5), spacing=0.3)
+        potential = make_cube((6, 6, 6), spacing=0.5, seed=2)
+        processor = self._processor(density, potential)
+        axes = [processor.create_grid_coordinates(c['origin'], c['grid_info'])
+                for c in (potential, density)]
+        chunked = processor._interpolate_trilinear(axes[0], potential['data'], axes[1],
+                                                   slab_points=1)
+        whole = processor.interpolate_potential_to_density_grid(engine='scipy')
+        np.testing.assert_allclose(chunked, whole, rtol=1e-10, atol=1e-14)
+
+    def test_plan_reused_for_batched_fields(self):
+        density = make_cube((23, 17, 19), origin=(-0.3, 0.1, -0.2), spacing=0.25)
+        fields = [make_cube((9, 8, 12), spacing=0.5, seed=seed) for seed in (1, 2, 3)]
+        other = make_cube((7, 7, 7), spacing=0.6, seed=4)
+        processor = self._processor(density, fields[0])
+
+        batched = processor.interpolate_fields(fields + [other, density])
+        self.assertEqual(len(processor.plan_cache._plans), 2)
+        for field, result in zip(fields + [other], batched):
+            processor.potential_data = field
+            single = processor.interpolate_potential_to_density_grid(engine='scipy')
+            np.testing.assert_allclose(result, single, rtol=1e-10, atol=1e-14)
+        self.assertIs(batched[-1], density['data'])
+
+        plan = processor.interpolation_plan(fields[0], density)
+        self.assertIs(plan, processor.interpolation_plan(fields[1], density))
+        with self.assertRaises(ValueError):
+            plan.apply(other['data'])
+
+    def test_plan_cache_lru_and_disk(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        density = make_cube((11, 7, 5), spacing=0.3)
+        potentials = [make_cube((6, 6, 6), spacing=0.5 + 0.01 * i) for i in range(3)]
+        processor = CubeFileInterpolator(plan_cache=InterpolationPlanCache(max_plans=2,
+                                                                           cache_dir=tmpdir))
+        plans = [processor.interpolation_plan(p, density) for p in potentials]
+        self.assertEqual(len(processor.plan_cache._plans), 2)
+        self.assertEqual(len(os.listdir(tmpdir)), 3)
+
+        # 新的进程从磁盘读取计划
+        reloaded = CubeFileInterpolator(plan_cache=InterpolationPlanCache(cache_dir=tmpdir))
+        plan = reloaded.interpolation_plan(potentials[0], density)
+        self.assertIsNot(plan, plans[0])
+        np.testing.assert_array_equal(plan.apply(potentials[1]['data']),
+                                      plans[0].apply(potentials[1]['data']))
+
+
+class TestNarrowBand(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_matches_full_interpolation(self):
+        x = (np.arange(24) - 11.5) * 0.25
+        density = np.exp(-np.sqrt(x[:, None, None] ** 2 + x[None, :, None] ** 2
+                                  + x[None, None, :] ** 2))
+        density_cube = make_cube((24, 24, 24), origin=(-2.875,) * 3, spacing=0.25,
+                                 data=density * 0.01)
+        potential_cube = make_cube((13, 13, 13), origin=(-3.0,) * 3, spacing=0.5, seed=3)
+
+        processor = CubeFileInterpolator()
+        density_file = os.path.join(self.tmpdir, 'density.cub')
+        potential_file = os.path.join(self.tmpdir, 'esp.cub')
+        processor.write_cube_file(density_cube['data'], density_file, density_cube)
+        processor.write_cube_file(potential_cube['data'], potential_file, potential_cube)
+
+        narrow = processor.process(density_file, potential_file,
+                                   os.path.join(self.tmpdir, 'narrow.cub'), narrow_band=True)
+        full = processor.process(density_file, potential_file,
+                                 os.path.join(self.tmpdir, 'full.cub'), narrow_band=False)
+        mask = processor.create_isosurface_mask()
+        self.assertTrue(0 < np.count_nonzero(mask) < mask.size)
+        np.testing.assert_allclose(narrow, full, rtol=1e-10, atol=1e-14)
+
+
+class TestSlabStreaming(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        x = (np.arange(24) - 11.5) * 0.25
+        density = np.exp(-np.sqrt(x[:, None, None] ** 2 + x[None, :, None] ** 2
+                                  + x[None, None, :] ** 2)) * 0.01
+        self.density_cube = make_cube((24, 24, 23), origin=(-2.875,) * 3, spacing=0.25,
+                                      data=density[:, :, :23])
+        self.processor = CubeFileInterpolator(quiet=True)
+        self.density_file = self._write('density.cub', self.density_cube)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, cube):
+        filename = os.path.join(self.tmpdir, name)
+        self.processor.write_cube_file(cube['data'], filename, cube)
+        return filename
+
+    def _compare(self, potential_file, mask_mode):
+        full_file = os.path.join(self.tmpdir, 'full.cub')
+        slab_file = os.path.join(self.tmpdir, 'slab.cub')
+        self.processor.process(self.density_file, potential_file, full_file,
+                               narrow_band=False, mask_mode=mask_mode)
+        # 每块只有一个平面
+        self.processor.process_slabs(self.density_file, potential_file, slab_file,
+                                     mask_mode=mask_mode, slab_bytes=1)
+        full = self.processor.read_cube_file(full_file)
+        slab = self.processor.read_cube_file(slab_file)
+        self.assertTrue(0 < np.count_nonzero(full['data']) < full['data'].size)
+        return full, slab
+
+    def test_matched_grid_byte_identical(self):
+        potential_file = self._write('esp.cub', make_cube((24, 24, 23), seed=4))
+        for mask_mode in ('filled', 'shell'):
+            self._compare(potential_file, mask_mode)
+            with open(os.path.join(self.tmpdir, 'full.cub'), 'rb') as f:
+                full = f.read()
+            with open(os.path.join(self.tmpdir, 'slab.cub'), 'rb') as f:
+                self.assertEqual(f.read(), full)
+
+    def test_mismatched_grid(self):
+        potential_file = self._write('esp.cub', make_cube((13, 13, 13), origin=(-3.0,) * 3,
+                                                          spacing=0.5, seed=3))
+        for mask_mode in ('filled', 'shell'):
+            full, slab = self._compare(potential_file, mask_mode)
+            np.testing.assert_allclose(slab['data'], full['data'], rtol=1e-5, atol=1e-12)
+
+    def test_slabs_interface_returns_output_file(self):
+        potential_file = self._write('esp.cub', make_cube((24, 24, 23), seed=4))
+        output_file = os.path.join(self.tmpdir, 'out.cub')
+        self.assertEqual(interpolate_cube_potential_slabs(self.density_file, potential_file,
+                                                          output_file, slab_bytes=1, quiet=True),
+                         output_file)
+        full, _ = self._compare(potential_file, 'filled')
+        np.testing.assert_array_equal(self.processor.read_cube_file(output_file)['data'],
+                                      full['data'])
+
+
+class TestFloat32(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        x = (np.arange(24) - 11.5) * 0.25
+        density = np.exp(-np.sqrt(x[:, None, None] ** 2 + x[None, :, None] ** 2
+                                  + x[None, None, :] ** 2)) * 0.01
+        density_cube = make_cube((24, 24, 24), origin=(-2.875,) * 3, spacing=0.25,
+                                 data=density)
+        potential_cube = make_cube((13, 13, 13), origin=(-3.0,) * 3, spacing=0.5, seed=3)
+        writer = CubeFileInterpolator(quiet=True)
+        self.density_file = os.path.join(self.tmpdir, 'density.cub')
+        self.potential_file = os.path.join(self.tmpdir, 'esp.cub')
+        writer.write_cube_file(density_cube['data'], self.density_file, density_cube)
+        writer.write_cube_file(potential_cube['data'], self.potential_file, potential_cube)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _output(self, name, dtype, **kwargs):
+        output = os.path.join(self.tmpdir, name)
+        processor = CubeFileInterpolator(quiet=True, dtype=dtype)
+        if kwargs.pop('slabs', False):
+            processor.process_slabs(self.density_file, self.potential_file, output, **kwargs)
+        else:
+            result = processor.process(self.density_file, self.potential_file, output,
+                                       **kwargs)
+            self.assertEqual(result.dtype, np.dtype(dtype))
+        return CubeFileInterpolator(quiet=True).read_cube_file(output)['data']
+
+    def test_read(self):
+        processor = CubeFileInterpolator(quiet=True)
+        full = processor.read_cube_file(self.potential_file)
+        for engine in ('numpy', 'python', 'parallel'):
+            single = processor.read_cube_file(self.potential_file, engine=engine, workers=2,
+                                              dtype='float32')
+            self.assertEqual(single['data'].dtype, np.float32)
+            np.testing.assert_array_equal(single['data'], full['data'].astype(np.float32))
+        with self.assertRaises(ValueError):
+            CubeFileInterpolator(dtype='int32')
+
+    def test_output_unchanged_at_cube_precision(self):
+        for kwargs in ({'narrow_band': True}, {'narrow_band': False},
+                       {'mask_mode': 'shell'}, {'apply_mask': False}, {'slabs': True}):
+            double = self._output('double.cub', 'float64', **dict(kwargs))
+            single = self._output('single.cub', 'float32', **dict(kwargs))
+            self.assertTrue(np.any(double != 0))
+            # 写出的 %13.5E 只有6位有效数字，单精度误差最多让末位相差1
+            np.testing.assert_allclose(single, double, rtol=1.1e-5,
+                                       atol=1e-6 * np.abs(double).max())
+            self.assertGreater(np.mean(single == double), 0.9)
+
+
+class TestIsosurfaceMask(unittest.TestCase):
+    def _processor(self, spacing):
+        n = 41
+        x = (np.arange(n) - n // 2) * spacing
+        r = np.sqrt(x[:, None, None] ** 2 + x[None, :, None] ** 2 + x[None, None, :] ** 2)
+        # 密度在 r=2 处等于 0.001
+        density = 0.001 * np.exp(2.0 - r)
+        processor = CubeFileInterpolator()
+        processor.density_data = make_cube((n, n, n), spacing=spacing, data=density)
+        return processor, r
+
+    def test_edt_uses_real_spacing(self):
+        processor, r = self._processor(0.1)
+        mask = processor.create_isosurface_mask(search_radius=0.5)
+        self.assertTrue(np.all(mask[r <= 2.0]))
+        self.assertTrue(np.all(mask[r <= 2.45]))
+        self.assertFalse(np.any(mask[r > 2.6]))
+
+    def test_radius_rounds_up_to_one_step(self):
+        processor, r = self._processor(0.56)
+        mask = processor.create_isosurface_mask(search_radius=0.3)
+        core = r <= 2.0
+        self.assertGreater(np.count_nonzero(mask), np.count_nonzero(core))
+        self.assertFalse(np.any(mask[r > 2.0 + 0.56 * 1.8]))
+
+    def test_shell_mode(self):
+        processor, r = self._processor(0.1)
+        shell = processor.create_isosurface_mask(search_radius=0.3, mode='shell')
+        self.assertFalse(np.any(shell[r < 1.6]))
+        self.assertFalse(np.any(shell[r > 2.4]))
+        self.assertTrue(np.all(shell[np.abs(r - 2.0) < 0.2]))
+
+    def test_legacy_dilation(self):
+        processor, r = self._processor(0.56)
+        legacy = processor.create_isosurface_mask(search_radius=0.3, method='dilation')
+        edt = processor.create_isosurface_mask(search_radius=0.3, method='edt')
+        # 立方体结构元包含对角邻居，因此覆盖欧氏球
+        self.assertTrue(np.all(legacy[edt]))
+        with self.assertRaises(ValueError):
+            processor.create_isosurface_mask(mode='shell', method='dilation')
+
+
+if __name__ == '__main__':
+    unittest.main()
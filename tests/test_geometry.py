@@ -0,0 +1,114 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from multiwfn2vesta.geometry import format_orca_input, read_gaussian_geometry
+from multiwfn2vesta.multiwfn_controller import QuantumFileProcessor
+
+REFERENCE_INP = os.path.join(os.path.dirname(__file__), '..', 'examples', 'input_files',
+                             'DIB_preopt.inp')
+
+DIB_ATOMS = [
+    (6, 0.840579, 1.060353, -0.281076),
+    (6, 1.380517, -0.175459, 0.048956),
+    (6, 0.534971, -1.242077, 0.331681),
+    (6, -0.840579, -1.060354, 0.281074),
+    (6, -1.380517, 0.175457, -0.048959),
+    (6, -0.534971, 1.242075, -0.331682),
+    (53, -2.121402, -2.676276, 0.710105),
+    (53, 2.121400, 2.676284, -0.710095),
+    (1, 2.451443, -0.316281, 0.088186),
+    (1, 0.954613, -2.204432, 0.588656),
+    (1, -2.451442, 0.316280, -0.088191),
+    (1, -0.954613, 2.204431, -0.588654),
+]
+
+
+def orientation_block(title, atoms):
+    """构造 Gaussian 输出文件中的结构表"""
+    dashes = ' ' + '-' * 69 + '\n'
+    lines = [f"                         {title} orientation:                         \n",
+             dashes,
+             " Center     Atomic      Atomic             Coordinates (Angstroms)\n",
+             " Number     Number       Type             X           Y           Z\n",
+             dashes]
+    for i, (z, x, y, zc) in enumerate(atoms, 1):
+        lines.append(f"{i:7d}{z:11d}{0:12d}{x:16.6f}{y:12.6f}{zc:12.6f}\n")
+    lines.append(dashes)
+    return ''.join(lines)
+
+
+def gaussian_log(blocks, charge=0, multiplicity=1):
+    shifted = [(z, x + 0.5, y, zc) for z, x, y, zc in DIB_ATOMS]
+    text = [" Entering Gaussian System\n",
+            f" Charge = {charge:2d} Multiplicity = {multiplicity}\n"]
+    text.extend(blocks(shifted))
+    text.append(" Normal termination of Gaussian 16\n")
+    return ''.join(text)
+
+
+class TestGaussianGeometry(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write_log(self, text, name='DIB.log'):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'w') as f:
+            f.write(text)
+        return filename
+
+    def test_last_standard_orientation(self):
+        filename = self._write_log(gaussian_log(lambda first: [
+            orientation_block('Input', first),
+            orientation_block('Standard', first),
+            " SCF Done\n" * 50,
+            orientation_block('Input', first),
+            orientation_block('Standard', DIB_ATOMS),
+        ]))
+        for block_size in (64, 1 << 20):
+            geometry = read_gaussian_geometry(filename, block_size=block_size)
+            self.assertEqual(geometry.symbols, ['C'] * 6 + ['I'] * 2 + ['H'] * 4)
+            self.assertEqual(geometry.coords[6], (-2.121402, -2.676276, 0.710105))
+
+    def test_input_orientation_fallback(self):
+        filename = self._write_log(gaussian_log(lambda first: [
+            orientation_block('Input', first),
+            orientation_block('Input', DIB_ATOMS),
+        ], charge=-1, multiplicity=2))
+        geometry = read_gaussian_geometry(filename, block_size=100)
+        self.assertEqual(geometry.coords[0], (0.840579, 1.060353, -0.281076))
+        self.assertEqual((geometry.charge, geometry.multiplicity), (-1, 2))
+        self.assertIn("* xyz  -1   2\n", format_orca_input(geometry))
+
+    def test_truncated_or_missing(self):
+        truncated = gaussian_log(lambda first: [orientation_block('Standard', DIB_ATOMS)])
+        filename = self._write_log(truncated[:truncated.rindex(' 53 ')], 'cut.log')
+        self.assertIsNone(read_gaussian_geometry(filename))
+
+        filename = self._write_log(" Charge =  0 Multiplicity = 1\n", 'empty.log')
+        self.assertIsNone(read_gaussian_geometry(filename))
+
+    def test_process_file_matches_multiwfn_output(self):
+        filename = self._write_log(gaussian_log(lambda first: [
+            orientation_block('Standard', first),
+            orientation_block('Standard', DIB_ATOMS),
+        ]))
+        processor = QuantumFileProcessor()
+        processor._process_multiwfn = lambda *args: self.fail("不应调用 Multiwfn")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(processor.process_file(filename))
+
+        with open(os.path.join(self.tmpdir, 'DIB_preopt.inp')) as f:
+            output = f.read()
+        with open(REFERENCE_INP) as f:
+            self.assertEqual(output, f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+from multiwfn2vesta.instrumentation import Instrumentation, JSONLinesSink
+from multiwfn2vesta.MultiwfnRunner import MultiwfnRunner
+
+from .test_async_runner import FAKE_MULTIWFN
+from .test_cub import make_cube
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_stage_record(self):
+        records = []
+        instrumentation = Instrumentation([records.append], trace_memory=True, batch='a')
+        with instrumentation.stage('work', grid_points=8) as record:
+            record['bytes_read'] = 100
+            np.zeros(1 << 20)
+
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual(record['stage'], 'work')
+        self.assertEqual(record['batch'], 'a')
+        self.assertEqual(record['grid_points'], 8)
+        self.assertEqual(record['bytes_read'], 100)
+        self.assertGreaterEqual(record['elapsed'], 0)
+        self.assertGreater(record['peak_alloc_mb'], 8)
+        self.assertGreaterEqual(record['rss_delta_mb'], 0)
+
+    def test_nested_stages_keep_tracing(self):
+        records = []
+        instrumentation = Instrumentation([records.append], trace_memory=True)
+        with instrumentation.stage('outer'):
+            with instrumentation.stage('inner'):
+                np.zeros(1 << 20)
+            # 内层阶段结束后跟踪仍在进行
+            self.assertTrue(tracemalloc.is_tracing())
+
+        inner, outer = records
+        self.assertGreater(inner['peak_alloc_mb'], 8)
+        self.assertGreater(outer['peak_alloc_mb'], 8)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_untraced_by_default(self):
+        records = []
+        with Instrumentation([records.append]).stage('work'):
+            self.assertFalse(tracemalloc.is_tracing())
+        self.assertNotIn('peak_alloc_mb', records[0])
+        self.assertIn('rss_delta_mb', records[0])
+
+        # 没有 hook 时即使要求跟踪也不启动 tracemalloc
+        with Instrumentation(trace_memory=True).stage('work'):
+            self.assertFalse(tracemalloc.is_tracing())
+
+    def test_stage_error(self):
+        records = []
+        instrumentation = Instrumentation([records.append])
+        with self.assertRaises(ValueError):
+            with instrumentation.stage('work'):
+                raise ValueError('bad')
+        self.assertEqual(records[0]['error'], 'ValueError: bad')
+
+
+class TestProcessInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        writer = CubeFileInterpolator(quiet=True)
+        self.density_file = os.path.join(self.tmpdir, 'density.cub')
+        self.potential_file = os.path.join(self.tmpdir, 'esp.cub')
+        self.metrics_file = os.path.join(self.tmpdir, 'metrics.jsonl')
+        density = make_cube((10, 9, 8), seed=1)
+        density['data'] = np.abs(density['data']) * 0.1
+        writer.write_cube_file(density['data'], self.density_file, density)
+        potential = make_cube((7, 6, 5), spacing=0.35, seed=2)
+        writer.write_cube_file(potential['data'], self.potential_file, potential)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_quiet_process_writes_metrics(self):
+        output_file = os.path.join(self.tmpdir, 'out.cub')
+        instrumentation = Instrumentation([JSONLinesSink(self.metrics_file)])
+        processor = CubeFileInterpolator(quiet=True, instrumentation=instrumentation)
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            processor.process(self.density_file, self.potential_file, output_file)
+        self.assertEqual(stdout.getvalue(), '')
+
+        with open(self.metrics_file, encoding='utf-8') as f:
+            records = {r['stage']: r for r in map(json.loads, f)}
+        self.assertEqual(set(records), {'read_density', 'read_potential', 'mask',
+                                        'interpolate', 'write'})
+        self.assertEqual(records['read_density']['bytes_read'],
+                         os.path.getsize(self.density_file))
+        self.assertEqual(records['read_density']['grid_points'], 10 * 9 * 8)
+        self.assertEqual(records['interpolate']['grid_points'],
+                         records['mask']['mask_points'])
+        self.assertEqual(records['write']['bytes_written'], os.path.getsize(output_file))
+
+
+class TestRunnerInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        fake = os.path.join(self.tmpdir, 'Multiwfn')
+        with open(fake, 'w') as f:
+            f.write(FAKE_MULTIWFN.format(python=sys.executable))
+        os.chmod(fake, 0o755)
+        with open(os.path.join(self.tmpdir, 'mol.fchk'), 'w') as f:
+            f.write("5 0 3")
+        self.fake = fake
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_run_commands_record(self):
+        records = []
+        runner = MultiwfnRunner(self.fake, instrumentation=Instrumentation([records.append]))
+        returncode = runner.run_commands('mol.fchk', ['5', '1'], cwd=self.tmpdir)
+
+        self.assertEqual(returncode, 3)
+        record = records[0]
+        self.assertEqual(record['stage'], 'multiwfn')
+        self.assertEqual(record['returncode'], 3)
+        self.assertEqual(record['stdout_bytes'], 5)
+        self.assertEqual(record['commands'], 2)
+        self.assertGreater(record['child_peak_rss_mb'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from multiwfn2vesta.MultiwfnRunner import IRIPostProcess, iri_job
+from multiwfn2vesta.cub import CubeFileInterpolator
+
+from .test_cub import make_cube
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class TestIRIPostProcess(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        shutil.copy(os.path.join(DATA_DIR, 'iri_func1.cub'),
+                    os.path.join(self.tmpdir, 'func1.cub'))
+        self.processor = CubeFileInterpolator(quiet=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, **kwargs):
+        self.assertTrue(IRIPostProcess('mol_IRI1.cub', **kwargs)(self.tmpdir))
+        return self.processor.read_cube_file(os.path.join(self.tmpdir, 'mol_IRI1.cub'))
+
+    def test_clip_semantics(self):
+        # 与 Multiwfn 菜单 13 的两次区间赋值相同：(-∞, -limit] -> -limit，[limit, ∞) -> limit
+        cube = make_cube((2, 2, 3))
+        cube['data'] = np.array([-1.0, -0.04, -0.039, 0.0, 0.01, 0.039,
+                                 0.04, 0.041, 2.5, -0.5, 1e-5, -1e-5]).reshape(2, 2, 3)
+        self.processor.write_cube_file(cube['data'], os.path.join(self.tmpdir, 'func1.cub'), cube)
+
+        result = self._run()
+        expected = [-0.04, -0.04, -0.039, 0.0, 0.01, 0.039,
+                    0.04, 0.04, 0.04, -0.04, 1e-5, -1e-5]
+        np.testing.assert_array_equal(result['data'].ravel(), expected)
+        self.assertEqual(result['origin'].tolist(), cube['origin'].tolist())
+        self.assertEqual(len(result['atoms']), len(cube['atoms']))
+
+    def test_only_out_of_range_values_change(self):
+        source = self.processor.read_cube_file(os.path.join(self.tmpdir, 'func1.cub'))['data']
+        data = self._run(limit=0.02)['data']
+        self.assertGreaterEqual(data.min(), -0.02)
+        self.assertLessEqual(data.max(), 0.02)
+        inside = np.abs(source) < 0.02
+        np.testing.assert_array_equal(data[inside], source[inside])
+        np.testing.assert_array_equal(data[~inside], np.sign(source[~inside]) * 0.02)
+
+    def test_missing_input(self):
+        os.remove(os.path.join(self.tmpdir, 'func1.cub'))
+        self.assertFalse(IRIPostProcess('mol_IRI1.cub')(self.tmpdir))
+
+    def test_job_has_single_multiwfn_step(self):
+        job = iri_job('mol.fchk')
+        self.assertEqual(len(job.steps), 1)
+        self.assertEqual(job.outputs['mol_IRI1.cub'], 'mol_IRI1.cub')
+        self.assertTrue(np.isclose(job.postprocess.limit, 0.04))
+        self.assertEqual(job.postprocess.key, 'numpy-clip:0.04')
+        self.assertEqual(len(iri_job('mol.fchk', postprocess='multiwfn').steps), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from multiwfn2vesta.manifest import BuildManifest
+from multiwfn2vesta.scheduler import MultiwfnJob
+
+
+class TestBuildManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.manifest_file = os.path.join(self.tmpdir, 'manifest.json')
+        self.input_file = os.path.join(self.tmpdir, 'mol.fchk')
+        self.output_file = os.path.join(self.tmpdir, 'mol_IRI1.cub')
+        with open(self.input_file, 'w') as f:
+            f.write('wavefunction')
+        with open(self.output_file, 'w') as f:
+            f.write('cube')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _job(self, commands=("20", "4")):
+        return MultiwfnJob(self.input_file, steps=[(None, list(commands))],
+                           outputs={'func1.cub': self.output_file})
+
+    def test_record_and_reload(self):
+        manifest = BuildManifest(self.manifest_file)
+        job = self._job()
+        key = manifest.job_key(job, '3.8')
+        self.assertFalse(manifest.is_up_to_date(job, key))
+        manifest.record(job, key)
+
+        reloaded = BuildManifest(self.manifest_file)
+        self.assertTrue(reloaded.is_up_to_date(job, reloaded.job_key(job, '3.8')))
+        self.assertFalse(reloaded.is_up_to_date(job, reloaded.job_key(job, '3.9')))
+        changed = self._job(commands=("20", "5"))
+        self.assertFalse(reloaded.is_up_to_date(changed, reloaded.job_key(changed, '3.8')))
+
+    def test_changed_input_or_output(self):
+        manifest = BuildManifest(self.manifest_file)
+        job = self._job()
+        key = manifest.job_key(job, '3.8')
+        manifest.record(job, key)
+
+        with open(self.input_file, 'w') as f:
+            f.write('new wavefunction')
+        self.assertNotEqual(manifest.job_key(job, '3.8'), key)
+
+        with open(self.output_file, 'w') as f:
+            f.write('edited cube')
+        self.assertFalse(manifest.is_up_to_date(job, key))
+
+        os.remove(self.output_file)
+        self.assertFalse(manifest.is_up_to_date(job, key))
+
+    def test_forget(self):
+        manifest = BuildManifest(self.manifest_file)
+        job = self._job()
+        key = manifest.job_key(job, '3.8')
+        manifest.record(job, key)
+        manifest.forget(job)
+        self.assertFalse(BuildManifest(self.manifest_file).is_up_to_date(job, key))
+
+
+if __name__ == '__main__':
+    unittest.main()
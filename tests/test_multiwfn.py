@@ -1,15 +1,17 @@
 import unittest
 from pathlib import Path
-from src.multiwfn_vesta.multiwfn_controller import MultiwfnController
+from multiwfn2vesta.multiwfn_controller import MultiwfnController
 
 class TestMultiwfn(unittest.TestCase):
     def setUp(self):
         self.controller = MultiwfnController()
     
     def test_command_generation(self):
-        commands = self.controller._build_commands('electron', 'test.cube')
+        commands = self.controller._build_commands('electron')
         self.assertIn('5', commands)
-        self.assertIn('test.cube', commands)
+        # Multiwfn 导出的文件名固定，输出路径不在命令中，由任务在运行后移动过去
+        job = self.controller.grid_job('test.fchk', {'electron': 'test.cube'})
+        self.assertIn('test.cube', job.outputs.values())
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from multiwfn2vesta.scheduler import MultiwfnJob, MultiwfnScheduler
+
+
+class FakeRunner:
+    """在工作目录中写出固定文件名的假 Multiwfn 运行器"""
+
+    def __init__(self, fail_on=()):
+        self.fail_on = fail_on
+        self.nprocs = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def run_commands(self, input_file, commands, nproc=1, cwd=None):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.nprocs.append(nproc)
+        try:
+            time.sleep(0.05)
+            with open(os.path.join(cwd, input_file)) as f:
+                content = f.read()
+            if content in self.fail_on:
+                return 1
+            with open(os.path.join(cwd, "func1.cub"), "w") as f:
+                f.write(content + commands[0])
+            with open(os.path.join(cwd, "Multiwfn_out.log"), "a") as f:
+                f.write(f"{input_file}\n")
+            return 0
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class TestMultiwfnScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.inputs = []
+        for i in range(6):
+            path = os.path.join(self.tmpdir, f"mol{i}.fchk")
+            with open(path, "w") as f:
+                f.write(f"mol{i}")
+            self.inputs.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _jobs(self):
+        return [MultiwfnJob(path, steps=[(None, ["20"])],
+                            outputs={"func1.cub": path.replace(".fchk", "_IRI1.cub")})
+                for path in self.inputs]
+
+    def test_parallel_isolated_jobs(self):
+        runner = FakeRunner()
+        log_file = os.path.join(self.tmpdir, "Multiwfn_out.log")
+        scheduler = MultiwfnScheduler(runner, total_cores=8, max_jobs=3, log_file=log_file)
+        results = scheduler.run(self._jobs())
+
+        self.assertTrue(all(results.values()))
+        self.assertEqual(runner.max_active, 3)
+        self.assertEqual(set(runner.nprocs), {2})
+        for i, path in enumerate(self.inputs):
+            with open(path.replace(".fchk", "_IRI1.cub")) as f:
+                self.assertEqual(f.read(), f"mol{i}20")
+        with open(log_file) as f:
+            self.assertEqual(len(f.readlines()), 6)
+
+    def test_failed_job(self):
+        runner = FakeRunner(fail_on=("mol2",))
+        scheduler = MultiwfnScheduler(runner, total_cores=2, max_jobs=2, log_file=None)
+        results = scheduler.run(self._jobs())
+        self.assertFalse(results[self.inputs[2]])
+        self.assertEqual(sum(results.values()), 5)
+        self.assertFalse(os.path.exists(self.inputs[2].replace(".fchk", "_IRI1.cub")))
+
+
+if __name__ == '__main__':
+    unittest.main()
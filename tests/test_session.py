@@ -0,0 +1,92 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from multiwfn2vesta.instrumentation import Instrumentation
+from multiwfn2vesta.MultiwfnRunner import MultiwfnRunner, MultiwfnSession
+
+# 假 Multiwfn：载入时记录一次，之后在主菜单循环；"0" 回到主菜单，
+# "sleep" 卡住，"crash" 直接退出
+FAKE_MULTIWFN = '''#!{python}
+import os, sys, time
+with open(sys.argv[1] + ".loads", "a") as f:
+    f.write("load\\n")
+print("Loaded " + sys.argv[1] + " pid " + str(os.getpid()))
+menu = " " + "*" * 12 + " Main function menu " + "*" * 12 + "\\n 0 Show molecular structure"
+print(menu, flush=True)
+for line in sys.stdin:
+    command = line.strip()
+    if command == "q":
+        break
+    if command == "crash":
+        sys.exit(4)
+    if command == "sleep":
+        time.sleep(5)
+    if command == "0":
+        print(menu, flush=True)
+    else:
+        print("ran " + command + " " + "x" * 70000, flush=True)
+'''
+
+
+class TestMultiwfnSession(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fake = os.path.join(self.tmpdir, 'Multiwfn')
+        with open(self.fake, 'w') as f:
+            f.write(FAKE_MULTIWFN.format(python=sys.executable))
+        os.chmod(self.fake, 0o755)
+        with open(os.path.join(self.tmpdir, 'mol.fchk'), 'w') as f:
+            f.write("fchk")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _loads(self):
+        with open(os.path.join(self.tmpdir, 'mol.fchk.loads')) as f:
+            return len(f.readlines())
+
+    def test_tasks_share_one_load(self):
+        records = []
+        runner = MultiwfnRunner(self.fake, instrumentation=Instrumentation([records.append]))
+        with runner.session('mol.fchk', cwd=self.tmpdir) as session:
+            self.assertIn('Loaded mol.fchk', session.load_output)
+            first = session.run(['5', '1', '0'])
+            second = session.run(['20', '4', '0'])
+            # 中途经过一次主菜单
+            third = session.run(['0', '17', '0'], count=2)
+        self.assertFalse(session.alive)
+        self.assertEqual(self._loads(), 1)
+
+        self.assertIn('ran 5', first)
+        self.assertIn('ran 1', first)
+        self.assertNotIn('ran 20', first)
+        self.assertIn('ran 4', second)
+        self.assertIn('ran 17', third)
+        self.assertTrue(third.rstrip().endswith('Main function menu'))
+
+        stages = [r['stage'] for r in records]
+        self.assertEqual(stages, ['multiwfn_load'] + ['multiwfn_task'] * 3)
+        self.assertGreater(records[1]['stdout_bytes'], 140000)
+
+    def test_exit_before_menu(self):
+        with MultiwfnSession('mol.fchk', self.fake, cwd=self.tmpdir) as session:
+            with self.assertRaises(RuntimeError):
+                session.run(['crash'])
+            self.assertFalse(session.alive)
+            with self.assertRaises(RuntimeError):
+                session.run(['0'])
+        self.assertEqual(session.close(), 4)
+
+    def test_timeout(self):
+        session = MultiwfnSession('mol.fchk', self.fake, cwd=self.tmpdir)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            session.run(['sleep', '0'], timeout=0.5)
+        self.assertNotEqual(session.close(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+from multiwfn2vesta.surface import process_surface, surface_statistics
+
+from .test_cub import make_cube
+
+
+class TestSurfaceESP(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        n = 41
+        x = (np.arange(n) - n // 2) * 0.2
+        xx, yy, zz = np.meshgrid(x, x, x, indexing='ij')
+        # 密度在 r = ln(10) 处等于 0.001
+        density = 0.01 * np.exp(-np.sqrt(xx ** 2 + yy ** 2 + zz ** 2))
+        self.radius = np.log(10)
+        processor = CubeFileInterpolator(quiet=True)
+        self.density_file = os.path.join(self.tmpdir, 'density.cub')
+        self.esp_file = os.path.join(self.tmpdir, 'esp.cub')
+        cube = make_cube((n, n, n), origin=(x[0],) * 3, spacing=0.2, data=density)
+        processor.write_cube_file(density, self.density_file, cube)
+        # 势能较粗的网格，沿 x 线性变化再加上常数
+        m = 21
+        y = (np.arange(m) - m // 2) * 0.4
+        esp = make_cube((m, m, m), origin=(y[0],) * 3, spacing=0.4,
+                        data=np.broadcast_to(0.01 * y[:, None, None] + 0.002, (m, m, m)))
+        processor.write_cube_file(esp['data'], self.esp_file, esp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_npz_statistics(self):
+        output = os.path.join(self.tmpdir, 'surface.npz')
+        stats = process_surface(self.density_file, self.esp_file, output, quiet=True)
+
+        sphere = 4 * np.pi * self.radius ** 2
+        self.assertAlmostEqual(stats['area'] / sphere, 1.0, delta=0.02)
+        self.assertAlmostEqual(stats['positive_area'] + stats['negative_area'], stats['area'],
+                               delta=1e-6 * stats['area'])
+        self.assertGreater(stats['positive_area'], stats['negative_area'])
+        self.assertAlmostEqual(stats['mean'], 0.002, delta=2e-4)
+        self.assertAlmostEqual(stats['max'], 0.01 * self.radius + 0.002, delta=5e-4)
+
+        with np.load(output) as f:
+            self.assertEqual(f['vertices'].shape, (stats['vertices'], 3))
+            self.assertEqual(f['faces'].shape, (stats['faces'], 3))
+            self.assertEqual(float(f['stat_area']), stats['area'])
+            radii = np.linalg.norm(f['vertices'], axis=1)
+            np.testing.assert_allclose(radii, self.radius, atol=0.05)
+            np.testing.assert_allclose(f['values'], 0.01 * f['vertices'][:, 0] + 0.002,
+                                       atol=1e-5)
+
+    def test_ply(self):
+        output = os.path.join(self.tmpdir, 'surface.ply')
+        stats = process_surface(self.density_file, self.esp_file, output, quiet=True)
+        with open(output, 'rb') as f:
+            content = f.read()
+        header, body = content.split(b'end_header\n')
+        self.assertIn(f"element vertex {stats['vertices']}".encode(), header)
+        self.assertIn(f"element face {stats['faces']}".encode(), header)
+        self.assertEqual(len(body), stats['vertices'] * 16 + stats['faces'] * 13)
+        # 输出远小于同一网格的cub文件
+        self.assertLess(len(content), os.path.getsize(self.density_file) / 4)
+
+    def test_statistics_of_constant_field(self):
+        vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=float)
+        faces = np.array([[0, 1, 2], [0, 1, 3]])
+        stats = surface_statistics(vertices, faces, np.full(4, -0.5))
+        self.assertAlmostEqual(stats['area'], 1.0)
+        self.assertAlmostEqual(stats['negative_area'], 1.0)
+        self.assertEqual(stats['positive_area'], 0.0)
+        self.assertAlmostEqual(stats['mean'], -0.5)
+        self.assertEqual(stats['variance'], 0.0)
+        self.assertEqual(stats['balance'], 0.0)
+
+    def test_no_surface(self):
+        stats = surface_statistics(np.empty((0, 3)), np.empty((0, 3), dtype=int), np.empty(0))
+        self.assertEqual(stats, {'vertices': 0, 'faces': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+
+from multiwfn2vesta.cub import CubeFileInterpolator
+from multiwfn2vesta.thumbnail import (extract_isosurface, render_thumbnails, rotation_matrix,
+                                      write_png)
+
+from .test_cub import make_cube
+
+
+def read_png(filename):
+    """解码本模块写出的 RGB PNG"""
+    with open(filename, 'rb') as f:
+        content = f.read()
+    assert content[:8] == b'\x89PNG\r\n\x1a\n'
+    width, height = struct.unpack('>II', content[16:24])
+    length = struct.unpack('>I', content[33:37])[0]
+    raw = zlib.decompress(content[41:41 + length])
+    rows = np.frombuffer(raw, dtype=np.uint8).reshape(height, width * 3 + 1)
+    return rows[:, 1:].reshape(height, width, 3)
+
+
+class TestThumbnail(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        n = 24
+        x = (np.arange(n) - (n - 1) / 2) * 0.25
+        xx, yy, zz = np.meshgrid(x, x, x, indexing='ij')
+        # 沿 x 拉长的椭球密度，势能沿 x 线性变化
+        density = 0.01 * np.exp(-np.sqrt((xx / 1.5) ** 2 + yy ** 2 + zz ** 2))
+        origin = (x[0],) * 3
+        processor = CubeFileInterpolator()
+        self.density_file = os.path.join(self.tmpdir, 'density.cub')
+        self.esp_file = os.path.join(self.tmpdir, 'esp.cub')
+        cube = make_cube((n, n, n), origin=origin, spacing=0.25, data=density)
+        processor.write_cube_file(density, self.density_file, cube)
+        processor.write_cube_file(xx * 0.01, self.esp_file, cube)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_png_round_trip(self):
+        image = np.random.default_rng(0).integers(0, 255, (5, 7, 3), dtype=np.uint8)
+        filename = os.path.join(self.tmpdir, 'a.png')
+        write_png(filename, image)
+        np.testing.assert_array_equal(read_png(filename), image)
+
+    def test_rotation_matrix(self):
+        np.testing.assert_allclose(rotation_matrix([('z', 90)]) @ [1, 0, 0], [0, 1, 0], atol=1e-12)
+        np.testing.assert_allclose(rotation_matrix([('x', 90), ('x', -90)]), np.eye(3), atol=1e-12)
+        with self.assertRaises(ValueError):
+            rotation_matrix([('w', 10)])
+
+    def test_views(self):
+        outputs = [os.path.join(self.tmpdir, f'view{i}.png') for i in range(3)]
+        views = [(outputs[0], []), (outputs[1], [('y', 90)]), (outputs[2], [('z', 90)])]
+        written = render_thumbnails(self.density_file, views, property_file=self.esp_file,
+                                    size=64)
+        self.assertEqual(written, outputs)
+
+        front, side, top = (read_png(path).astype(int) for path in outputs)
+        self.assertEqual(front.shape, (64, 64, 3))
+        background = np.all(front == 255, axis=2)
+        self.assertTrue(0 < np.count_nonzero(~background) < 64 * 64)
+
+        # 正面视图中势能沿 x（图像水平方向）从负到正：左侧偏蓝，右侧偏红
+        left, right = front[:, :20], front[:, -20:]
+        self.assertGreater(left[..., 2].sum() - left[..., 0].sum(), 0)
+        self.assertGreater(right[..., 0].sum() - right[..., 2].sum(), 0)
+
+        # 绕 y 转 90 度后沿拉长的 x 轴看去，投影变成圆形，再绕视线转 90 度图像不变
+        self.assertFalse(np.array_equal(front, side))
+        self.assertLess(np.count_nonzero(~np.all(side == 255, axis=2)),
+                        np.count_nonzero(~background))
+        np.testing.assert_array_equal(np.all(side == 255, axis=2), np.all(top == 255, axis=2))
+
+
+    def test_isovalue_out_of_range(self):
+        cube = CubeFileInterpolator(quiet=True).read_cube_file(self.esp_file)
+        points, normals = extract_isosurface(cube, 1.0)
+        self.assertEqual((points.shape, normals.shape), ((0, 3), (0, 3)))
+
+        output = os.path.join(self.tmpdir, 'none.png')
+        with self.assertLogs(level='WARNING'):
+            written = render_thumbnails(self.esp_file, [(output, [])], isovalue=-1.0)
+        self.assertEqual(written, [])
+        self.assertFalse(os.path.exists(output))
+
+
+if __name__ == '__main__':
+    unittest.main()
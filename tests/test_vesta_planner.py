@@ -0,0 +1,103 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from multiwfn2vesta.vesta_controller import RenderJob, VestaRenderPlanner
+
+# 假 VESTA：把 argv 追加到记录文件，并为每个 -export_img 写出图片；
+# 路径中含 "bad" 的图片不写出并以非零返回码退出
+FAKE_VESTA = '''#!{python}
+import json, sys
+args = sys.argv[1:]
+with open({record!r}, "a") as f:
+    f.write(json.dumps(args) + "\\n")
+code = 0
+for i, arg in enumerate(args):
+    if arg == "-export_img":
+        path = args[i + 2]
+        if "bad" in path:
+            code = 1
+            continue
+        with open(path, "w") as img:
+            img.write("png")
+sys.exit(code)
+'''
+
+
+class TestVestaRenderPlanner(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.record = os.path.join(self.tmpdir, 'argv.jsonl')
+        self.vesta = os.path.join(self.tmpdir, 'vesta')
+        with open(self.vesta, 'w') as f:
+            f.write(FAKE_VESTA.format(python=sys.executable, record=self.record))
+        os.chmod(self.vesta, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _job(self, name):
+        out = os.path.join(self.tmpdir, name)
+        return RenderJob(f'{name}.vesta', [
+            (out + '_1.png', []),
+            (out + '_2.png', [('x', 90)]),
+            (out + '_3.png', [('y', 90)]),
+        ])
+
+    def _invocations(self):
+        with open(self.record) as f:
+            return f.read().splitlines()
+
+    def test_job_commands(self):
+        commands = self._job('a').commands()
+        self.assertEqual(commands[:2], ['-open', 'a.vesta'])
+        self.assertEqual(commands[-1], '-close')
+        self.assertEqual(commands.count('-export_img'), 3)
+        self.assertIn('-rotate_x', commands)
+
+    def test_packs_jobs_into_few_invocations(self):
+        jobs = [self._job(f'mol{i}') for i in range(6)]
+        results = VestaRenderPlanner(self.vesta).run(jobs)
+
+        self.assertEqual(len(results), 18)
+        self.assertTrue(all(results.values()))
+        self.assertEqual(len(self._invocations()), 1)
+
+    def test_splits_across_parallel_processes(self):
+        jobs = [self._job(f'mol{i}') for i in range(5)]
+        planner = VestaRenderPlanner(self.vesta, max_parallel=2)
+        self.assertEqual([len(batch) for batch in planner.plan(jobs)], [2, 3])
+        # 任务少于进程数时每个任务一个进程
+        self.assertEqual(len(VestaRenderPlanner(self.vesta, max_parallel=8).plan(jobs)), 5)
+        self.assertTrue(all(planner.run(jobs).values()))
+        self.assertEqual(len(self._invocations()), 2)
+
+    def test_command_length_cap(self):
+        jobs = [self._job(f'mol{i}') for i in range(6)]
+        job_length = sum(len(arg) + 1 for arg in jobs[0].commands())
+        planner = VestaRenderPlanner(self.vesta, max_command_length=len(self.vesta) + 2 * job_length,
+                                     max_parallel=3)
+        self.assertEqual([len(batch) for batch in planner.plan(jobs)], [2, 2, 2])
+        self.assertTrue(all(planner.run(jobs).values()))
+        self.assertEqual(len(self._invocations()), 3)
+
+    def test_failures_map_to_images(self):
+        jobs = [self._job('good'), self._job('bad'), self._job('fine')]
+        results = VestaRenderPlanner(self.vesta).run(jobs)
+        failed = sorted(os.path.basename(path) for path, ok in results.items() if not ok)
+        self.assertEqual(failed, ['bad_1.png', 'bad_2.png', 'bad_3.png'])
+        # 一次打包运行，加上对失败任务的一次单独重试
+        self.assertEqual(len(self._invocations()), 2)
+
+    def test_stale_image_is_not_success(self):
+        job = self._job('bad')
+        with open(job.outputs[0], 'w') as f:
+            f.write('old')
+        results = VestaRenderPlanner(self.vesta, retry_failed=False).run([job])
+        self.assertFalse(results[job.outputs[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
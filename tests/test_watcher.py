@@ -0,0 +1,156 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from multiwfn2vesta.instrumentation import Instrumentation
+from multiwfn2vesta.watcher import FolderWatcher
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestFolderWatcher(unittest.TestCase):
+    backend = 'poll'
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.handled = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _handler(self, path):
+        with self.lock:
+            self.handled.append(os.path.basename(path))
+        return not path.endswith('bad.fchk')
+
+    def _watcher(self, **kwargs):
+        kwargs.setdefault('settle', 0.2)
+        return FolderWatcher([self.tmpdir], kwargs.pop('handler', self._handler),
+                             poll_interval=0.05, backend=self.backend, **kwargs)
+
+    def _write(self, name, text, mode='w'):
+        with open(os.path.join(self.tmpdir, name), mode) as f:
+            f.write(text)
+
+    def test_debounce_and_filter(self):
+        self._write('old.fchk', 'old')
+        records = []
+        # 写入间隔远小于 settle，调度抖动不会让文件提前被处理
+        watcher = self._watcher(settle=1.0, instrumentation=Instrumentation([records.append]))
+        watcher.start()
+        try:
+            self._write('a.fchk', 'part 1\n')
+            self._write('notes.txt', 'ignored')
+            self._write('job.log', ' SCF Done\n')
+            # 仍在写入：不应被处理
+            for i in range(5):
+                time.sleep(0.1)
+                self._write('a.fchk', f'part {i}\n', 'a')
+            self.assertEqual(self.handled, [])
+
+            self.assertTrue(wait_until(lambda: self.handled == ['a.fchk']))
+            self._write('job.log', ' Normal termination of Gaussian 16\n', 'a')
+            self._write('bad.fchk', 'x')
+            self.assertTrue(wait_until(lambda: len(self.handled) == 3))
+        finally:
+            watcher.stop()
+
+        self.assertEqual(sorted(self.handled), ['a.fchk', 'bad.fchk', 'job.log'])
+        stats = watcher.stats()
+        self.assertEqual(stats['backend'], self.backend)
+        self.assertEqual((stats['completed'], stats['failed']), (2, 1))
+        self.assertEqual(stats['queued'], 0)
+        self.assertGreater(stats['throughput_per_hour'], 0)
+        self.assertEqual({r['stage'] for r in records}, {'watch_job'})
+
+    def test_unfinished_logs_dropped(self):
+        watcher = self._watcher(incomplete_timeout=0.5)
+        watcher.start()
+        try:
+            self._write('err.log', ' Error termination via Lnk1e\n')
+            self._write('hang.log', ' SCF Done\n')
+            # pipeline_handler 自己写出的日志
+            self._write('Multiwfn_out.log', ' Normal termination\n')
+            self.assertTrue(wait_until(lambda: watcher.stats()['dropped'] == 2))
+            self.assertEqual(self.handled, [])
+            self.assertEqual(watcher.stats()['settling'], 0)
+
+            # 内容改变后重新等待
+            self._write('hang.log', ' Normal termination of Gaussian 16\n', 'a')
+            self.assertTrue(wait_until(lambda: self.handled == ['hang.log']))
+        finally:
+            watcher.stop()
+
+    def test_stop_without_start(self):
+        watcher = self._watcher()
+        watcher.stop()
+        watcher.start()
+        try:
+            self._write('a.fchk', 'x')
+            self.assertTrue(wait_until(lambda: self.handled == ['a.fchk']))
+        finally:
+            watcher.stop()
+        # 重复停止不再等待已结束的线程
+        watcher.stop()
+
+    def test_bounded_queue_worker_pool(self):
+        release = threading.Event()
+
+        def slow(path):
+            release.wait(5)
+            return self._handler(path)
+
+        watcher = self._watcher(handler=slow, workers=2, queue_size=1, settle=0.05)
+        watcher.start()
+        try:
+            for i in range(5):
+                self._write(f'm{i}.molden', 'x')
+            # 两个在处理，一个在队列中，其余留在去抖表
+            self.assertTrue(wait_until(lambda: watcher.stats()['running'] == 2
+                                       and watcher.stats()['queued'] == 1))
+            self.assertEqual(watcher.stats()['settling'], 2)
+            release.set()
+            self.assertTrue(wait_until(lambda: watcher.stats()['completed'] == 5))
+        finally:
+            release.set()
+            watcher.stop()
+        self.assertEqual(sorted(self.handled), [f'm{i}.molden' for i in range(5)])
+
+    def test_existing_and_rewrite(self):
+        self._write('old.fch', 'old')
+        watcher = self._watcher(existing=True)
+        watcher.start()
+        try:
+            self.assertTrue(wait_until(lambda: self.handled == ['old.fch']))
+            time.sleep(0.3)
+            self.assertEqual(self.handled, ['old.fch'])
+            self._write('old.fch', 'new content')
+            self.assertTrue(wait_until(lambda: self.handled == ['old.fch', 'old.fch']))
+        finally:
+            watcher.stop()
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'inotify 只在 Linux 上可用')
+class TestFolderWatcherInotify(TestFolderWatcher):
+    backend = 'inotify'
+
+    def _watcher(self, **kwargs):
+        kwargs.setdefault('settle', 0.2)
+        return FolderWatcher([self.tmpdir], kwargs.pop('handler', self._handler),
+                             poll_interval=0.05, **kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()